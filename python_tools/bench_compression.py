@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is a benchmark of the compressed Conlang JSON formats.  The
+# lexicon of a Conlang JSON file is written with write_conlang_json to an
+# uncompressed file and to each compressed format that open_conlang_file
+# supports, and each file is read back with iter_conlang_json.  The size of
+# each file and the time taken to write and read it are reported.
+#
+import sys
+import os
+import time
+import tempfile
+from argparse import ArgumentParser
+from conlang_lib import open_conlang_file, read_conlang_json_header, iter_conlang_lexicon, iter_conlang_json, write_conlang_json
+
+BENCHMARK_EXTENSIONS = ['.json','.json.gz','.json.xz','.json.bz2']
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Benchmark compressed Conlang JSON files")
+    cli.add_argument("-i","--input", type=str, metavar="FILE_PATH", required=True, dest="input",
+        help="Conlang JSON file used for the benchmark, preferably a large declined one")
+    cli.add_argument("-r","--repeat", type=int, required=False, default=3, dest="repeat",
+        help="Number of times each file is written and read, the best times are reported.  Default is 3")
+    cli.add_argument("--temp-dir", type=str, required=False, metavar="DIRECTORY", dest="temp_dir",
+        help="Directory for the files written by the benchmark")
+    arguments = cli.parse_args(argv)
+
+    language_structure = read_conlang_json_header(arguments.input)
+    lexicon = list(iter_conlang_lexicon(arguments.input))
+    print(str(len(lexicon)) + " lexicon entries")
+    print('format'.ljust(10) + 'size'.rjust(14) + 'ratio'.rjust(8) + 'write s'.rjust(10) + 'read s'.rjust(10))
+
+    plain_size = None
+    with tempfile.TemporaryDirectory(dir=arguments.temp_dir) as temp_dir:
+        for extension in BENCHMARK_EXTENSIONS:
+            output_file = os.path.join(temp_dir,'benchmark' + extension)
+            write_time = min(time_write(language_structure,lexicon,output_file) for inx in range(arguments.repeat))
+            read_time = min(time_read(output_file,len(lexicon)) for inx in range(arguments.repeat))
+            size = os.path.getsize(output_file)
+            if plain_size is None:
+                plain_size = size
+            print(extension.ljust(10) + str(size).rjust(14) + ('%.3f' % (size / plain_size)).rjust(8) +
+                  ('%.2f' % write_time).rjust(10) + ('%.2f' % read_time).rjust(10))
+            os.remove(output_file)
+
+#end def main
+
+# Time writing the Conlang JSON object to a file.
+def time_write(language_structure,lexicon,output_file):
+    start_time = time.perf_counter()
+    with open_conlang_file(output_file,"wt") as ofp:
+        write_conlang_json(language_structure,lexicon,ofp)
+    return time.perf_counter() - start_time
+
+#end def time_write
+
+# Time reading all of a Conlang JSON file, checking the whole lexicon was read.
+def time_read(input_file,entry_count):
+    start_time = time.perf_counter()
+    count = 0
+    with open_conlang_file(input_file) as ifp:
+        for key, value in iter_conlang_json(ifp):
+            if key == 'lexicon':
+                count += 1
+    if count != entry_count:
+        print("ERROR: read " + str(count) + " entries from " + input_file + " instead of " + str(entry_count))
+        exit()
+    return time.perf_counter() - start_time
+
+#end def time_read
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
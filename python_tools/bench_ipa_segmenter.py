@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is a micro-benchmark of the grapheme segmenter.  It compares the
+# per character cost of the character by character diacritic handling that the
+# tools used before ipa_segmenter, for both splitting strings into symbols and
+# computing the lexical index, against the segmenter.  The words are taken
+# from the phonetic and spelled forms in a Conlang JSON file.
+#
+import sys
+import json
+import timeit
+from argparse import ArgumentParser
+from lexicon_entry import LEXICON_ENTRY
+from ipa_segmenter import segment_graphemes_batch, COMBINING_MARK_RANGES
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Benchmark the IPA grapheme segmenter")
+    cli.add_argument("-i","--input", type=str, metavar="FILE_PATH", required=True, dest="input",
+        help="Conlang JSON file whose words are used for the benchmark")
+    cli.add_argument("-r","--repeat", type=int, required=False, default=5, dest="repeat",
+        help="Number of times each test is timed, the best time is reported.  Default is 5")
+    arguments = cli.parse_args(argv)
+
+    with open(arguments.input,"r", encoding="utf-8-sig") as ifp:
+        language_structure = json.load(ifp)
+    if 'lexical_order_list' in language_structure:
+        LEXICON_ENTRY.set_lexical_order_list(language_structure['lexical_order_list'])
+
+    phonetic_words = [entry['phonetic'] for entry in language_structure['lexicon']]
+    spelled_words = [entry['spelled'] for entry in language_structure['lexicon']]
+    phonetic_chars = sum(len(word) for word in phonetic_words)
+    spelled_chars = sum(len(word) for word in spelled_words)
+
+    # The segmenter must agree with the old code wherever the old code was
+    # correct, which is on every word without a length mark or tie bar.
+    for word in phonetic_words:
+        if legacy_segment(word) != segment_graphemes_batch([word])[0] and not any(char in word for char in 'ːˑ͜͡'):
+            print("ERROR: segmenter disagrees on " + word)
+            exit()
+
+    check_combining_mark_order()
+
+    print(str(len(phonetic_words)) + " words, " + str(phonetic_chars) + " phonetic characters, " + str(spelled_chars) + " spelled characters")
+    report("segment (old)",lambda: [legacy_segment(word) for word in phonetic_words],phonetic_chars,arguments.repeat)
+    report("segment (new)",lambda: segment_graphemes_batch(phonetic_words),phonetic_chars,arguments.repeat)
+    report("lexical_index (old)",lambda: [legacy_lexical_index(word) for word in spelled_words],spelled_chars,arguments.repeat)
+    report("lexical_index (new)",lambda: [LEXICON_ENTRY.lexical_index(word) for word in spelled_words],spelled_chars,arguments.repeat)
+
+#end def main
+
+# Check that a letter followed by any combining mark sorts after the plain
+# letter and before the next letter of the lexical order.
+def check_combining_mark_order():
+    lexical_order_list = [char for char in LEXICON_ENTRY.lexical_order_list if char.strip() != '' and char != 'ˈ']
+    for base, next_letter in zip(lexical_order_list,lexical_order_list[1:]):
+        for start, end in COMBINING_MARK_RANGES:
+            for code in range(start,end + 1):
+                marked = base + chr(code)
+                if not LEXICON_ENTRY.lexical_index(base) < LEXICON_ENTRY.lexical_index(marked) < LEXICON_ENTRY.lexical_index(next_letter):
+                    print("ERROR: " + marked + " (U+" + format(code,'04X') + ") does not sort between " + base + " and " + next_letter)
+                    exit()
+
+#end def check_combining_mark_order
+
+# Time a test and print its cost per character.
+def report(name,test,char_count,repeat):
+    best = min(timeit.repeat(test,number=1,repeat=repeat))
+    print(name.ljust(22) + str(round(best,4)).rjust(10) + " s " + str(round(best * 1e9 / max(1,char_count),1)).rjust(10) + " ns/char")
+
+#end def report
+
+# The character by character segmentation used by get_IPA_patterns before the
+# segmenter, applied to a single word.
+def legacy_segment(word):
+    symbol_list = []
+    nextchar = ''
+    for char in reversed(word):
+        charint = int(char.encode('utf-16-be').hex(),base=16) & 0x0000ffff
+        if (charint >= 0x0300) and (charint <= 0x036f):
+            nextchar = char
+        elif nextchar != '':
+            symbol_list.append(char + nextchar)
+            nextchar = ''
+        else:
+            symbol_list.append(char)
+    symbol_list.reverse()
+    return symbol_list
+
+#end def legacy_segment
+
+# The lexical index as LEXICON_ENTRY computed it before the segmenter.
+def legacy_lexical_index(in_item):
+    item = in_item.lower()
+    lexical_inx = 0
+    char_pos = 0
+    while char_pos < len(item):
+        char_inx = -char_pos
+        if char_pos < len(item) - 2:
+            nextchar = item[char_pos+1:char_pos+2]
+            charint = int(nextchar.encode('utf-16-be').hex(),base=16) & 0x0000ffff
+            if (charint >= 0x0300) and (charint <= 0x036f):
+                char = item[char_pos:char_pos+2]
+                char_pos += 2
+            else:
+                char = item[char_pos:char_pos+1]
+                char_pos += 1
+        else:
+            char = item[char_pos:char_pos+1]
+            char_pos += 1
+
+        if char != 'ˈ' and char != ' ':
+            char_base = char[0:1]
+            if char_base in LEXICON_ENTRY.lexical_order_list:
+                lexval = LEXICON_ENTRY.lexical_order_list.index(char_base) * 100
+                if len(char) > 1:
+                    diacritic = char[1:]
+                    lexval += round((float(int(diacritic.encode('utf-16-be').hex(),base=16) & 0x0000ffff) - 768.0))
+            else:
+                lexval = len(LEXICON_ENTRY.lexical_order_list) + 1
+            lexical_inx += lexval * (100 ** char_inx)
+    return lexical_inx
+
+#end def legacy_lexical_index
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
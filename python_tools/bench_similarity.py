@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program benchmarks the similarity index against a brute force scan of
+# the lexicon.  The queries are phonetic forms from the lexicon with a random
+# grapheme changed, and the results of both searches are checked to be the
+# same.
+#
+import sys
+import json
+import time
+import random
+from argparse import ArgumentParser
+from lexicon_entry import LEXICON_ENTRY
+from conlang_lib import build_similarity_index, query_similarity_index, get_similarity_key, grapheme_edit_distance
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Benchmark the similarity index against brute force")
+    cli.add_argument("-i","--input", type=str, metavar="FILE_PATH", required=True, dest="input",
+        help="Conlang JSON file whose lexicon is searched")
+    cli.add_argument("-n","--queries", type=int, required=False, default=100, dest="queries",
+        help="Number of queries.  Default is 100")
+    cli.add_argument("-k","--max-distance", type=int, required=False, default=1, dest="max_distance",
+        help="Largest number of grapheme edits searched for.  Default is 1")
+    arguments = cli.parse_args(argv)
+
+    with open(arguments.input,"r", encoding="utf-8-sig") as ifp:
+        language_structure = json.load(ifp)
+    if 'lexical_order_list' in language_structure:
+        LEXICON_ENTRY.set_lexical_order_list(language_structure['lexical_order_list'])
+    lexicon = language_structure['lexicon']
+
+    start_time = time.time()
+    similarity_index = build_similarity_index(lexicon,['phonetic'])
+    print("Built index over " + str(len(lexicon)) + " entries in " + str(round(time.time() - start_time,3)) + " s")
+
+    # Make the queries by changing one grapheme of randomly chosen words.
+    generator = random.Random(0)
+    graphemes = sorted(set(grapheme for entry in lexicon for grapheme in get_similarity_key(entry['phonetic'],'phonetic')))
+    queries = []
+    for inx in range(arguments.queries):
+        key = list(get_similarity_key(generator.choice(lexicon)['phonetic'],'phonetic'))
+        if len(key) > 0:
+            key[generator.randrange(len(key))] = generator.choice(graphemes)
+        queries.append(''.join(key))
+
+    start_time = time.time()
+    index_results = [query_similarity_index(similarity_index,query,arguments.max_distance) for query in queries]
+    index_time = time.time() - start_time
+
+    start_time = time.time()
+    lexicon_keys = [get_similarity_key(entry['phonetic'],'phonetic') for entry in lexicon]
+    brute_results = []
+    for query in queries:
+        query_key = get_similarity_key(query,'phonetic')
+        brute_results.append(sorted(entry['phonetic'] + '\t' + entry['english'] + '\t' + '.'.join(entry['declensions'])
+                                    for entry, key in zip(lexicon,lexicon_keys)
+                                    if grapheme_edit_distance(query_key,key) <= arguments.max_distance))
+    brute_time = time.time() - start_time
+
+    for query, index_result, brute_result in zip(queries,index_results,brute_results):
+        if sorted(entry.phonetic + '\t' + entry.english + '\t' + '.'.join(entry.declension) for distance, entry in index_result) != brute_result:
+            print("ERROR: index and brute force disagree on " + query)
+            exit()
+
+    match_count = sum(len(result) for result in brute_results)
+    print(str(len(queries)) + " queries, k=" + str(arguments.max_distance) + ", " + str(match_count) + " matches")
+    print("brute force".ljust(12) + str(round(brute_time * 1000 / len(queries),3)).rjust(10) + " ms/query")
+    print("index".ljust(12) + str(round(index_time * 1000 / len(queries),3)).rjust(10) + " ms/query")
+    print("speedup".ljust(12) + str(round(brute_time / max(index_time,1e-9),1)).rjust(10) + "x")
+
+#end def main
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program measures how long the Conlang JSON tools take to start.  The
+# module of each subcommand of conlang.py (and conlang.py itself) is imported
+# in a new Python process with -X importtime, and the total import time and
+# the modules that took the longest are reported, taking the median of a
+# number of runs.
+#
+# With --job, a job line as read by conlang.py --batch is also run a number of
+# times, first as that many separate processes and then as one batch, to show
+# what the batch saves.
+#
+import sys
+import os
+import time
+import shlex
+import statistics
+import subprocess
+from argparse import ArgumentParser
+from conlang import CONLANG_COMMANDS
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Measure the import time of the Conlang JSON tools")
+    cli.add_argument("-c","--command", type=str, action="append", required=False, choices=list(CONLANG_COMMANDS.keys()), dest="commands",
+        help="Command to measure.  May be given more than once.  Default is all of them")
+    cli.add_argument("-n","--runs", type=int, required=False, default=5, dest="runs",
+        help="Number of runs of each measurement, of which the median is reported.  Default is 5")
+    cli.add_argument("--top", type=int, required=False, default=5, dest="top",
+        help="Number of the slowest imported modules listed for each command.  Default is 5")
+    cli.add_argument("--job", type=str, required=False, dest="job",
+        help="Job line, as read by conlang.py --batch, to time as separate processes and as one batch")
+    cli.add_argument("--jobs", type=int, required=False, default=10, dest="jobs",
+        help="Number of times the job is run.  Default is 10")
+    arguments = cli.parse_args(argv)
+
+    commands = arguments.commands
+    if commands is None:
+        commands = list(CONLANG_COMMANDS.keys())
+
+    modules = [('conlang','conlang')] + [(command,CONLANG_COMMANDS[command][0]) for command in commands]
+    print('Import time in ms, median of ' + str(arguments.runs) + ' runs')
+    for command, module_name in modules:
+        totals = []
+        self_times = {}
+        for run in range(arguments.runs):
+            total, module_times = measure_import_time(module_name)
+            totals.append(total)
+            for name, self_time in module_times.items():
+                self_times.setdefault(name,[]).append(self_time)
+        slowest = sorted(self_times.items(),key=lambda item: -statistics.median(item[1]))[:arguments.top]
+        print(command.ljust(20) + str(round(statistics.median(totals) / 1000,1)).rjust(8) + '  ' +
+              ', '.join(name + ' ' + str(round(statistics.median(times) / 1000,1)) for name, times in slowest))
+
+    if arguments.job:
+        separate_times = []
+        batch_times = []
+        for run in range(arguments.runs):
+            separate_times.append(time_separate_jobs(arguments.job,arguments.jobs))
+            batch_times.append(time_batch_jobs(arguments.job,arguments.jobs))
+        print()
+        print(str(arguments.jobs) + ' jobs as separate processes: ' + str(round(statistics.median(separate_times),3)) + ' s')
+        print(str(arguments.jobs) + ' jobs as one batch: ' + str(round(statistics.median(batch_times),3)) + ' s')
+
+#end def main
+
+# Get the path of conlang.py, which is next to this file.
+def get_conlang_script():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)),'conlang.py')
+
+#end def get_conlang_script
+
+# Import a module in a new process with -X importtime.  Returns the total
+# import time of the module in microseconds, and the self time of each module
+# it imported.
+def measure_import_time(module_name):
+    result = subprocess.run([sys.executable,'-X','importtime','-c','import ' + module_name],
+                            cwd=os.path.dirname(get_conlang_script()),capture_output=True,text=True)
+    if result.returncode != 0:
+        print("ERROR: could not import " + module_name)
+        print(result.stderr)
+        exit()
+
+    # Each line is "import time: self | cumulative | name", with the name
+    # indented by its depth and the module itself last.
+    total = 0
+    module_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        name = fields[2].strip()
+        module_times[name] = int(fields[0])
+        if name == module_name:
+            total = int(fields[1])
+    return total, module_times
+
+#end def measure_import_time
+
+# Run a job as a number of separate conlang.py processes, returning the time
+# taken in seconds.
+def time_separate_jobs(job,count):
+    start_time = time.time()
+    for inx in range(count):
+        subprocess.run([sys.executable,get_conlang_script()] + shlex.split(job),stdout=subprocess.DEVNULL,check=True)
+    return time.time() - start_time
+
+#end def time_separate_jobs
+
+# Run a job a number of times in one conlang.py --batch process, returning the
+# time taken in seconds.
+def time_batch_jobs(job,count):
+    start_time = time.time()
+    subprocess.run([sys.executable,get_conlang_script(),'--batch'],input=(job + '\n') * count,text=True,
+                   stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL,check=True)
+    return time.time() - start_time
+
+#end def time_batch_jobs
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,232 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program reports collisions in a lexicon: words from different roots,
+# or declined forms of different roots, that end up with the same spelled
+# form, the same phonetic form, or the same phonetic form once the stress marks
+# are removed.
+#
+# The lexicon is read in a single pass, declining the words as they are read if
+# the file is not already declined.  Each form is written to one of a number of
+# partition files chosen by a hash of the form, so that all of the entries that
+# could collide end up in the same partition.  The partitions are then grouped
+# one at a time, so only about 1/partitions of the lexicon is held in memory.
+#
+import sys
+import os
+import json
+import zlib
+import pickle
+import tempfile
+import itertools
+from argparse import ArgumentParser
+from conlang_lib import decline_word, derive_words, dedup_lexicon, read_conlang_json_header, iter_conlang_lexicon
+from declension_cache import add_cache_arguments, get_declension_cache
+
+COLLISION_KEYS = ['spelled','phonetic','unstressed']
+STRESS_MARKS = ['ˈ','ˌ']
+
+# Number of records held for each partition before they are written.
+PARTITION_BLOCK_SIZE = 1000
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Report words that collide in a lexicon")
+    cli.add_argument("-i","--input", type=str, metavar="FILE_PATH", required=True, dest="input",
+        help="Conlang JSON file to be checked")
+    cli.add_argument("-o","--output", type=str, metavar="FILE_PATH", required=False, dest="output",
+        help="File where the report will be placed.  Default is standard output")
+    cli.add_argument("--keys", type=str, required=False, default=','.join(COLLISION_KEYS), dest="keys",
+        help="Comma separated list of the forms to check, from " + ', '.join(COLLISION_KEYS) + ".  Default is all of them")
+    cli.add_argument("--format", type=str, required=False, default='text', choices=['text','json'], dest="format",
+        help="Write the report as text, or as one JSON object per line.  Default is text")
+    cli.add_argument("--include-same-root", action="store_true", default=False, dest="include_same_root",
+        help="Also report forms shared only by declensions of the same root")
+    cli.add_argument("--partitions", type=int, required=False, default=64, dest="partitions",
+        help="Number of partition files the lexicon is split into.  Default is 64")
+    cli.add_argument("--temp-dir", type=str, required=False, metavar="DIRECTORY", dest="temp_dir",
+        help="Directory for the partition files")
+    add_cache_arguments(cli)
+    arguments = cli.parse_args(argv)
+
+    keys = [key.strip() for key in arguments.keys.split(',')]
+    for key in keys:
+        if key not in COLLISION_KEYS:
+            print("ERROR: unknown key " + key)
+            exit()
+
+    language_structure = read_conlang_json_header(arguments.input)
+    lexicon = iter_conlang_lexicon(arguments.input)
+
+    # Derive and decline words if needed.
+    if not language_structure.get("derived",False):
+        roots = (entry for entry in iter_conlang_lexicon(arguments.input) if 'root' in entry['declensions'])
+        add_lexicon = derive_words(language_structure['derived_word_list'],
+                                   language_structure['derivational_affix_map'],
+                                   roots,
+                                   language_structure['affix_map'],
+                                   language_structure['sound_map_list'],
+                                   False)
+        lexicon = itertools.chain(lexicon,(lex_entry.as_map() for lex_entry in dedup_lexicon(add_lexicon)))
+    cache = None
+    if not language_structure.get("declined",False):
+        cache = get_declension_cache(arguments)
+        lexicon = iter_declined_lexicon(lexicon,language_structure['affix_map'],language_structure['sound_map_list'],cache)
+
+    # JSON lines are written without a byte order mark so that each line can
+    # be parsed on its own.
+    if arguments.output and arguments.format == 'json':
+        ofp = open(arguments.output,"wt", encoding="utf-8")
+    elif arguments.output:
+        ofp = open(arguments.output,"wt", encoding="utf-8-sig")
+    else:
+        ofp = sys.stdout
+
+    with tempfile.TemporaryDirectory(dir=arguments.temp_dir) as partition_dir:
+        partition_files = partition_lexicon(lexicon,keys,arguments.partitions,partition_dir)
+        if cache is not None:
+            cache.close()
+
+        counts = {key:0 for key in keys}
+        for partition_file in partition_files:
+            for key, form, records in find_collisions(partition_file,arguments.include_same_root):
+                counts[key] += 1
+                write_collision(ofp,key,form,records,arguments.format)
+            os.remove(partition_file)
+
+    if arguments.format == 'text':
+        for key in keys:
+            ofp.write(str(counts[key]) + " " + key + " collisions\n")
+    if ofp is not sys.stdout:
+        ofp.close()
+
+#end def main
+
+# Yield each entry of the lexicon followed by its declined forms.
+def iter_declined_lexicon(lexicon,affix_map,sound_map_list,cache=None):
+    for entry in lexicon:
+        yield entry
+        for lex_entry in decline_word(entry,affix_map,sound_map_list,cache=cache):
+            yield lex_entry.as_map()
+
+#end def iter_declined_lexicon
+
+# Get the root word an entry was declined from, following the source metadata
+# back through any number of declensions.
+def get_entry_root(entry):
+    root = entry
+    source = entry.get('metadata',{}).get('source',{})
+    while isinstance(source,dict) and isinstance(source.get('declined_word'),dict):
+        root = source['declined_word']
+        source = root.get('metadata',{}).get('source',{})
+    return root
+
+#end def get_entry_root
+
+# Remove the stress marks from a phonetic form.
+def strip_stress(phonetic):
+    for mark in STRESS_MARKS:
+        phonetic = phonetic.replace(mark,'')
+    return phonetic
+
+#end def strip_stress
+
+# Write the forms of each entry of the lexicon to the partition files, chosen
+# by a hash of the form.  Only what is needed for the report is kept.  Returns
+# the list of partition file names.
+def partition_lexicon(lexicon,keys,partitions,partition_dir):
+    partition_files = [os.path.join(partition_dir,'partition_' + str(inx)) for inx in range(partitions)]
+    partition_fps = [open(partition_file,'wb') for partition_file in partition_files]
+    blocks = [[] for inx in range(partitions)]
+    try:
+        for entry in lexicon:
+            root = get_entry_root(entry)
+            record = (entry['spelled'].strip(), entry['phonetic'].strip(), entry['english'].strip(), entry['part_of_speech'].strip(),
+                      entry['declensions'], root['english'].strip(), root['part_of_speech'].strip(), root['phonetic'].strip())
+            for key in keys:
+                if key == 'spelled':
+                    form = record[0]
+                elif key == 'phonetic':
+                    form = record[1]
+                else:
+                    form = strip_stress(record[1])
+                if form == '':
+                    continue
+                partition = zlib.crc32((key + '\t' + form).encode('utf-8')) % partitions
+                blocks[partition].append((key,form,record))
+                if len(blocks[partition]) >= PARTITION_BLOCK_SIZE:
+                    pickle.dump(blocks[partition],partition_fps[partition],pickle.HIGHEST_PROTOCOL)
+                    blocks[partition] = []
+        for partition in range(partitions):
+            if len(blocks[partition]) > 0:
+                pickle.dump(blocks[partition],partition_fps[partition],pickle.HIGHEST_PROTOCOL)
+    finally:
+        for partition_fp in partition_fps:
+            partition_fp.close()
+    return partition_files
+
+#end def partition_lexicon
+
+# Group the records of one partition file by form, yielding (key, form,
+# records) for each form shared by entries of more than one root, or by more
+# than one entry if include_same_root is set.
+def find_collisions(partition_file,include_same_root=False):
+    groups = {}
+    with open(partition_file,'rb') as ifp:
+        while True:
+            try:
+                block = pickle.load(ifp)
+            except EOFError:
+                break
+            for key, form, record in block:
+                group_key = (key,form)
+                if group_key not in groups:
+                    groups[group_key] = []
+                if record not in groups[group_key]:
+                    groups[group_key].append(record)
+
+    for group_key in sorted(groups):
+        records = groups[group_key]
+        if len(records) < 2:
+            continue
+        roots = set(record[5:8] for record in records)
+        if len(roots) > 1 or include_same_root:
+            yield group_key[0], group_key[1], records
+
+#end def find_collisions
+
+# Write one collision group to the report.
+def write_collision(ofp,key,form,records,output_format):
+    if output_format == 'json':
+        entries = []
+        for spelled, phonetic, english, part_of_speech, declensions, root_english, root_part_of_speech, root_phonetic in records:
+            entries.append({'spelled':spelled, 'phonetic':phonetic, 'english':english, 'part_of_speech':part_of_speech, 'declensions':declensions,
+                            'root':{'english':root_english, 'part_of_speech':root_part_of_speech, 'phonetic':root_phonetic}})
+        ofp.write(json.dumps({'key':key, 'form':form, 'entries':entries},ensure_ascii=False) + '\n')
+        return
+
+    root_count = len(set(record[5:8] for record in records))
+    ofp.write(key + ' "' + form + '": ' + str(len(records)) + ' entries from ' + str(root_count) + ' roots\n')
+    for spelled, phonetic, english, part_of_speech, declensions, root_english, root_part_of_speech, root_phonetic in records:
+        ofp.write('    ' + spelled + ' /' + phonetic + '/ ' + english + ' (' + part_of_speech + ') [' + '.'.join(declensions) + ']')
+        if (root_english, root_part_of_speech, root_phonetic) != (english, part_of_speech, phonetic):
+            ofp.write(' from ' + root_english + ' (' + root_part_of_speech + ') /' + root_phonetic + '/')
+        ofp.write('\n')
+    ofp.write('\n')
+
+#end def write_collision
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,268 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program compares the lexicons of a number of Conlang JSON files to find
+# likely cognates, or accidental overlaps, between related languages: pairs of
+# words from two languages with the same English gloss and similar phonetic
+# forms.  The similarity of two forms is 1 - d / n, where d is the grapheme
+# edit distance between them (with stress marks left out) and n is the number
+# of graphemes in the longer form, so identical forms score 1.
+#
+# Each language is reduced to an index from normalized gloss to the distinct
+# phonetic forms with that gloss, built from the lexicon as it is streamed.
+# Two languages are then compared by looking up the glosses of one in the index
+# of the other, so only words with the same gloss are ever compared and the
+# cost grows with the total size of the lexicons rather than with the product
+# of their sizes.  With --workers the indexes are built, and the pairs of
+# languages compared, by worker processes.
+#
+# The report lists the matching pairs from most to least similar, followed by a
+# summary of each pair of languages.
+#
+import sys
+import os
+import json
+import itertools
+import collections
+import concurrent.futures
+from argparse import ArgumentParser
+from conlang_lib import normalize_gloss, get_similarity_key, grapheme_edit_distance, read_conlang_json_header, iter_conlang_lexicon
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Find similar words with the same gloss in a number of languages")
+    cli.add_argument("languages", type=str, nargs='+', metavar="FILE_PATH",
+        help="Conlang JSON files to be compared")
+    cli.add_argument("-o","--output", type=str, metavar="FILE_PATH", required=False, dest="output",
+        help="File where the report will be placed.  Default is standard output")
+    cli.add_argument("--min-similarity", type=float, required=False, default=0.5, dest="min_similarity",
+        help="Lowest similarity, from 0 to 1, for a pair of words to be reported.  Default is 0.5")
+    cli.add_argument("--limit", type=int, required=False, dest="limit",
+        help="Largest number of pairs of words to report.  Default is all of them")
+    cli.add_argument("--include-declined", action="store_true", default=False, dest="include_declined",
+        help="Also compare declined forms, matching them on their declensions as well as their gloss")
+    cli.add_argument("--format", type=str, required=False, default='text', choices=['text','json'], dest="format",
+        help="Write the report as text, or as one JSON object per line.  Default is text")
+    cli.add_argument("--workers", type=int, required=False, default=1, dest="workers",
+        help="Number of processes building the indexes and comparing the languages.  Default is 1")
+    arguments = cli.parse_args(argv)
+
+    if len(arguments.languages) < 2:
+        print("ERROR: at least two languages are needed")
+        exit()
+
+    names, indexes = build_language_indexes(arguments.languages,arguments.include_declined,arguments.workers)
+    names = get_unique_language_names(names,arguments.languages)
+    pairs = list(itertools.combinations(range(len(indexes)),2))
+    matches = []
+    summaries = []
+    for pair, (pair_matches, summary) in zip(pairs,iter_pair_comparisons(indexes,pairs,arguments.min_similarity,arguments.workers)):
+        for match in pair_matches:
+            matches.append((names[pair[0]],names[pair[1]]) + match)
+        summaries.append((names[pair[0]],names[pair[1]]) + summary)
+
+    matches.sort(key=lambda match: (-match[2],match[0],match[1],match[3]))
+    if arguments.limit is not None:
+        matches = matches[:arguments.limit]
+
+    # JSON lines are written without a byte order mark so that each line can
+    # be parsed on its own.
+    if arguments.output and arguments.format == 'json':
+        ofp = open(arguments.output,"wt", encoding="utf-8")
+    elif arguments.output:
+        ofp = open(arguments.output,"wt", encoding="utf-8-sig")
+    else:
+        ofp = sys.stdout
+
+    if arguments.format == 'json':
+        write_json_report(ofp,matches,summaries)
+    else:
+        write_text_report(ofp,matches,summaries)
+
+    if ofp is not sys.stdout:
+        ofp.close()
+
+#end def main
+
+# Get the name a language is reported under: its English name, or the name of
+# its file if it has none.
+def get_language_name(input_file,language_structure):
+    name = language_structure.get('english_name','').strip()
+    if name == '':
+        name = os.path.splitext(os.path.basename(input_file))[0]
+    return name
+
+#end def get_language_name
+
+# Tell apart languages reported under the same name, such as daughter languages
+# made by sound_change.py without --name, by adding the name of each one's
+# file, or its path if that is the same too.
+def get_unique_language_names(names,language_files):
+    name_counts = collections.Counter(names)
+    unique_names = []
+    for name, language_file in zip(names,language_files):
+        if name_counts[name] > 1:
+            name += ' (' + os.path.splitext(os.path.basename(language_file))[0] + ')'
+        unique_names.append(name)
+    name_counts = collections.Counter(unique_names)
+    for inx, language_file in enumerate(language_files):
+        if name_counts[unique_names[inx]] > 1:
+            unique_names[inx] = names[inx] + ' (' + language_file + ')'
+    return unique_names
+
+#end def get_unique_language_names
+
+# Build the index of a language, mapping each gloss key to a list of (grapheme
+# key, phonetic, spelled, part of speech) with one item for each distinct
+# phonetic form.  Declined forms are only indexed with include_declined, and
+# then under their declensions as well as their gloss.  Returns the name of
+# the language and its index.
+def build_language_index(input_file,include_declined=False):
+    language_structure = read_conlang_json_header(input_file)
+    index = {}
+    for entry in iter_conlang_lexicon(input_file):
+        if entry.get('declined_word',False) and not include_declined:
+            continue
+        gloss = normalize_gloss(entry['english'])
+        if gloss == '':
+            continue
+        if include_declined:
+            gloss += ' [' + '.'.join(entry['declensions']) + ']'
+        key = get_similarity_key(entry['phonetic'],'phonetic')
+        if len(key) == 0:
+            continue
+        forms = index.setdefault(gloss,[])
+        if all(form[0] != key for form in forms):
+            forms.append((key,entry['phonetic'].strip(),entry['spelled'].strip(),entry['part_of_speech'].strip()))
+    return get_language_name(input_file,language_structure), index
+
+#end def build_language_index
+
+# Build the indexes of the languages, here or in worker processes.  Returns
+# the list of names and the list of indexes.
+def build_language_indexes(language_files,include_declined=False,workers=1):
+    if workers <= 1:
+        results = [build_language_index(language_file,include_declined) for language_file in language_files]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(build_language_index,language_files,itertools.repeat(include_declined)))
+    return [name for name, index in results], [index for name, index in results]
+
+#end def build_language_indexes
+
+# Get the similarity of two grapheme keys.
+def get_similarity(first,second):
+    return 1 - grapheme_edit_distance(first,second) / max(len(first),len(second))
+
+#end def get_similarity
+
+# Compare the indexes of two languages.  Returns the list of (similarity, gloss,
+# form, form) for the pairs of words with at least min_similarity, where each
+# form is (phonetic, spelled, part of speech), and a summary of (shared glosses,
+# matching pairs, mean similarity of the best pair of each shared gloss).
+def compare_indexes(first_index,second_index,min_similarity):
+    matches = []
+    shared = 0
+    total_similarity = 0
+    # The smaller index is walked and the larger one looked up.
+    swapped = len(first_index) > len(second_index)
+    if swapped:
+        first_index, second_index = second_index, first_index
+    for gloss, first_forms in first_index.items():
+        second_forms = second_index.get(gloss)
+        if second_forms is None:
+            continue
+        shared += 1
+        best = 0
+        for first_form, second_form in itertools.product(first_forms,second_forms):
+            similarity = get_similarity(first_form[0],second_form[0])
+            best = max(best,similarity)
+            if similarity >= min_similarity:
+                if swapped:
+                    matches.append((similarity,gloss,second_form[1:],first_form[1:]))
+                else:
+                    matches.append((similarity,gloss,first_form[1:],second_form[1:]))
+        total_similarity += best
+    mean_similarity = total_similarity / shared if shared > 0 else 0
+    return matches, (shared,len(matches),mean_similarity)
+
+#end def compare_indexes
+
+# Language indexes for the comparison worker processes, set by
+# init_compare_worker.
+COMPARE_WORKER = {}
+
+def init_compare_worker(indexes):
+    COMPARE_WORKER['indexes'] = indexes
+
+#end def init_compare_worker
+
+# Compare a pair of languages in a worker process.
+def compare_pair(pair,min_similarity):
+    indexes = COMPARE_WORKER['indexes']
+    return compare_indexes(indexes[pair[0]],indexes[pair[1]],min_similarity)
+
+#end def compare_pair
+
+# Yield the comparison of each pair of languages in order, compared here or by
+# worker processes.
+def iter_pair_comparisons(indexes,pairs,min_similarity,workers=1):
+    if workers <= 1:
+        for first, second in pairs:
+            yield compare_indexes(indexes[first],indexes[second],min_similarity)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,initializer=init_compare_worker,
+                                                initargs=(indexes,)) as executor:
+        for comparison in executor.map(compare_pair,pairs,itertools.repeat(min_similarity)):
+            yield comparison
+
+#end def iter_pair_comparisons
+
+# Format a form as spelled /phonetic/ (part of speech).
+def format_form(form):
+    phonetic, spelled, part_of_speech = form
+    return spelled + ' /' + phonetic + '/ (' + part_of_speech + ')'
+
+#end def format_form
+
+# Write the report as text.
+def write_text_report(ofp,matches,summaries):
+    for first_name, second_name, similarity, gloss, first_form, second_form in matches:
+        ofp.write('{:.3f}'.format(similarity) + ' "' + gloss + '" ' + first_name + ': ' + format_form(first_form) +
+                  '  ' + second_name + ': ' + format_form(second_form) + '\n')
+    ofp.write('\n')
+    for first_name, second_name, shared, match_count, mean_similarity in summaries:
+        ofp.write(first_name + ' / ' + second_name + ': ' + str(shared) + ' shared glosses, ' + str(match_count) +
+                  ' similar pairs, mean best similarity ' + '{:.3f}'.format(mean_similarity) + '\n')
+
+#end def write_text_report
+
+# Write the report as JSON lines, one for each pair of words followed by one
+# for each pair of languages.
+def write_json_report(ofp,matches,summaries):
+    for first_name, second_name, similarity, gloss, first_form, second_form in matches:
+        words = []
+        for name, (phonetic, spelled, part_of_speech) in [(first_name,first_form),(second_name,second_form)]:
+            words.append({'language':name, 'spelled':spelled, 'phonetic':phonetic, 'part_of_speech':part_of_speech})
+        ofp.write(json.dumps({'similarity':round(similarity,6), 'gloss':gloss, 'words':words},ensure_ascii=False) + '\n')
+    for first_name, second_name, shared, match_count, mean_similarity in summaries:
+        ofp.write(json.dumps({'languages':[first_name,second_name], 'shared_glosses':shared, 'similar_pairs':match_count,
+                              'mean_best_similarity':round(mean_similarity,6)},ensure_ascii=False) + '\n')
+
+#end def write_json_report
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
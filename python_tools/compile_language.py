@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program compiles Conlang JSON files into language bundles, which are
+# written next to the JSON file with a .bundle extension.  A bundle holds the
+# lexicon as columns of a string pool along with its lexical order and lookup
+# indexes, and is read through mmap by open_language_bundle in conlang_lib,
+# so tools do not have to parse the JSON file each time they start.
+#
+# Bundles that are already up to date with their JSON file are not rebuilt
+# unless --force is given.
+#
+import sys
+import time
+from argparse import ArgumentParser
+from conlang_lib import compile_language_bundle, language_bundle_is_stale, get_language_bundle_file
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Compile Conlang JSON files into language bundles")
+    cli.add_argument("input", type=str, metavar="FILE_PATH", nargs='+',
+        help="Conlang JSON files to be compiled")
+    cli.add_argument("-f","--force", action="store_true", default=False, dest="force",
+        help="Compile the bundles even if they are up to date")
+    cli.add_argument("--check", action="store_true", default=False, dest="check",
+        help="Only report which bundles are missing or out of date")
+    arguments = cli.parse_args(argv)
+
+    for input_file in arguments.input:
+        bundle_file = get_language_bundle_file(input_file)
+        stale = arguments.force or language_bundle_is_stale(input_file,bundle_file)
+        if arguments.check:
+            if stale:
+                print(bundle_file + ": out of date")
+            else:
+                print(bundle_file + ": up to date")
+        elif stale:
+            start_time = time.time()
+            compile_language_bundle(input_file,bundle_file)
+            print("Compiled " + bundle_file + " in " + str(round(time.time() - start_time,2)) + " seconds")
+
+#end def main
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program runs the other Conlang JSON tools as subcommands, such as
+#
+#     conlang.py csv -i language.json -o language.csv
+#
+# which does the same as write_lexicon_csv.py with the same arguments.  The
+# module of a subcommand is only imported when that subcommand is run, so
+# starting the program costs little more than starting Python.
+#
+# With --batch the jobs are read from standard input, one subcommand and its
+# arguments per line (quoted as they would be in a shell, with blank lines and
+# lines starting with # skipped), and run one after another in this process,
+# so Python and the shared modules are only loaded once.  A job that fails is
+# reported and the rest still run.  bench_startup.py measures the import time
+# of each subcommand.
+#
+import sys
+import time
+import shlex
+import importlib
+import traceback
+from argparse import ArgumentParser, RawDescriptionHelpFormatter, REMAINDER
+
+# The subcommands, with the module whose main(argv) runs each and a short
+# description.
+CONLANG_COMMANDS = {
+    'import-vulgarlang':('parse_vulgrarlang','Convert a Vulgarlang save file into a Conlang JSON file'),
+    'csv':('write_lexicon_csv','Build a CSV version of the lexicon'),
+    'sqlite':('write_lexicon_sqlite','Build an SQLite database of the lexicon'),
+    'madlibs':('not_madlibs','Generate nonsense sentences'),
+    'validate':('validate_conlang_json','Check Conlang JSON files against the specification'),
+    'compile':('compile_language','Compile Conlang JSON files into language bundles'),
+    'extract':('extract','Extract the matching part of a lexicon'),
+    'diff':('diff_conlang','Build a patch between two versions of a Conlang JSON file'),
+    'patch':('patch_conlang','Apply a patch to a Conlang JSON file'),
+    'generate':('generate_words','Generate new words for a language'),
+    'respell':('respell','Update the spelling of a lexicon after its sound map has changed'),
+    'sound-change':('sound_change','Apply sound changes to create a daughter language'),
+    'gloss':('gloss','Gloss conlang text using the root lexicon'),
+    'translate':('translate','Translate tagged English into a conlang'),
+    'similar':('similar_words','Find words similar to candidate words'),
+    'collisions':('collisions','Report words that collide in a lexicon'),
+    'paradigms':('paradigms','Build paradigm tables for the words of a lexicon'),
+    'stats':('lexicon_stats','Report statistics on a lexicon and corpora'),
+    'compare':('compare_languages','Find similar words with the same gloss in a number of languages'),
+}
+
+def main(argv):
+    # Define and parse the command line arguments
+    command_list = '\n'.join('  ' + command.ljust(20) + CONLANG_COMMANDS[command][1] for command in CONLANG_COMMANDS)
+    cli = ArgumentParser(description="Run a Conlang JSON tool", formatter_class=RawDescriptionHelpFormatter,
+        epilog="commands:\n" + command_list + "\n\nRun a command with -h for its arguments.")
+    cli.add_argument("--batch", action="store_true", default=False, dest="batch",
+        help="Read jobs from standard input, one command and its arguments per line, and run them in this process")
+    cli.add_argument("command", type=str, nargs='?', choices=list(CONLANG_COMMANDS.keys()), metavar="COMMAND",
+        help="Command to run")
+    cli.add_argument("arguments", nargs=REMAINDER, metavar="ARGUMENTS",
+        help="Arguments of the command")
+    arguments = cli.parse_args(argv)
+
+    if arguments.batch:
+        if arguments.command is not None:
+            print("ERROR: a command cannot be given with --batch")
+            exit()
+        failed = run_batch(sys.stdin)
+        if failed > 0:
+            sys.exit(1)
+    elif arguments.command is None:
+        cli.print_help()
+    else:
+        run_command(arguments.command,arguments.arguments)
+
+#end def main
+
+# Run a subcommand, importing its module.
+def run_command(command,argv):
+    module_name = CONLANG_COMMANDS[command][0]
+    importlib.import_module(module_name).main(argv)
+
+#end def run_command
+
+# Split the lines of a batch into jobs of [command, arguments...], leaving out
+# blank lines and comments.  Returns a list of (line number, job).
+def parse_batch(lines):
+    jobs = []
+    for line_number, line in enumerate(lines,1):
+        if line.strip() == '' or line.strip().startswith('#'):
+            continue
+        try:
+            job = shlex.split(line)
+        except ValueError as error:
+            job = [line.strip(), str(error)]
+        jobs.append((line_number,job))
+    return jobs
+
+#end def parse_batch
+
+# Run the jobs of a batch one at a time, reporting each on standard error.
+# Returns the number of jobs that failed.
+def run_batch(ifp):
+    # The tools end with exit() on errors, which also closes standard input,
+    # so all of the jobs are read before any are run.
+    jobs = parse_batch(ifp.readlines())
+
+    # Each tool sets the collation of the language it reads, which must not
+    # carry over into the next job.
+    from lexicon_entry import LEXICON_ENTRY
+    lexical_order_list = LEXICON_ENTRY.lexical_order_list
+
+    failed = 0
+    batch_start = time.time()
+    for line_number, job in jobs:
+        start_time = time.time()
+        status = 'ok'
+        if job[0] not in CONLANG_COMMANDS:
+            status = 'unknown command ' + job[0]
+        else:
+            try:
+                run_command(job[0],job[1:])
+            except SystemExit as error:
+                # The tools only call exit() on errors, so only the 0 of a
+                # -h is a success.
+                if error.code != 0:
+                    status = 'exited with an error'
+            except Exception:
+                traceback.print_exc()
+                status = 'failed'
+            finally:
+                LEXICON_ENTRY.set_lexical_order_list(lexical_order_list)
+                sys.stdout.flush()
+        if status != 'ok':
+            failed += 1
+        sys.stderr.write('job ' + str(line_number) + ' ' + job[0] + ': ' + status + ' in ' +
+                         str(round(time.time() - start_time,3)) + ' s\n')
+
+    sys.stderr.write(str(len(jobs)) + ' jobs, ' + str(failed) + ' failed, in ' + str(round(time.time() - batch_start,3)) + ' s\n')
+    return failed
+
+#end def run_batch
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
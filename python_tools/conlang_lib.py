@@ -16,11 +16,414 @@
 # structure in the Python language.
 #
 from lexicon_entry import LEXICON_ENTRY
+from external_sort import external_sort
+from ipa_segmenter import segment_graphemes
+from language_bundle import LANGUAGE_BUNDLE, BUNDLE_MAGIC, BUNDLE_VERSION, BUNDLE_INDEXES, UINT32, get_aligned_offset
+import sys
+import os
 import traceback
 import re
 import itertools
 import functools
-import pdb
+import json
+import struct
+import hashlib
+import shutil
+import tempfile
+from array import array
+import random
+
+# Whitespace between the tokens of a JSON file.
+JSON_WHITESPACE = re.compile(r'[ \t\r\n]*')
+
+# Compressed file extensions and the compression level used when writing them.
+# gzip is written at level 6 rather than 9, since 9 is much slower for little
+# gain on Conlang JSON files.
+COMPRESSED_FILE_LEVELS = {'.gz':6, '.xz':6, '.bz2':9}
+
+# The fields a lexicon can be sharded by, the extensions shard files can be
+# written with, and the names of the files in a sharded language directory.
+SHARD_FIELDS = ['part_of_speech','initial']
+SHARD_EXTENSIONS = ['.json','.json.gz','.json.xz','.json.bz2']
+SHARD_MANIFEST_FILE = 'manifest.json'
+SHARD_HEADER_FILE = 'header'
+SHARD_MANIFEST_VERSION = 1
+
+# Open a Conlang JSON file, or any other file the tools read or write, that may
+# be compressed.  Paths ending in .gz, .xz, or .bz2 are compressed or
+# decompressed as they are read or written, so the whole file is never held in
+# memory.  Text is UTF-8 with a byte order mark by default, inside the
+# compression for compressed files.
+def open_conlang_file(file_path,mode="rt",encoding="utf-8-sig",newline=None):
+    extension = os.path.splitext(file_path)[1].lower()
+    if 'b' in mode:
+        encoding = None
+    elif 't' not in mode:
+        mode += 't'
+    # The compression modules are only imported when a compressed file is
+    # opened, to keep the tools quick to start.
+    if extension == '.gz':
+        import gzip
+        if 'r' in mode:
+            return gzip.open(file_path,mode,encoding=encoding,newline=newline)
+        return gzip.open(file_path,mode,compresslevel=COMPRESSED_FILE_LEVELS[extension],encoding=encoding,newline=newline)
+    elif extension == '.xz':
+        import lzma
+        if 'r' in mode:
+            return lzma.open(file_path,mode,encoding=encoding,newline=newline)
+        return lzma.open(file_path,mode,preset=COMPRESSED_FILE_LEVELS[extension],encoding=encoding,newline=newline)
+    elif extension == '.bz2':
+        import bz2
+        if 'r' in mode:
+            return bz2.open(file_path,mode,encoding=encoding,newline=newline)
+        return bz2.open(file_path,mode,compresslevel=COMPRESSED_FILE_LEVELS[extension],encoding=encoding,newline=newline)
+    return open(file_path,mode,encoding=encoding,newline=newline)
+
+#end def open_conlang_file
+
+# Read a Conlang JSON object from an open file one top level field at a time.
+# This yields (key, value) tuples in file order, except that each entry of the
+# lexicon is yielded separately as ('lexicon', entry), so the lexicon never has
+# to be held in memory.  With skip_lexicon the entries are not yielded at all,
+# and ('lexicon', []) is yielded in their place so the position of the lexicon
+# among the fields is still known.
+# Skipped entries are still decoded, since the C JSON decoder finds the end of an
+# entry faster than any scan of the text done in Python.  With positions the
+# line number each value starts on is added to each tuple.
+def iter_conlang_json(ifp,skip_lexicon=False,chunk_size=1048576,positions=False):
+    decoder = json.JSONDecoder()
+    state = {'buffer':'', 'pos':0, 'eof':False, 'line':1, 'line_pos':0}
+    
+    # Read more of the file, dropping what has already been consumed.  Reads
+    # grow with the buffer so a single large value is not rescanned over and
+    # over.
+    def fill():
+        chunk = ifp.read(max(chunk_size,len(state['buffer']) - state['pos']))
+        if chunk == '':
+            state['eof'] = True
+        if positions:
+            get_line()
+            state['line_pos'] = 0
+        state['buffer'] = state['buffer'][state['pos']:] + chunk
+        state['pos'] = 0
+    
+    # Get the line number of the current position, counting only the lines
+    # passed since the last call.
+    def get_line():
+        state['line'] += state['buffer'].count('\n',state['line_pos'],state['pos'])
+        state['line_pos'] = state['pos']
+        return state['line']
+    
+    def peek():
+        while True:
+            buffer = state['buffer']
+            pos = JSON_WHITESPACE.match(buffer,state['pos']).end()
+            state['pos'] = pos
+            if pos < len(buffer) or state['eof']:
+                return buffer[pos:pos+1]
+            fill()
+    
+    def expect(char):
+        if peek() != char:
+            print("ERROR: expected " + char + " but found " + repr(peek()) + " in the Conlang JSON file")
+            exit()
+        state['pos'] += 1
+    
+    def decode():
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(state['buffer'],state['pos'])
+                # A number at the end of the buffer may continue in the next read.
+                if end < len(state['buffer']) or state['eof']:
+                    state['pos'] = end
+                    return value
+            except json.JSONDecodeError:
+                if state['eof']:
+                    raise
+            fill()
+    
+    expect('{')
+    if peek() == '}':
+        return
+    while True:
+        key = decode()
+        expect(':')
+        if key == 'lexicon':
+            if skip_lexicon and positions:
+                peek()
+                yield key, [], get_line()
+            elif skip_lexicon:
+                yield key, []
+            expect('[')
+            if peek() == ']':
+                state['pos'] += 1
+            else:
+                while True:
+                    if positions:
+                        peek()
+                        line = get_line()
+                        entry = decode()
+                        if not skip_lexicon:
+                            yield key, entry, line
+                    else:
+                        entry = decode()
+                        if not skip_lexicon:
+                            yield key, entry
+                    if peek() == ',':
+                        state['pos'] += 1
+                    else:
+                        expect(']')
+                        break
+        elif positions:
+            peek()
+            line = get_line()
+            yield key, decode(), line
+        else:
+            yield key, decode()
+        if peek() == ',':
+            state['pos'] += 1
+        else:
+            expect('}')
+            return
+
+#end def iter_conlang_json
+
+# Read everything but the lexicon from a Conlang JSON file.  The lexicon key is
+# kept, with an empty list, so that its position in the file is known.
+def read_conlang_json_header(input_file):
+    language_structure = {}
+    with open_conlang_file(input_file) as ifp:
+        for key, value in iter_conlang_json(ifp,skip_lexicon=True):
+            language_structure[key] = value
+    if 'lexicon' not in language_structure:
+        language_structure['lexicon'] = []
+    return language_structure
+
+#end def read_conlang_json_header
+
+# Yield the lexicon entries of a Conlang JSON file one at a time.
+def iter_conlang_lexicon(input_file):
+    with open_conlang_file(input_file) as ifp:
+        for key, value in iter_conlang_json(ifp):
+            if key == 'lexicon':
+                yield value
+
+#end def iter_conlang_lexicon
+
+# Write a Conlang JSON object to ofp with the entries of the lexicon taken from
+# an iterable of lexicon entry maps, so that the lexicon does not have to be
+# held in memory.  The output is the same as json.dump with an indent of 4.
+# With formatted the lexicon is instead already formatted with
+# format_lexicon_entry.
+def write_conlang_json(language_structure,lexicon,ofp,formatted=False):
+    import uuid
+    marker = 'lexicon-' + uuid.uuid4().hex
+    header = dict(language_structure)
+    header['lexicon'] = marker
+    text = json.dumps(header, ensure_ascii=False, indent=4)
+    before, after = text.split(json.dumps(marker),1)
+
+    ofp.write(before)
+    first = True
+    for entry in lexicon:
+        if first:
+            ofp.write('[\n')
+            first = False
+        else:
+            ofp.write(',\n')
+        if formatted:
+            ofp.write(entry)
+        else:
+            ofp.write(format_lexicon_entry(entry))
+    if first:
+        ofp.write('[]')
+    else:
+        ofp.write('\n    ]')
+    ofp.write(after)
+
+#end def write_conlang_json
+
+# Format a lexicon entry map the way json.dump with an indent of 4 writes it
+# inside the lexicon of a Conlang JSON object.
+def format_lexicon_entry(entry):
+    return '        ' + json.dumps(entry, ensure_ascii=False, indent=4).replace('\n','\n        ')
+
+#end def format_lexicon_entry
+
+# Get the grapheme a spelled word is filed under in the language's collation:
+# the first grapheme cluster, ignoring stress marks and spaces, if its base
+# character is in the lexical order list.  Words starting with anything else
+# are filed under ''.
+def get_collation_initial(spelled,lexical_order_list):
+    for char in segment_graphemes(spelled.lower()):
+        if char in ['ˈ',' ','\u2060']:
+            continue
+        if char[0:1] in lexical_order_list:
+            return char
+        return ''
+    return ''
+
+#end def get_collation_initial
+
+# Write a Conlang JSON object as a sharded language directory.  The header
+# (everything but the lexicon) is written once, the lexicon entries are split
+# into shards by the fields in shard_by ('part_of_speech' and/or 'initial',
+# the collation initial of the spelled form), and a manifest lists each shard
+# with its keys, entry count, and size in bytes.  Each shard is a Conlang JSON
+# object holding only a lexicon, so the other tools can read a shard directly.
+# The lexicon may be any iterable of entry maps; shards keep the order of their
+# entries and are listed in the order their first entry was seen.
+def write_sharded_conlang_json(language_structure,lexicon,output_directory,shard_by,extension='.json'):
+    if extension not in SHARD_EXTENSIONS:
+        print("ERROR: shard files cannot be written with the extension " + extension)
+        exit()
+    for field in shard_by:
+        if field not in SHARD_FIELDS:
+            print("ERROR: the lexicon cannot be sharded by " + field)
+            exit()
+    shard_by = [field for field in SHARD_FIELDS if field in shard_by]
+    lexical_order_list = language_structure.get('lexical_order_list',LEXICON_ENTRY.lexical_order_list)
+    os.makedirs(output_directory,exist_ok=True)
+
+    header = dict(language_structure)
+    header['lexicon'] = []
+    with open_conlang_file(os.path.join(output_directory,SHARD_HEADER_FILE + extension),'wt') as ofp:
+        write_conlang_json(header,[],ofp)
+
+    # Every shard is open until the whole lexicon has been written, since the
+    # lexicon is only in order by one of the shard fields at most.  A
+    # compressor holds megabytes of state, so compressed shards are written
+    # as plain temporary files first and compressed one at a time at the end.
+    compressed = extension != '.json'
+    before, after = json.dumps({'lexicon':[]}, indent=4).split('[]',1)
+    shards = {}
+    shard_files = {}
+    shard_paths = {}
+    try:
+        for entry in lexicon:
+            keys = {}
+            if 'part_of_speech' in shard_by:
+                keys['part_of_speech'] = entry['part_of_speech']
+            if 'initial' in shard_by:
+                keys['initial'] = get_collation_initial(entry['spelled'],lexical_order_list)
+            shard_key = tuple(keys.values())
+            shard = shards.get(shard_key)
+            if shard is None:
+                shard = dict(keys)
+                shard['file'] = 'shard-' + str(len(shards)).zfill(4) + extension
+                shard['entry_count'] = 0
+                shards[shard_key] = shard
+                shard_paths[shard_key] = os.path.join(output_directory,shard['file'] + ('.tmp' if compressed else ''))
+                shard_files[shard_key] = open_conlang_file(shard_paths[shard_key],'wt')
+                shard_files[shard_key].write(before + '[\n')
+            else:
+                shard_files[shard_key].write(',\n')
+            shard_files[shard_key].write(format_lexicon_entry(entry))
+            shard['entry_count'] += 1
+        for shard_key in shard_files:
+            shard_files[shard_key].write('\n    ]' + after)
+            shard_files[shard_key].close()
+        if compressed:
+            for shard_key, shard in shards.items():
+                with open(shard_paths[shard_key],'rb') as ifp:
+                    with open_conlang_file(os.path.join(output_directory,shard['file']),'wb') as ofp:
+                        shutil.copyfileobj(ifp,ofp,1048576)
+                os.remove(shard_paths[shard_key])
+    finally:
+        for ofp in shard_files.values():
+            ofp.close()
+        if compressed:
+            for shard_path in shard_paths.values():
+                if os.path.exists(shard_path):
+                    os.remove(shard_path)
+
+    manifest = {
+        'version':SHARD_MANIFEST_VERSION,
+        'shard_by':shard_by,
+        'header':SHARD_HEADER_FILE + extension,
+        'header_size':os.path.getsize(os.path.join(output_directory,SHARD_HEADER_FILE + extension)),
+        'entry_count':sum(shard['entry_count'] for shard in shards.values()),
+        'shards':list(shards.values()),
+    }
+    for shard in manifest['shards']:
+        shard['size'] = os.path.getsize(os.path.join(output_directory,shard['file']))
+    with open(os.path.join(output_directory,SHARD_MANIFEST_FILE),'wt',encoding='utf-8-sig') as ofp:
+        json.dump(manifest, ofp, ensure_ascii=False, indent=4)
+    return manifest
+
+#end def write_sharded_conlang_json
+
+# Read the manifest of a sharded language directory.
+def read_shard_manifest(directory):
+    manifest_file = os.path.join(directory,SHARD_MANIFEST_FILE)
+    if not os.path.isfile(manifest_file):
+        print("ERROR: " + directory + " is not a sharded language, it has no " + SHARD_MANIFEST_FILE)
+        exit()
+    with open(manifest_file,'rt',encoding='utf-8-sig') as ifp:
+        manifest = json.load(ifp)
+    if manifest.get('version') != SHARD_MANIFEST_VERSION:
+        print("ERROR: unsupported shard manifest version " + str(manifest.get('version')) + " in " + manifest_file)
+        exit()
+    return manifest
+
+#end def read_shard_manifest
+
+# Read the lexicon entries of one shard file.
+def read_shard_lexicon(shard_file):
+    return list(iter_conlang_lexicon(shard_file))
+
+#end def read_shard_lexicon
+
+# Load a language from a sharded language directory, reading only the shards
+# that can hold the entries asked for.  part_of_speech and initial may each be
+# a string or a list of strings; part_of_speech is matched with
+# part_of_speech_matches and initial against the collation initial of the
+# spelled form.  A field the language was not sharded by is checked entry by
+# entry instead.  With more than one worker the shards are read by a pool of
+# processes.  Returns the language structure with the matching lexicon entries.
+def load_sharded_language(directory,part_of_speech=None,initial=None,workers=1):
+    manifest = read_shard_manifest(directory)
+    language_structure = read_conlang_json_header(os.path.join(directory,manifest['header']))
+    lexical_order_list = language_structure.get('lexical_order_list',LEXICON_ENTRY.lexical_order_list)
+    if isinstance(part_of_speech,str):
+        part_of_speech = [part_of_speech]
+    if isinstance(initial,str):
+        initial = [initial]
+    if initial is not None:
+        initial = set(get_collation_initial(item,lexical_order_list) for item in initial)
+
+    def matches(fields):
+        if part_of_speech is not None and 'part_of_speech' in fields and \
+           not any(part_of_speech_matches(fields['part_of_speech'],requested) for requested in part_of_speech):
+            return False
+        if initial is not None and 'initial' in fields and fields['initial'] not in initial:
+            return False
+        return True
+
+    shard_files = [os.path.join(directory,shard['file']) for shard in manifest['shards'] if matches(shard)]
+    if workers > 1 and len(shard_files) > 1:
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers,len(shard_files))) as executor:
+            shard_lexicons = list(executor.map(read_shard_lexicon,shard_files))
+    else:
+        shard_lexicons = [read_shard_lexicon(shard_file) for shard_file in shard_files]
+
+    # Check the entries against any field the shards were not split by.
+    unsharded = [field for field in SHARD_FIELDS if field not in manifest['shard_by']]
+    lexicon = []
+    for shard_lexicon in shard_lexicons:
+        if (part_of_speech is None or 'part_of_speech' not in unsharded) and (initial is None or 'initial' not in unsharded):
+            lexicon += shard_lexicon
+            continue
+        for entry in shard_lexicon:
+            if matches({'part_of_speech':entry['part_of_speech'],
+                        'initial':get_collation_initial(entry['spelled'],lexical_order_list)}):
+                lexicon.append(entry)
+    language_structure['lexicon'] = lexicon
+    return language_structure
+
+#end def load_sharded_language
 
 # This function attempts to remove duplicate entries in a Conlang JSON object
 # phonetic list.
@@ -64,6 +467,63 @@ def dedup_lexicon(lexicon):
 
 #end dedup_lexicon
 
+# The key used to put lexicon entries in lexical order.  Entries with the same
+# lexical index are ordered by the rest of the fields compared by
+# LEXICON_ENTRY, so that duplicate entries end up next to each other.
+def lexicon_sort_key(entry):
+    return (LEXICON_ENTRY.lexical_index(entry.spelled), entry.spelled, entry.phonetic, entry.english,
+            entry.part_of_speech, ''.join(entry.declension))
+
+#end def lexicon_sort_key
+
+# Put an iterable of LEXICON_ENTRY objects into lexical order and remove the
+# duplicates, without holding more than about memory_limit bytes of entries in
+# memory.  The rest are sorted in runs on disk and merged.
+def sort_dedup_lexicon(lexicon,memory_limit,temp_dir=None):
+    return external_sort(lexicon,key=lexicon_sort_key,temp_dir=temp_dir,memory_limit=memory_limit,unique=True)
+
+#end def sort_dedup_lexicon
+
+# This function applies a single affix rule (one declension from one layer of
+# the affix map) to a phonetic representation and returns the new phonetic
+# representation.
+def apply_affix_rule(affix,rules,phonetic):
+    # Strip emphisys marks off the beginning of phonetic strings.
+    if phonetic[0:1] == 'ˈ':
+        phonetic2 = phonetic[1:]
+    else:
+        phonetic2 = phonetic
+    
+    # Perform the substitution if there is a regular expression in the affix rule.
+    if 'pronunciation_regex' in rules.keys():
+        if affix == 'prefix':
+            if re.match(rules['pronunciation_regex'],phonetic):
+                new_word = rules['t_pronunciation_add'] + phonetic2
+            else:
+                new_word = rules['f_pronunciation_add'] + phonetic2
+        elif affix == 'suffix':
+            if re.match(rules['pronunciation_regex'],phonetic):
+                new_word = phonetic2 + rules['t_pronunciation_add']
+            else:
+                new_word = phonetic2 +rules['f_pronunciation_add']
+        elif affix == 'replacement':
+            replacement = rules['pronunciation_replacement'].replace('$','\\')
+            new_word = re.sub(rules['pronunciation_regex'],replacement,phonetic2)
+        else:
+            new_word = phonetic
+    # If no regex, stick the new text on the correct end.
+    elif 'pronunciation_add' in rules.keys():
+        if affix == 'prefix':
+            new_word = rules['pronunciation_add'] + phonetic2
+        else:
+            new_word = phonetic2 +rules['pronunciation_add']
+    # If we get here, we should be a particle or an empty rule, so the word is unchanged.
+    else:
+        new_word = phonetic
+    
+    return new_word
+#end def apply_affix_rule
+
 # This function is part of the declension process, and is used to process 
 # the affix_map_tuple generated during declining a word based on its
 # part of speech.
@@ -82,41 +542,10 @@ def process_affix_map_tuple(affix_map_tuple,phonetic,part_of_speech,prior_declen
         return phonetic_list
         
     for entry in affix_map[affix]:
-        # Strip emphisys marks off the beginning of phonetic strings.
-        if phonetic[0:1] == 'ˈ':
-            phonetic2 = phonetic[1:]
-        else:
-            phonetic2 = phonetic
-            
         # At this point, the entry should be a dictionary with one key and a dictionary as its only value
         declension = list(entry.keys())[0]
         rules = entry[declension]
-        
-        # Perform the substitution if there is a regular expression in the affix rule.
-        if 'pronunciation_regex' in rules.keys():
-            if affix == 'prefix':
-                if re.match(rules['pronunciation_regex'],phonetic):
-                    new_word = rules['t_pronunciation_add'] + phonetic2
-                else:
-                    new_word = rules['f_pronunciation_add'] + phonetic2
-            elif affix == 'suffix':
-                if re.match(rules['pronunciation_regex'],phonetic):
-                    new_word = phonetic2 + rules['t_pronunciation_add']
-                else:
-                    new_word = phonetic2 +rules['f_pronunciation_add']
-            elif affix == 'replacement':
-                replacement = rules['pronunciation_replacement'].replace('$','\\')
-                match = re.match(rules['pronunciation_regex'],phonetic2)
-                new_word = re.sub(rules['pronunciation_regex'],replacement,phonetic2)
-        # If no regex, stick the new text on the correct end.
-        elif 'pronunciation_add' in rules.keys():
-            if affix == 'prefix':
-                new_word = rules['pronunciation_add'] + phonetic2
-            else:
-                    new_word = phonetic2 +rules['pronunciation_add']
-        # If we get here, we should be a particle which we punted out above, but put the new word in anyway.
-        elif not bool(rules):
-            new_word = phonetic
+        new_word = apply_affix_rule(affix,rules,phonetic)
         
         # Recurse!
         next_map_tuple = affix_map_tuple[1:]
@@ -145,11 +574,10 @@ def process_affix_list_layer(affix_map_list,phonetic,part_of_speech):
 
 #end def process_affix_list_layer
 
-# Decline a word.
-def decline_word(word,affix_map,sound_map_list,derived_word=False):
+# Decline a word.  If a DECLENSION_CACHE is given the declined forms are taken
+# from it when they are there, and added to it when they are not.
+def decline_word(word,affix_map,sound_map_list,derived_word=False,cache=None):
 
-    phonetic_list = []
-    
     # The process of declining a word is dependent on its format.  
     
     if isinstance(word,str):
@@ -185,22 +613,10 @@ def decline_word(word,affix_map,sound_map_list,derived_word=False):
         exit()
         
     
-    # Search the affix_map for a matching part of speech.  If one is found then
-    # There are rules for declining this part of speech, so apply them to this word,
-    # using its phonetic representation.
-    if part_of_speech in affix_map.keys():
-        affix_map_list = sorted(affix_map[part_of_speech],key=lambda x: list(x)[0])
-        phonetic_list += process_affix_list_layer(affix_map_list,phonetic,part_of_speech)
-        
     lexicon_fragment = []
         
     # build the pronunciation lexicon entries
-    for phonetic_entry in phonetic_list:
-        phonetic = phonetic_entry[0]
-        declensions = phonetic_entry[1]
-        part_of_speech = phonetic_entry[2]
-        root = phonetic_entry[3]
-        spelled = spell_word(phonetic, sound_map_list)
+    for phonetic, declensions, spelled in decline_phonetic(phonetic,part_of_speech,affix_map,sound_map_list,cache):
         for english in english_list:
             lexent = LEXICON_ENTRY(phonetic,spelled,english.strip(),part_of_speech,declensions,derived_word=derived_word,declined_word=True,metadata={'source':{'declined_word':word_source_metatdata}})
             lexicon_fragment.append(lexent)
@@ -209,142 +625,162 @@ def decline_word(word,affix_map,sound_map_list,derived_word=False):
 
 #end decline_word
 
-# Derive words based on the Vulgarlang format still used by the Conlang JSON objects.
-def derive_words(derived_word_list,derivational_affix_map,lexicon,affix_map,sound_map_list,decline=True):
+# Decline a phonetic form, returning a list of [phonetic, declensions, spelled]
+# for each declined form.
+def decline_phonetic(phonetic,part_of_speech,affix_map,sound_map_list,cache=None):
+    if cache is not None:
+        key = cache.get_key(phonetic,part_of_speech,affix_map,sound_map_list)
+        declined_list = cache.get(key)
+        if declined_list is not None:
+            return declined_list
+    
+    # Search the affix_map for a matching part of speech.  If one is found then
+    # There are rules for declining this part of speech, so apply them to this word,
+    # using its phonetic representation.
+    phonetic_list = []
+    if part_of_speech in affix_map.keys():
+        affix_map_list = sorted(affix_map[part_of_speech],key=lambda x: list(x)[0])
+        phonetic_list += process_affix_list_layer(affix_map_list,phonetic,part_of_speech)
+    
+    declined_list = []
+    for phonetic_entry in phonetic_list:
+        declined_list.append([phonetic_entry[0],phonetic_entry[1],spell_word(phonetic_entry[0], sound_map_list)])
+    
+    if cache is not None:
+        cache.put(key,declined_list)
+    return declined_list
+
+#end def decline_phonetic
+
+# Decline a word for a single set of requested declension features rather than
+# building every declension.  From each layer of the affix map the declension
+# whose words best match the requested features is used, and layers without a
+# match are skipped.  Returns the phonetic and spelled forms along with the
+# declensions that were applied.
+def decline_word_features(phonetic,part_of_speech,features,affix_map,sound_map_list):
+    feature_set = set()
+    for feature in features:
+        for feature_word in feature.lower().split():
+            feature_set.add(feature_word)
+    
+    declensions = []
+    if part_of_speech in affix_map.keys() and len(feature_set) > 0:
+        affix_map_list = sorted(affix_map[part_of_speech],key=lambda x: list(x)[0])
+        for affix_layer in affix_map_list:
+            affix = list(affix_layer.keys())[0]
+            if affix == 'particle':
+                continue
+            best_entry = None
+            best_count = 0
+            for entry in affix_layer[affix]:
+                declension = list(entry.keys())[0]
+                declension_words = declension.lower().split()
+                if len(declension_words) > best_count and all(word in feature_set for word in declension_words):
+                    best_entry = entry
+                    best_count = len(declension_words)
+            if best_entry is not None:
+                declension = list(best_entry.keys())[0]
+                phonetic = apply_affix_rule(affix,best_entry[declension],phonetic)
+                declensions.append(declension)
+    
+    if len(declensions) == 0:
+        declensions = ['root']
+    return phonetic, spell_word(phonetic,sound_map_list), declensions
 
-    word_map = {}
-    word_map_tupple = {}
+#end def decline_word_features
 
-    # Build the word map and word map tuple from the passed in lexicon.
+# Normalize an English gloss for use as a key in the gloss index.
+def normalize_gloss(english):
+    return ' '.join(english.replace('_',' ').lower().split())
+
+#end def normalize_gloss
+
+# Build a hashed index from normalized English glosses to the root words in a
+# lexicon.  Each root is indexed by its full gloss, and also by its gloss with
+# any parenthetical comment, leading "to" (verbs), or leading article removed so
+# that plain English words can be looked up.
+def build_gloss_index(lexicon):
+    gloss_index = {}
+    
     for raw_entry in lexicon:
-        # Ensure that the entry is a LEXICON_ENTRY
         if isinstance(raw_entry,dict):
-            entry = LEXICON_ENTRY(raw_entry['phonetic'],raw_entry['spelled'],raw_entry['english'],raw_entry['part_of_speech'],raw_entry['declensions'])
+            if raw_entry.get('declined_word',False) or 'root' not in raw_entry['declensions']:
+                continue
+            entry = LEXICON_ENTRY(raw_entry['phonetic'],raw_entry['spelled'],raw_entry['english'],raw_entry['part_of_speech'],raw_entry['declensions'],
+                                  derived_word=raw_entry.get('derived_word',False))
         elif isinstance(raw_entry,LEXICON_ENTRY):
+            if raw_entry.declined_word or 'root' not in raw_entry.declension:
+                continue
             entry = raw_entry
         else:
-            print("ERROR invalid input to derive_words")
+            print("ERROR invalid input to build_gloss_index")
             print([raw_entry,type(raw_entry)])
             traceback.print_stack()
             exit()
         
-        # If the word is a root word, then put it in the word map.  
-        # In order to match with words in the derived_word_list, spaces need to be
-        # replaced with underscores.
-        if 'root' in entry.declension:
-            wm_english = entry.english.replace(' ','_')
-            word_map[wm_english] = entry
-            part_of_speech = entry.part_of_speech
-            if part_of_speech.startswith('n'):
-                part_of_speech = 'n'
-            word_map_tupple[(wm_english,part_of_speech)] = entry
+        gloss = normalize_gloss(entry.english)
+        keys = [gloss]
+        short_gloss = normalize_gloss(re.sub(r'\([^)]*\)','',gloss))
+        keys.append(short_gloss)
+        for article in ['to ','a ','an ','the ']:
+            if short_gloss.startswith(article):
+                keys.append(short_gloss[len(article):])
+        for key in keys:
+            if key == '':
+                continue
+            if key not in gloss_index:
+                gloss_index[key] = []
+            if entry not in gloss_index[key]:
+                gloss_index[key].append(entry)
     
-    lexicon_fragment = []
+    return gloss_index
+
+#end def build_gloss_index
+
+# Look up an English word in a gloss index, preferring root words with the
+# requested part of speech.  Returns an empty list if nothing is found.
+def lookup_gloss(gloss_index,english,part_of_speech=''):
+    gloss = normalize_gloss(english)
+    keys = [gloss]
+    for article in ['to ','a ','an ','the ']:
+        if gloss.startswith(article):
+            keys.append(gloss[len(article):])
     
-    # Iterate over the derived_word_list.
-    for words in derived_word_list:
-        # Partition the word into parts based on the Vulgarlang format.
-        parts1 = words.split("=")
-        parts2 = parts1[0].split(":")
-        english = parts2[0].strip()
-        part_of_speech = parts2[1].strip()
-        rule_text = parts1[1].strip()
-        rule_text = re.sub(r'([a-z]+)-([a-z]+)',r'\1 \2',rule_text)
-        rule_list = rule_text.split()
-        
-        
-        phonetic = ""
-        
-        for rule in rule_list:
-            rule_affix_data={}
-
-            # Look for derivation affixes and add them to the rule_affix_data if present.
-            if '-' in rule:
-                rule_split = rule.split('-')
-                rule_affix_data = derivational_affix_map[rule_split[1].strip()]
-                rule = rule_split[0].strip()
-
-            rule_part_of_speech = ''
-            if ':' in rule:
-                rule_split = rule.split(':')
-                rule_part_of_speech = rule_split[1].strip()
-                rule = rule_split[0].strip()
-                # Turn all gendered nouns into just 'n'
-                if rule_part_of_speech != 'num':
-                    rule_part_of_speech = re.sub('\s*n\w*\s*','n',rule_part_of_speech)
-
-            # look for the root word
-            word = rule
-            # If we are looking to match a specific part of speech
-            if rule_part_of_speech:
-                if (word, rule_part_of_speech) not in word_map_tupple:
-                    # Search for matching entries that start and use the first one.
-                    found = False
-                    for pair in word_map_tupple.keys():
-                        if pair[0].startswith(word) and pair[1] == rule_part_of_speech:
-                            lex_entry = word_map_tupple[pair]
-                            found = True
-                            break
-                    if not found:
-                        print("ERROR: unable to locate " + word +" with part of speech " + rule_part_of_speech)
-                        exit()
-                else:
-                    lex_entry = word_map_tupple[(word, rule_part_of_speech)]
-            else:
-                if word not in word_map:
-                    # Search for matching entries that start and use the first one.
-                    found = False
-                    for search_word in word_map.keys():
-                        if search_word.startswith(word):
-                            lex_entry = word_map[search_word]
-                            found = True
-                            break
-                    if not found:
-                        print("ERROR: unable to locate " + word)
-                        exit()
-                else:
-                    lex_entry = word_map[word]
-                
-            # Build the derived word's phonetic representation.
-            phonetic_part = lex_entry.phonetic
-            if rule_affix_data:
-                if 'pronunciation_regex' in rule_affix_data.keys():
-                    if re.match(rule_affix_data['pronunciation_regex'],phonetic_part):
-                        if rule_affix_data['type'] == 'PREFIX':
-                            phonetic_part = rule_affix_data['t_pronunciation_add'] + phonetic_part
-                        else:
-                            phonetic_part = phonetic_part + rule_affix_data['t_pronunciation_add']
-                    else:
-                        if rule_affix_data['type'] == 'PREFIX':
-                            phonetic_part = rule_affix_data['f_pronunciation_add'] + phonetic_part
-                        else:
-                            phonetic_part = phonetic_part + rule_affix_data['f_pronunciation_add']
-                elif 'pronunciation_add' in rule_affix_data.keys():
-                    if rule_affix_data['type'] == 'PREFIX':
-                        phonetic_part = rule_affix_data['pronunciation_add'] + phonetic_part
-                    else:
-                        phonetic_part = phonetic_part + rule_affix_data['pronunciation_add']
-                    
-
-            phonetic += phonetic_part
-
-        # Build all of the LEXICON_ENTRYs for this word - each English word or defination gets its own entry.
-        for eng in english.split(','):
-            eng = eng.strip()
-            entry = LEXICON_ENTRY(phonetic,spell_word(phonetic,sound_map_list),eng, part_of_speech, ['root'],derived_word=True,declined_word=False,metadata={'source':{'derrived_word':words}})
-            wm_english = eng.replace(' ','_')
-            word_map[wm_english] = entry
-            part_of_speech = entry.part_of_speech
-            if part_of_speech.startswith('n'):
-                part_of_speech = 'n'
-            word_map_tupple[(wm_english,part_of_speech)] = entry
-            word_lexicon_fragment = [entry]
-            new_word_line = eng + " : " + part_of_speech +" =" + phonetic
-            if decline:
-                word_lexicon_fragment = decline_word(new_word_line,affix_map,sound_map_list,derived_word=True)
-            lexicon_fragment += word_lexicon_fragment
-                
-    return lexicon_fragment
+    for key in keys:
+        if key in gloss_index:
+            entries = gloss_index[key]
+            if part_of_speech:
+                matching = [entry for entry in entries if part_of_speech_matches(entry.part_of_speech,part_of_speech)]
+                if len(matching) > 0:
+                    return matching
+            return entries
+    return []
+
+#end def lookup_gloss
+
+# Check a lexicon part of speech against a requested one.  Gendered nouns
+# (n followed by the gender) match a plain 'n', and the various adposition
+# abbreviations are treated as one.
+def part_of_speech_matches(part_of_speech,requested):
+    part_of_speech = part_of_speech.strip()
+    requested = requested.strip()
+    if part_of_speech == requested:
+        return True
+    if requested == 'n':
+        return part_of_speech.startswith('n') and part_of_speech != 'num'
+    adpositions = ['prep','post','adp']
+    if requested in adpositions:
+        return part_of_speech in adpositions
+    return False
+
+#end def part_of_speech_matches
+
+# Derive words based on the Vulgarlang format still used by the Conlang JSON objects.
+def derive_words(derived_word_list,derivational_affix_map,lexicon,affix_map,sound_map_list,decline=True,cache=None,workers=1):
+    # The engine uses the functions in this file, so it is imported here.
+    from derivation_engine import DERIVATION_ENGINE
+    engine = DERIVATION_ENGINE(derived_word_list,derivational_affix_map,lexicon,affix_map,sound_map_list,decline,cache,workers)
+    return engine.derive()
 
 #end def derive_words
 
@@ -361,6 +797,37 @@ def spell_word(phonetic, sound_map_list):
     return spelled.strip()
 #end def spell_word
 
+# Compile the rules of a sound map list for spell_word_traced.  Rules without a
+# romanization are not used for spelling, and are kept as None so that the
+# positions of the rules stay the same.
+def compile_sound_map_list(sound_map_list):
+    compiled_sound_map_list = []
+    for sound_map in sound_map_list:
+        if 'romanization' in sound_map:
+            compiled_sound_map_list.append((re.compile(sound_map['spelling_regex']),sound_map['romanization'].replace('$','\\')))
+        else:
+            compiled_sound_map_list.append(None)
+    return compiled_sound_map_list
+
+#end def compile_sound_map_list
+
+# Convert a word from phonetic representation into romanized representation,
+# as spell_word does, also returning the positions of the rules of the
+# compiled sound map list that changed the word.
+def spell_word_traced(phonetic, compiled_sound_map_list):
+    spelled = phonetic
+    fired = []
+
+    for rule_inx, rule in enumerate(compiled_sound_map_list):
+        if rule is not None:
+            new_spelled = rule[0].sub(rule[1],spelled)
+            if new_spelled != spelled:
+                fired.append(rule_inx)
+                spelled = new_spelled
+
+    return spelled.strip(), fired
+#end def spell_word_traced
+
 # Quick utility function to get the English number word short form.
 def get_number_word(num):
     num = num.strip()
@@ -388,4 +855,514 @@ def get_ipa_symbol_map():
     ipa_symbol_map['diacritics'] = "\u02f3 \u0325 \u030a \u0324 \u032a \u02cc \u0329 \u0c3c \u032c \u02f7 \u0330 \u02f7 \u0330 \u02fd \u033a \u032f \u02b0 \u033c \u033b \u02d2 \u0339 \u20b7 \u0303 \u02b2 \u02d3 \u031c \u02d6 \u031f \u207f \u00a8 \u0308 \u02e0 \u02cd \u0320 \u20e1 \u02df \u033d \u02e4 \uab68 \u0319 \u02de".split()
     return ipa_symbol_map
 
-#end get_ipa_symbol_map
\ No newline at end of file
+#end get_ipa_symbol_map
+
+# Open a lexicon database written by write_lexicon_sqlite for querying.
+def open_lexicon_database(database_file):
+    import sqlite3
+    import pathlib
+    # The path is quoted by as_uri, since a # or ? in it would otherwise end
+    # the path part of the URI.
+    connection = sqlite3.connect(pathlib.Path(database_file).absolute().as_uri() + '?mode=ro', uri=True)
+    return connection
+
+#end def open_lexicon_database
+
+# Read the language information (everything except the lexicon) from a lexicon
+# database, in the same form it has in the Conlang JSON object.
+def get_lexicon_database_language(connection):
+    language_structure = {}
+    for key, value in connection.execute('SELECT key, value FROM language'):
+        language_structure[key] = json.loads(value)
+    
+    sound_map_list = []
+    for row in connection.execute('SELECT phoneme, romanization, spelling_regex, pronunciation_regex FROM sound_map ORDER BY position'):
+        sound_map = {}
+        for key, value in zip(['phoneme','romanization','spelling_regex','pronunciation_regex'],row):
+            if value is not None:
+                sound_map[key] = value
+        sound_map_list.append(sound_map)
+    language_structure['sound_map_list'] = sound_map_list
+    
+    affix_map = {}
+    for part_of_speech, layer, affix, declension, rules in connection.execute(
+            'SELECT part_of_speech, layer, affix_type, declension, rules FROM affix_map ORDER BY part_of_speech, layer, position'):
+        if part_of_speech not in affix_map:
+            affix_map[part_of_speech] = []
+        if len(affix_map[part_of_speech]) <= layer:
+            affix_map[part_of_speech].append({affix:[]})
+        affix_map[part_of_speech][layer][affix].append({declension:json.loads(rules)})
+    language_structure['affix_map'] = affix_map
+    
+    return language_structure
+
+#end def get_lexicon_database_language
+
+# Query a lexicon database.  Each argument that is given restricts the results,
+# with english matched without regard to case, and declensions being a list of
+# declensions that must all be present.  Returns a list of LEXICON_ENTRYs.
+def query_lexicon_database(connection,english=None,spelled=None,phonetic=None,part_of_speech=None,declensions=[],limit=None):
+    conditions = []
+    parameters = []
+    if english is not None:
+        conditions.append('english = ? COLLATE NOCASE')
+        parameters.append(english)
+    if spelled is not None:
+        conditions.append('spelled = ?')
+        parameters.append(spelled)
+    if phonetic is not None:
+        conditions.append('phonetic = ?')
+        parameters.append(phonetic)
+    if part_of_speech is not None:
+        conditions.append('part_of_speech = ?')
+        parameters.append(part_of_speech)
+    for declension in declensions:
+        conditions.append('id IN (SELECT entry_id FROM lexicon_features JOIN features ON features.id = lexicon_features.feature_id WHERE features.feature = ?)')
+        parameters.append(declension)
+    
+    query = 'SELECT id, phonetic, spelled, english, part_of_speech, derived_word, declined_word, metadata FROM lexicon'
+    if len(conditions) > 0:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY id'
+    if limit is not None:
+        query += ' LIMIT ?'
+        parameters.append(int(limit))
+    rows = connection.execute(query,parameters).fetchall()
+    
+    # Fetch the declensions for all of the entries found, a chunk at a time to
+    # stay under the SQLite parameter limit.
+    entry_declensions = {}
+    for start in range(0,len(rows),500):
+        entry_ids = [row[0] for row in rows[start:start+500]]
+        for entry_id, feature in connection.execute(
+                'SELECT entry_id, feature FROM lexicon_features JOIN features ON features.id = lexicon_features.feature_id WHERE entry_id IN (' +
+                ','.join('?' * len(entry_ids)) + ') ORDER BY entry_id, position', entry_ids):
+            if entry_id not in entry_declensions:
+                entry_declensions[entry_id] = []
+            entry_declensions[entry_id].append(feature)
+    
+    lexicon = []
+    for entry_id, phonetic, spelled, english, part_of_speech, derived_word, declined_word, metadata in rows:
+        lexicon.append(LEXICON_ENTRY(phonetic,spelled,english,part_of_speech,entry_declensions.get(entry_id,[]),
+                                     derived_word=bool(derived_word),declined_word=bool(declined_word),metadata=json.loads(metadata)))
+    return lexicon
+
+#end def query_lexicon_database
+
+# Get the file name of the compiled language bundle for a Conlang JSON file,
+# which is kept next to it.
+def get_language_bundle_file(input_file):
+    return os.path.splitext(input_file)[0] + '.bundle'
+
+#end def get_language_bundle_file
+
+# Compile a Conlang JSON file into a language bundle that LANGUAGE_BUNDLE can
+# read through mmap.  The lexicon is stored as columns of numbers into a pool
+# of strings, with the lexical order and the indexes sorted ahead of time.
+def compile_language_bundle(input_file,bundle_file=None):
+    if bundle_file is None:
+        bundle_file = get_language_bundle_file(input_file)
+
+    source_stat = os.stat(input_file)
+    with open(input_file,'rb') as ifp:
+        source = ifp.read()
+    if os.path.splitext(input_file)[1].lower() in COMPRESSED_FILE_LEVELS:
+        with open_conlang_file(input_file) as ifp:
+            language_structure = json.load(ifp)
+    else:
+        language_structure = json.loads(source.decode('utf-8-sig'))
+    lexicon = language_structure.pop('lexicon',[])
+
+    sections, string_count = build_language_bundle_sections(language_structure,lexicon)
+    header = {
+        'version':BUNDLE_VERSION,
+        'byteorder':sys.byteorder,
+        'source_sha256':hashlib.sha256(source).hexdigest(),
+        'source_size':source_stat.st_size,
+        'source_mtime_ns':source_stat.st_mtime_ns,
+        'entry_count':len(lexicon),
+        'string_count':string_count,
+        'sections':get_bundle_section_table(sections),
+        'language':language_structure,
+    }
+
+    # Write to a temporary file and move it into place so that readers never
+    # see a partly written bundle.
+    bundle_directory = os.path.dirname(os.path.abspath(bundle_file))
+    ofd, temp_file = tempfile.mkstemp(dir=bundle_directory,suffix='.tmp')
+    try:
+        with os.fdopen(ofd,'wb') as ofp:
+            write_language_bundle(ofp,header,sections)
+        os.chmod(temp_file,source_stat.st_mode & 0o777)
+        os.replace(temp_file,bundle_file)
+    except BaseException:
+        os.remove(temp_file)
+        raise
+
+    return bundle_file
+
+#end def compile_language_bundle
+
+# Build the sections of a language bundle from a language structure and its
+# lexicon of entry maps.  With declension_features each entry also gets a
+# bitset of its declensions, one bit for each name in declension_features,
+# which is filled in from the lexicon.  Returns the sections and the number of
+# strings in the pool.
+def build_language_bundle_sections(language_structure,lexicon,declension_features=None):
+    string_ids = {}
+    string_offsets = array(UINT32,[0])
+    string_data = bytearray()
+    def add_string(string):
+        if string not in string_ids:
+            string_ids[string] = len(string_ids)
+            string_data.extend(string.encode('utf-8'))
+            string_offsets.append(len(string_data))
+        return string_ids[string]
+
+    columns = {'phonetic':array(UINT32), 'spelled':array(UINT32), 'english':array(UINT32),
+               'part_of_speech':array(UINT32), 'metadata':array(UINT32)}
+    flags = bytearray()
+    declension_offsets = array(UINT32,[0])
+    declension_ids = array(UINT32)
+    for entry in lexicon:
+        for column in ['phonetic','spelled','english','part_of_speech']:
+            columns[column].append(add_string(entry[column]))
+        columns['metadata'].append(add_string(json.dumps(entry.get('metadata',{}),ensure_ascii=False)))
+        flags.append(int(bool(entry.get('derived_word',False))) | (int(bool(entry.get('declined_word',False))) << 1))
+        for declension in entry['declensions']:
+            declension_ids.append(add_string(declension))
+        declension_offsets.append(len(declension_ids))
+
+    # Sort the entries into lexical order with the language's own collation.
+    saved_lexical_order_list = LEXICON_ENTRY.lexical_order_list
+    if 'lexical_order_list' in language_structure:
+        LEXICON_ENTRY.set_lexical_order_list(language_structure['lexical_order_list'])
+    sort_keys = [lexicon_sort_key(LEXICON_ENTRY(entry['phonetic'],entry['spelled'],entry['english'],entry['part_of_speech'],entry['declensions']))
+                 for entry in lexicon]
+    LEXICON_ENTRY.set_lexical_order_list(saved_lexical_order_list)
+    sections = {'string_offsets':string_offsets, 'string_data':string_data}
+    sections.update(columns)
+    sections['flags'] = flags
+    sections['declension_offsets'] = declension_offsets
+    sections['declension_ids'] = declension_ids
+    sections['lexical_order'] = array(UINT32,sorted(range(len(lexicon)),key=sort_keys.__getitem__))
+    del sort_keys
+
+    # Build the indexes, sorted by the UTF-8 bytes of their keys.
+    for index_name in BUNDLE_INDEXES:
+        if index_name == 'english':
+            keys = [add_string(normalize_gloss(entry['english'])) for entry in lexicon]
+        else:
+            keys = list(columns[index_name])
+        key_bytes = {}
+        for string_id in set(keys):
+            key_bytes[string_id] = bytes(string_data[string_offsets[string_id]:string_offsets[string_id+1]])
+        order = sorted(range(len(lexicon)),key=lambda inx: key_bytes[keys[inx]])
+        sections[index_name + '_keys'] = array(UINT32,[keys[inx] for inx in order])
+        sections[index_name + '_entries'] = array(UINT32,order)
+
+    # The bitsets take as many 32 bit words per entry as there are declension
+    # features, rounded up.
+    if declension_features is not None:
+        feature_ids = {}
+        for string_id in declension_ids:
+            if string_id not in feature_ids:
+                feature_ids[string_id] = len(feature_ids)
+                declension_features.append(bytes(string_data[string_offsets[string_id]:string_offsets[string_id+1]]).decode('utf-8'))
+        words = max(1,(len(feature_ids) + 31) // 32)
+        declension_bits = array(UINT32,bytes(4 * words * len(lexicon)))
+        for inx in range(len(lexicon)):
+            for pos in range(declension_offsets[inx],declension_offsets[inx+1]):
+                feature = feature_ids[declension_ids[pos]]
+                declension_bits[inx * words + feature // 32] |= 1 << (feature % 32)
+        sections['declension_bits'] = declension_bits
+
+    return sections, len(string_ids)
+
+#end def build_language_bundle_sections
+
+# Lay out the sections of a language bundle, returning the table of [offset,
+# length, typecode] for the header.
+def get_bundle_section_table(sections):
+    section_table = {}
+    offset = 0
+    for name in sections:
+        if isinstance(sections[name],array):
+            typecode = sections[name].typecode
+        else:
+            typecode = 'B'
+        section_table[name] = [offset,len(sections[name]),typecode]
+        offset = get_aligned_offset(offset + len(sections[name]) * struct.calcsize(typecode))
+    return section_table
+
+#end def get_bundle_section_table
+
+# Get the number of bytes a language bundle with this header and these
+# sections takes.
+def get_language_bundle_size(header,sections):
+    header_bytes = json.dumps(header,ensure_ascii=False).encode('utf-8')
+    data_offset = get_aligned_offset(len(BUNDLE_MAGIC) + 4 + len(header_bytes))
+    data_size = 0
+    for name in sections:
+        offset, length, typecode = header['sections'][name]
+        data_size = max(data_size,get_aligned_offset(offset + length * struct.calcsize(typecode)))
+    return data_offset + data_size
+
+#end def get_language_bundle_size
+
+# Write a language bundle to ofp, which need only have write and tell.
+def write_language_bundle(ofp,header,sections):
+    header_bytes = json.dumps(header,ensure_ascii=False).encode('utf-8')
+    ofp.write(BUNDLE_MAGIC)
+    ofp.write(struct.pack('<I',len(header_bytes)))
+    ofp.write(header_bytes)
+    ofp.write(bytes(get_aligned_offset(ofp.tell()) - ofp.tell()))
+    for name in sections:
+        ofp.write(sections[name])
+        ofp.write(bytes(get_aligned_offset(ofp.tell()) - ofp.tell()))
+
+#end def write_language_bundle
+
+# Check whether a language bundle is missing or out of date with its Conlang
+# JSON file.  The hash of the JSON file is only computed if its size or
+# modification time has changed since the bundle was compiled.
+def language_bundle_is_stale(input_file,bundle_file=None):
+    if bundle_file is None:
+        bundle_file = get_language_bundle_file(input_file)
+    header = LANGUAGE_BUNDLE.read_header_file(bundle_file)
+    if header is None:
+        return True
+    source_stat = os.stat(input_file)
+    if source_stat.st_size == header['source_size'] and source_stat.st_mtime_ns == header['source_mtime_ns']:
+        return False
+    source_hash = hashlib.sha256()
+    with open(input_file,'rb') as ifp:
+        for block in iter(lambda: ifp.read(1048576),b''):
+            source_hash.update(block)
+    return source_hash.hexdigest() != header['source_sha256']
+
+#end def language_bundle_is_stale
+
+# Open the language bundle for a Conlang JSON file, compiling it first if it is
+# missing or out of date.
+def open_language_bundle(input_file,recompile=True):
+    bundle_file = get_language_bundle_file(input_file)
+    if language_bundle_is_stale(input_file,bundle_file):
+        if not recompile:
+            print("ERROR: language bundle " + bundle_file + " is missing or out of date")
+            exit()
+        compile_language_bundle(input_file,bundle_file)
+    return LANGUAGE_BUNDLE(bundle_file)
+
+#end def open_language_bundle
+
+# Publish a language and its lexicon (entry maps or LEXICON_ENTRYs) in shared
+# memory for worker processes, which attach to it with attach_shared_lexicon in
+# shared_lexicon.py using the name of the returned SHARED_LEXICON.  The block is
+# removed when the returned SHARED_LEXICON is closed.
+def publish_shared_lexicon(language_structure,lexicon):
+    from multiprocessing import shared_memory
+    from shared_lexicon import SHARED_LEXICON, SHARED_MEMORY_WRITER
+    lexicon = [entry.as_map() if isinstance(entry,LEXICON_ENTRY) else entry for entry in lexicon]
+    language_structure = dict(language_structure)
+    language_structure.pop('lexicon',None)
+
+    declension_features = []
+    sections, string_count = build_language_bundle_sections(language_structure,lexicon,declension_features)
+    header = {
+        'version':BUNDLE_VERSION,
+        'byteorder':sys.byteorder,
+        'entry_count':len(lexicon),
+        'string_count':string_count,
+        'declension_features':declension_features,
+        'feature_words':max(1,(len(declension_features) + 31) // 32),
+        'sections':get_bundle_section_table(sections),
+        'language':language_structure,
+    }
+    memory = shared_memory.SharedMemory(create=True,size=get_language_bundle_size(header,sections))
+    try:
+        write_language_bundle(SHARED_MEMORY_WRITER(memory.buf),header,sections)
+        return SHARED_LEXICON(memory.name,memory)
+    except BaseException:
+        memory.close()
+        memory.unlink()
+        raise
+
+#end def publish_shared_lexicon
+
+# Query a language bundle in the same way as query_lexicon_database.  The
+# english, spelled, and phonetic arguments use the bundle's indexes, with
+# english matched as a normalized gloss.  Returns a list of LEXICON_ENTRYs.
+def query_language_bundle(bundle,english=None,spelled=None,phonetic=None,part_of_speech=None,declensions=[],limit=None):
+    candidates = None
+    for index_name, key in [('english',english),('spelled',spelled),('phonetic',phonetic)]:
+        if key is None:
+            continue
+        if index_name == 'english':
+            key = normalize_gloss(key)
+        found = bundle.lookup(index_name,key)
+        if candidates is None:
+            candidates = found
+        else:
+            found = set(found)
+            candidates = [inx for inx in candidates if inx in found]
+    if candidates is None:
+        candidates = range(len(bundle))
+    else:
+        candidates = sorted(candidates)
+
+    lexicon = []
+    for inx in candidates:
+        if limit is not None and len(lexicon) >= limit:
+            break
+        entry = bundle.get_entry(inx)
+        if part_of_speech is not None and entry.part_of_speech != part_of_speech:
+            continue
+        if not all(declension in entry.declension for declension in declensions):
+            continue
+        lexicon.append(entry)
+    return lexicon
+
+#end def query_language_bundle
+
+# Compute the Levenshtein distance between two sequences (such as tuples of IPA
+# graphemes).  Any common prefix and suffix is removed first since it does not
+# change the distance.
+def grapheme_edit_distance(first,second):
+    if first == second:
+        return 0
+    start = 0
+    while start < len(first) and start < len(second) and first[start] == second[start]:
+        start += 1
+    first_end = len(first)
+    second_end = len(second)
+    while first_end > start and second_end > start and first[first_end - 1] == second[second_end - 1]:
+        first_end -= 1
+        second_end -= 1
+    first = first[start:first_end]
+    second = second[start:second_end]
+    if len(first) < len(second):
+        first, second = second, first
+    if len(second) == 0:
+        return len(first)
+    
+    previous_row = list(range(len(second) + 1))
+    for first_inx, first_item in enumerate(first):
+        left = first_inx + 1
+        current_row = [left]
+        for second_inx, second_item in enumerate(second):
+            cost = previous_row[second_inx] + (first_item != second_item)
+            left += 1
+            if previous_row[second_inx + 1] + 1 < left:
+                left = previous_row[second_inx + 1] + 1
+            if cost < left:
+                left = cost
+            current_row.append(left)
+        previous_row = current_row
+    return previous_row[-1]
+
+#end def grapheme_edit_distance
+
+# Get the grapheme sequence a form is indexed under for similarity searches.
+# Stress marks are left out of phonetic forms so that they do not count as
+# differences.
+def get_similarity_key(form,field):
+    if field == 'phonetic':
+        form = form.replace('ˈ','').replace('ˌ','')
+    else:
+        form = form.lower()
+    return tuple(segment_graphemes(form.strip()))
+
+#end def get_similarity_key
+
+# Build a similarity index over the phonetic and spelled forms of a lexicon.
+# Each field is indexed by a BK-tree keyed on the grapheme sequence of the
+# form, with the distance being the grapheme edit distance.  Each node of the
+# tree is a list of [key, entries, children] where children maps a distance to
+# the child node at that distance.
+def build_similarity_index(lexicon,fields=['phonetic','spelled']):
+    entries = []
+    for raw_entry in lexicon:
+        if isinstance(raw_entry,dict):
+            entries.append(LEXICON_ENTRY(raw_entry['phonetic'],raw_entry['spelled'],raw_entry['english'],raw_entry['part_of_speech'],raw_entry['declensions'],
+                                         derived_word=raw_entry.get('derived_word',False),declined_word=raw_entry.get('declined_word',False)))
+        elif isinstance(raw_entry,LEXICON_ENTRY):
+            entries.append(raw_entry)
+        else:
+            print("ERROR invalid input to build_similarity_index")
+            print([raw_entry,type(raw_entry)])
+            traceback.print_stack()
+            exit()
+    
+    similarity_index = {}
+    for field in fields:
+        forms = {}
+        for entry in entries:
+            key = get_similarity_key(getattr(entry,field),field)
+            if key not in forms:
+                forms[key] = []
+            forms[key].append(entry)
+        
+        # A lexicon is usually in lexical order, which builds a lopsided tree,
+        # so the forms are inserted in a shuffled (but repeatable) order.
+        keys = list(forms.keys())
+        random.Random(0).shuffle(keys)
+        root = None
+        for key in keys:
+            node = [key,forms[key],{}]
+            if root is None:
+                root = node
+                continue
+            parent = root
+            while True:
+                distance = grapheme_edit_distance(key,parent[0])
+                if distance not in parent[2]:
+                    parent[2][distance] = node
+                    break
+                parent = parent[2][distance]
+        similarity_index[field] = root
+    
+    return similarity_index
+
+#end def build_similarity_index
+
+# Find the entries whose form is within max_distance grapheme edits of a form.
+# Returns a list of (distance, LEXICON_ENTRY) sorted by distance.
+def query_similarity_index(similarity_index,form,max_distance=1,field='phonetic'):
+    root = similarity_index.get(field)
+    if root is None:
+        return []
+    key = get_similarity_key(form,field)
+    
+    found = []
+    nodes = [root]
+    while len(nodes) > 0:
+        node = nodes.pop()
+        distance = grapheme_edit_distance(key,node[0])
+        if distance <= max_distance:
+            for entry in node[1]:
+                found.append((distance,entry))
+        # By the triangle inequality only the children at a distance within
+        # max_distance of this node's distance can hold matches.
+        for child_distance in node[2]:
+            if distance - max_distance <= child_distance <= distance + max_distance:
+                nodes.append(node[2][child_distance])
+    
+    found.sort(key=lambda result: (result[0],LEXICON_ENTRY.lexical_index(result[1].spelled)))
+    return found
+
+#end def query_similarity_index
+
+# Query a similarity index with many forms at once, returning a list of results
+# in the same order as the forms.  Repeated forms are only searched once.
+def query_similarity_index_batch(similarity_index,forms,max_distance=1,field='phonetic'):
+    results = {}
+    batch_results = []
+    for form in forms:
+        key = get_similarity_key(form,field)
+        if key not in results:
+            results[key] = query_similarity_index(similarity_index,form,max_distance,field)
+        batch_results.append(results[key])
+    return batch_results
+
+#end def query_similarity_index_batch
@@ -0,0 +1,231 @@
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file contains the CONVERSION_PIPELINE class, which runs the stages of a
+# conversion (declining words, encoding lexicon entries as JSON) at the same
+# time as each other and as the main thread.  Each stage is fed batches by a
+# thread of its own, which sends them to a shared pool of worker processes and
+# puts the results, in the order the batches were read, on a bounded queue for
+# the next stage or the main thread.  A stage has at most twice as many batches
+# in the workers as there are workers, and stops when its queue is full, so a
+# slow consumer holds the stages before it back instead of letting results
+# pile up in memory.
+#
+# The depth of each queue is sampled as results are put on it, and the time
+# each stage spent waiting on a full queue (its consumer was slower) and the
+# time its consumer spent waiting on an empty one (the stage was slower) are
+# kept for the report.
+#
+import sys
+import time
+import queue
+import threading
+import collections
+import concurrent.futures
+from declension_cache import DECLENSION_CACHE
+from conlang_lib import decline_word, format_lexicon_entry
+from shared_lexicon import attach_shared_lexicon
+
+# Number of items sent to a worker at a time by each stage.
+PIPELINE_BATCH_SIZES = {'decline':256, 'encode':1024}
+
+# Put on a queue after the last result of a stage.
+PIPELINE_END = ('end',)
+
+# PIPELINE_QUEUE Class
+class PIPELINE_QUEUE:
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.queue = queue.Queue(maxsize)
+        self.batches = 0
+        self.max_depth = 0
+        self.depth_total = 0
+        self.put_stall = 0.0
+        self.get_stall = 0.0
+        self.error = None
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            start_time = time.perf_counter()
+            self.queue.put(item)
+            self.put_stall += time.perf_counter() - start_time
+        if item is not PIPELINE_END:
+            depth = self.queue.qsize()
+            self.batches += 1
+            self.depth_total += depth
+            self.max_depth = max(self.max_depth,depth)
+
+    def get(self):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            start_time = time.perf_counter()
+            item = self.queue.get()
+            self.get_stall += time.perf_counter() - start_time
+            return item
+
+    # Yield the results put on the queue until the stage ends, raising any
+    # error the stage hit.
+    def __iter__(self):
+        while True:
+            item = self.get()
+            if item is PIPELINE_END:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield item
+
+# End of PIPELINE_QUEUE
+
+# CONVERSION_PIPELINE Class
+class CONVERSION_PIPELINE:
+    def __init__(self, workers, affix_map, sound_map_list, cache=None):
+        self.workers = workers
+        if cache is not None:
+            cache_settings = (cache.cache_dir,cache.max_size)
+        else:
+            cache_settings = None
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers,initializer=init_conversion_worker,
+                                                               initargs=(affix_map,sound_map_list,cache_settings))
+        self.queues = []
+        self.threads = []
+
+    # Start a stage that sends the items of an iterable, in batches, to
+    # function in the workers.  Returns the queue of results, one list per
+    # batch, in order.  The batch size is the stage's entry in
+    # PIPELINE_BATCH_SIZES unless one is given.
+    def map(self, name, function, iterable, batch_size=None):
+        if batch_size is None:
+            batch_size = PIPELINE_BATCH_SIZES[name]
+        output_queue = PIPELINE_QUEUE(name,self.workers * 2)
+        thread = threading.Thread(target=self.run_stage,args=(function,iterable,batch_size,output_queue),daemon=True)
+        self.queues.append(output_queue)
+        self.threads.append(thread)
+        thread.start()
+        return output_queue
+
+    def run_stage(self, function, iterable, batch_size, output_queue):
+        pending = collections.deque()
+        try:
+            batch = []
+            for item in iterable:
+                batch.append(item)
+                if len(batch) < batch_size:
+                    continue
+                pending.append(self.executor.submit(function,batch))
+                batch = []
+                if len(pending) >= self.workers * 2:
+                    output_queue.put(pending.popleft().result())
+            if len(batch) > 0:
+                pending.append(self.executor.submit(function,batch))
+            while len(pending) > 0:
+                output_queue.put(pending.popleft().result())
+        except BaseException as error:
+            for future in pending:
+                future.cancel()
+            output_queue.error = error
+        output_queue.put(PIPELINE_END)
+
+    # Yield the items of the lists a stage produces.
+    @staticmethod
+    def flatten(output_queue):
+        for batch in output_queue:
+            for item in batch:
+                yield item
+
+    # Print the queue depth and stall times of each stage.
+    def report(self, ofp=sys.stderr):
+        print('stage'.ljust(10) + 'batches'.rjust(9) + 'max depth'.rjust(11) + 'mean depth'.rjust(12) +
+              'full s'.rjust(9) + 'empty s'.rjust(9), file=ofp)
+        for output_queue in self.queues:
+            mean_depth = output_queue.depth_total / max(1,output_queue.batches)
+            print(output_queue.name.ljust(10) + str(output_queue.batches).rjust(9) + str(output_queue.max_depth).rjust(11) +
+                  ('%.2f' % mean_depth).rjust(12) + ('%.2f' % output_queue.put_stall).rjust(9) +
+                  ('%.2f' % output_queue.get_stall).rjust(9), file=ofp)
+
+    def close(self):
+        for thread in self.threads:
+            thread.join()
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.executor.shutdown(wait=False,cancel_futures=True)
+        else:
+            self.close()
+
+# End of CONVERSION_PIPELINE
+
+# Settings for the worker processes, set by init_conversion_worker.
+CONVERSION_WORKER = {}
+
+def init_conversion_worker(affix_map,sound_map_list,cache_settings):
+    CONVERSION_WORKER['affix_map'] = affix_map
+    CONVERSION_WORKER['sound_map_list'] = sound_map_list
+    if cache_settings is not None:
+        CONVERSION_WORKER['cache'] = DECLENSION_CACHE(cache_settings[0],cache_settings[1])
+    else:
+        CONVERSION_WORKER['cache'] = None
+
+#end def init_conversion_worker
+
+# Decline a batch of words in a worker process, returning the declined forms
+# of all of them in order.  New cache entries are written at the end of each
+# batch since workers are not closed cleanly.
+def decline_batch(words):
+    declined_words = []
+    for word in words:
+        declined_words += decline_word(word,CONVERSION_WORKER['affix_map'],CONVERSION_WORKER['sound_map_list'],
+                                       cache=CONVERSION_WORKER['cache'])
+    if CONVERSION_WORKER['cache'] is not None:
+        CONVERSION_WORKER['cache'].flush()
+    return declined_words
+
+#end def decline_batch
+
+# Split a SHARED_LEXICON into (name, start, stop) ranges of the decline batch
+# size, which decline_shared_batch reads the words of from the shared memory.
+def get_shared_ranges(shared_lexicon):
+    batch_size = PIPELINE_BATCH_SIZES['decline']
+    return [(shared_lexicon.name,start,min(start + batch_size,len(shared_lexicon))) for start in range(0,len(shared_lexicon),batch_size)]
+
+#end def get_shared_ranges
+
+# Decline the words of a batch of ranges of a shared lexicon in a worker
+# process, using the affix_map and sound_map_list published with it.
+def decline_shared_batch(ranges):
+    declined_words = []
+    for name, start, stop in ranges:
+        shared_lexicon = attach_shared_lexicon(name)
+        language_structure = shared_lexicon.get_language()
+        for inx in range(start,stop):
+            declined_words += decline_word(shared_lexicon.get_entry(inx),language_structure['affix_map'],language_structure['sound_map_list'],
+                                           cache=CONVERSION_WORKER['cache'])
+    if CONVERSION_WORKER['cache'] is not None:
+        CONVERSION_WORKER['cache'].flush()
+    return declined_words
+
+#end def decline_shared_batch
+
+# Encode a batch of LEXICON_ENTRYs in a worker process as they are written in
+# the lexicon of a Conlang JSON file.
+def encode_batch(entries):
+    return [format_lexicon_entry(entry.as_map()) for entry in entries]
+
+#end def encode_batch
@@ -0,0 +1,217 @@
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file contains the DECLENSION_CACHE class, an on disk cache of declined
+# forms kept in an SQLite database so that it persists between runs.  Entries
+# are keyed by a hash of the phonetic form, the part of speech, and
+# fingerprints of the affix map rules for that part of speech and of the sound
+# map, so a change to any of them simply misses the cache.
+#
+# The database is opened in WAL mode so that several processes can use the
+# same cache at once, and the least recently used entries are removed once the
+# cache grows past its size limit.  The total size of the entries is kept up to
+# date by triggers in a one row table, so it is not added up on every write.
+#
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+# Changing how words are declined or spelled must change this so that old
+# cache entries are no longer used.
+DECLENSION_CACHE_VERSION = 1
+
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+# Number of new entries and uses held in memory before they are written.
+CACHE_WRITE_BATCH_SIZE = 1000
+
+DECLENSION_CACHE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS declensions (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    size INTEGER,
+    last_used REAL
+);
+CREATE INDEX IF NOT EXISTS declensions_last_used ON declensions (last_used);
+CREATE TABLE IF NOT EXISTS cache_size (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total INTEGER
+);
+INSERT OR IGNORE INTO cache_size (id, total) SELECT 0, COALESCE(SUM(size),0) FROM declensions;
+CREATE TRIGGER IF NOT EXISTS declensions_insert AFTER INSERT ON declensions BEGIN
+    UPDATE cache_size SET total = total + NEW.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS declensions_delete AFTER DELETE ON declensions BEGIN
+    UPDATE cache_size SET total = total - OLD.size WHERE id = 0;
+END;
+'''
+
+# DECLENSION_CACHE Class
+class DECLENSION_CACHE:
+    def __init__(self, cache_dir=None, max_size=DEFAULT_CACHE_SIZE):
+        if cache_dir is None:
+            cache_dir = DECLENSION_CACHE.default_cache_dir()
+        self.cache_dir = cache_dir
+        self.cache_file = os.path.join(cache_dir,'declensions.sqlite')
+        self.max_size = max_size
+        self.connection = None
+        self.pid = None
+        self.fingerprints = []
+        self.pending = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    # The default cache directory, following the XDG base directory spec.
+    @staticmethod
+    def default_cache_dir():
+        cache_home = os.environ.get('XDG_CACHE_HOME','')
+        if cache_home == '':
+            cache_home = os.path.join(os.path.expanduser('~'),'.cache')
+        return os.path.join(cache_home,'conlang_json')
+
+    # Get the connection for this process.  Connections are not shared with
+    # worker processes, so a forked process opens its own.
+    def get_connection(self):
+        if self.connection is None or self.pid != os.getpid():
+            if self.pid is not None and self.pid != os.getpid():
+                self.pending = {}
+                self.used = set()
+            os.makedirs(self.cache_dir,exist_ok=True)
+            self.connection = sqlite3.connect(self.cache_file,timeout=60)
+            self.connection.execute('PRAGMA journal_mode = WAL')
+            self.connection.execute('PRAGMA synchronous = NORMAL')
+            # INSERT OR REPLACE only runs the delete trigger for the row it
+            # replaces with recursive triggers on.
+            self.connection.execute('PRAGMA recursive_triggers = ON')
+            with self.connection:
+                self.connection.executescript(DECLENSION_CACHE_SCHEMA)
+            self.pid = os.getpid()
+        return self.connection
+
+    # Get a fingerprint of the rules that decline a part of speech and of the
+    # sound map.  The fingerprints are kept for the maps they were computed
+    # from, which are normally the same few objects for the life of a tool.
+    def get_fingerprint(self, affix_map, sound_map_list, part_of_speech):
+        for fingerprint_affix_map, fingerprint_sound_map_list, fingerprint_part_of_speech, fingerprint in self.fingerprints:
+            if fingerprint_affix_map is affix_map and fingerprint_sound_map_list is sound_map_list and fingerprint_part_of_speech == part_of_speech:
+                return fingerprint
+        fingerprint = hashlib.sha256(json.dumps([DECLENSION_CACHE_VERSION,affix_map.get(part_of_speech),sound_map_list],
+                                                sort_keys=True,ensure_ascii=False).encode('utf-8')).hexdigest()
+        self.fingerprints.append((affix_map,sound_map_list,part_of_speech,fingerprint))
+        return fingerprint
+
+    def get_key(self, phonetic, part_of_speech, affix_map, sound_map_list):
+        fingerprint = self.get_fingerprint(affix_map,sound_map_list,part_of_speech)
+        return hashlib.sha256(json.dumps([phonetic,part_of_speech,fingerprint],ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    # Get the declined forms cached for a key, or None if there are none.
+    def get(self, key):
+        if key in self.pending:
+            self.hits += 1
+            return json.loads(self.pending[key])
+        row = self.get_connection().execute('SELECT value FROM declensions WHERE key = ?',(key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used.add(key)
+        if len(self.used) >= CACHE_WRITE_BATCH_SIZE:
+            self.flush()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        self.pending[key] = json.dumps(value,ensure_ascii=False)
+        if len(self.pending) >= CACHE_WRITE_BATCH_SIZE:
+            self.flush()
+
+    # Write the new entries and the times entries were used, then evict the
+    # least recently used entries if the cache is too large.
+    def flush(self):
+        if len(self.pending) == 0 and len(self.used) == 0:
+            return
+        connection = self.get_connection()
+        now = time.time()
+        with connection:
+            connection.executemany('INSERT OR REPLACE INTO declensions (key, value, size, last_used) VALUES (?, ?, ?, ?)',
+                                   [(key,value,len(key) + len(value),now) for key, value in self.pending.items()])
+            connection.executemany('UPDATE declensions SET last_used = ? WHERE key = ?',[(now,key) for key in self.used])
+        self.pending = {}
+        self.used = set()
+        self.evict()
+
+    # Remove the least recently used entries until the cache is back under
+    # nine tenths of its size limit.  The entries are only added up again, in
+    # case the running total has drifted, once it says the cache is too large.
+    def evict(self):
+        connection = self.get_connection()
+        total_size = connection.execute('SELECT total FROM cache_size WHERE id = 0').fetchone()[0]
+        if total_size <= self.max_size:
+            return
+        target_size = self.max_size * 9 // 10
+        with connection:
+            total_size = connection.execute('SELECT COALESCE(SUM(size),0) FROM declensions').fetchone()[0]
+            connection.execute('UPDATE cache_size SET total = ? WHERE id = 0',(total_size,))
+            if total_size <= self.max_size:
+                return
+            removed_size = 0
+            remove_keys = []
+            for key, size in connection.execute('SELECT key, size FROM declensions ORDER BY last_used'):
+                if total_size - removed_size <= target_size:
+                    break
+                remove_keys.append((key,))
+                removed_size += size
+            connection.executemany('DELETE FROM declensions WHERE key = ?',remove_keys)
+
+    # Remove every entry from the cache.
+    def clear(self):
+        self.pending = {}
+        self.used = set()
+        with self.get_connection() as connection:
+            connection.execute('DELETE FROM declensions')
+            connection.execute('UPDATE cache_size SET total = 0 WHERE id = 0')
+
+    def close(self):
+        if self.connection is not None and self.pid == os.getpid():
+            self.flush()
+            self.connection.close()
+        self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# End of DECLENSION_CACHE
+
+# Add the --no-cache and --cache-dir arguments to a tool that declines words.
+def add_cache_arguments(cli):
+    cli.add_argument("--no-cache", action="store_true", default=False, dest="no_cache",
+        help='Do not use the on disk cache of declined words')
+    cli.add_argument("--cache-dir", type=str, required=False, metavar="DIRECTORY", dest="cache_dir",
+        help='Directory for the cache of declined words.  Default is ' + DECLENSION_CACHE.default_cache_dir())
+
+#end def add_cache_arguments
+
+# Get the declension cache selected by the arguments from add_cache_arguments,
+# or None if the cache is turned off.
+def get_declension_cache(arguments):
+    if arguments.no_cache:
+        return None
+    return DECLENSION_CACHE(arguments.cache_dir)
+
+#end def get_declension_cache
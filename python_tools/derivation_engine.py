@@ -0,0 +1,410 @@
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file contains the DERIVATION_ENGINE class, which builds the derived words
+# of a derived_word_list.  The rules are parsed once and the word each part of
+# a rule refers to is resolved to either a root word or another rule, giving a
+# dependency graph that is evaluated in topological order.
+#
+# A part of a rule resolves to the same word it did when the rules were run
+# strictly in order (the latest word with that English, or failing that the
+# first word whose English starts with it), so existing languages derive the
+# same words.  A part that refers to a word derived later in the list, which
+# used to be an error, now depends on that later rule.
+#
+# Only the phonetic form of a rule depends on other rules, so the phonetic
+# forms are built level by level and the spelling and declension of all of the
+# derived words, which is most of the work, can then be spread over worker
+# processes.  After a root or derivational affix changes, only the rules that
+# depend on it, directly or through other rules, are rebuilt.
+#
+import re
+import traceback
+import concurrent.futures
+from lexicon_entry import LEXICON_ENTRY
+from declension_cache import DECLENSION_CACHE
+from conlang_lib import spell_word, decline_word
+
+# DERIVATION_ENGINE Class
+class DERIVATION_ENGINE:
+    def __init__(self, derived_word_list, derivational_affix_map, lexicon, affix_map, sound_map_list, decline=True, cache=None, workers=1):
+        self.affix_map = affix_map
+        self.sound_map_list = sound_map_list
+        self.decline = decline
+        self.cache = cache
+        self.workers = workers
+        self.derivational_affixes = {}
+        for affix_name in derivational_affix_map:
+            self.derivational_affixes[affix_name] = DERIVATION_ENGINE.compile_derivational_affix(derivational_affix_map[affix_name])
+        self.rules = [DERIVATION_ENGINE.parse_derivation_rule(words) for words in derived_word_list]
+        self.roots = []
+        for raw_entry in lexicon:
+            # Ensure that the entry is a LEXICON_ENTRY
+            if isinstance(raw_entry,dict):
+                entry = LEXICON_ENTRY(raw_entry['phonetic'],raw_entry['spelled'],raw_entry['english'],raw_entry['part_of_speech'],raw_entry['declensions'])
+            elif isinstance(raw_entry,LEXICON_ENTRY):
+                entry = raw_entry
+            else:
+                print("ERROR invalid input to derive_words")
+                print([raw_entry,type(raw_entry)])
+                traceback.print_stack()
+                exit()
+            if 'root' in entry.declension:
+                self.roots.append(entry)
+        self.dependencies = None
+        self.phonetics = {}
+        self.fragments = {}
+
+    # Parse a line of the derived_word_list, in the Vulgarlang format, into the
+    # English words, part of speech, and the parts of the rule, each of which is
+    # a (word, part of speech, derivational affix) tuple.
+    @staticmethod
+    def parse_derivation_rule(words):
+        parts1 = words.split("=")
+        parts2 = parts1[0].split(":")
+        english = parts2[0].strip()
+        part_of_speech = parts2[1].strip()
+        rule_text = parts1[1].strip()
+        rule_text = re.sub(r'([a-z]+)-([a-z]+)',r'\1 \2',rule_text)
+
+        terms = []
+        for rule in rule_text.split():
+            affix_name = None
+            if '-' in rule:
+                rule_split = rule.split('-')
+                affix_name = rule_split[1].strip()
+                rule = rule_split[0].strip()
+
+            rule_part_of_speech = ''
+            if ':' in rule:
+                rule_split = rule.split(':')
+                rule_part_of_speech = rule_split[1].strip()
+                rule = rule_split[0].strip()
+                # Turn all gendered nouns into just 'n'
+                if rule_part_of_speech != 'num':
+                    rule_part_of_speech = re.sub(r'\s*n\w*\s*','n',rule_part_of_speech)
+            terms.append((rule,rule_part_of_speech,affix_name))
+
+        return {'line':words, 'english':english, 'part_of_speech':part_of_speech, 'terms':terms}
+    #end def parse_derivation_rule
+
+    # Compile an entry of the derivational_affix_map into the form used to
+    # apply it.
+    @staticmethod
+    def compile_derivational_affix(affix_data):
+        compiled = {'prefix':affix_data.get('type') == 'PREFIX', 'regex':None, 'add':''}
+        if 'pronunciation_regex' in affix_data:
+            compiled['regex'] = re.compile(affix_data['pronunciation_regex'])
+            compiled['t_add'] = affix_data['t_pronunciation_add']
+            compiled['f_add'] = affix_data['f_pronunciation_add']
+        elif 'pronunciation_add' in affix_data:
+            compiled['add'] = affix_data['pronunciation_add']
+        return compiled
+    #end def compile_derivational_affix
+
+    # Apply a compiled derivational affix to a phonetic form.
+    @staticmethod
+    def apply_derivational_affix(compiled, phonetic):
+        if compiled['regex'] is not None:
+            if compiled['regex'].match(phonetic):
+                add = compiled['t_add']
+            else:
+                add = compiled['f_add']
+        else:
+            add = compiled['add']
+        if compiled['prefix']:
+            return add + phonetic
+        return phonetic + add
+    #end def apply_derivational_affix
+
+    # Get the keys a word is known by: its English with spaces as underscores,
+    # and that with its part of speech, where all nouns are just 'n'.
+    @staticmethod
+    def get_word_keys(english, part_of_speech):
+        wm_english = english.replace(' ','_')
+        if part_of_speech.startswith('n'):
+            part_of_speech = 'n'
+        return wm_english, (wm_english,part_of_speech)
+    #end def get_word_keys
+
+    # Build the word maps.  Each maps a key to the list of the words that
+    # defined it, in order, where a word is a root LEXICON_ENTRY or the number
+    # of a rule.  Keys are in the order they were first defined.
+    def build_word_maps(self):
+        word_map = {}
+        word_map_tupple = {}
+        for entry in self.roots:
+            key, key_tupple = DERIVATION_ENGINE.get_word_keys(entry.english,entry.part_of_speech)
+            word_map.setdefault(key,[]).append(entry)
+            word_map_tupple.setdefault(key_tupple,[]).append(entry)
+        for rule_inx, rule in enumerate(self.rules):
+            for eng in rule['english'].split(','):
+                key, key_tupple = DERIVATION_ENGINE.get_word_keys(eng.strip(),rule['part_of_speech'])
+                word_map.setdefault(key,[]).append(rule_inx)
+                word_map_tupple.setdefault(key_tupple,[]).append(rule_inx)
+        return word_map, word_map_tupple
+    #end def build_word_maps
+
+    # Get the latest definition of a key made before rule_inx, or None if the
+    # key was not yet defined.
+    @staticmethod
+    def get_definition(definitions, rule_inx):
+        found = None
+        for definition in definitions:
+            if isinstance(definition,int) and definition >= rule_inx:
+                break
+            found = definition
+        return found
+    #end def get_definition
+
+    # Look a word up in a word map as it stood before rule_inx, first by its
+    # key and then by the first key that starts with it.
+    @staticmethod
+    def lookup_word(word_map, key, matches, rule_inx):
+        if key in word_map:
+            definition = DERIVATION_ENGINE.get_definition(word_map[key],rule_inx)
+            if definition is not None:
+                return definition
+        for search_key in word_map:
+            if matches(search_key):
+                definition = DERIVATION_ENGINE.get_definition(word_map[search_key],rule_inx)
+                if definition is not None:
+                    return definition
+        return None
+    #end def lookup_word
+
+    # Resolve each part of each rule to the word it refers to.  Words defined
+    # before the rule are used if there are any, otherwise words defined by
+    # any other rule.
+    def resolve(self):
+        word_map, word_map_tupple = self.build_word_maps()
+        dependencies = []
+        for rule_inx, rule in enumerate(self.rules):
+            rule_dependencies = []
+            for word, rule_part_of_speech, affix_name in rule['terms']:
+                if affix_name is not None and affix_name not in self.derivational_affixes:
+                    print("ERROR: unknown derivational affix " + affix_name + " in " + rule['line'])
+                    exit()
+                if rule_part_of_speech:
+                    search_map = word_map_tupple
+                    key = (word,rule_part_of_speech)
+                    matches = lambda pair: pair[0].startswith(word) and pair[1] == rule_part_of_speech
+                else:
+                    search_map = word_map
+                    key = word
+                    matches = lambda search_word: search_word.startswith(word)
+                definition = DERIVATION_ENGINE.lookup_word(search_map,key,matches,rule_inx)
+                if definition is None:
+                    definition = DERIVATION_ENGINE.lookup_word(search_map,key,matches,len(self.rules))
+                if definition is None or (isinstance(definition,int) and definition == rule_inx):
+                    if rule_part_of_speech:
+                        print("ERROR: unable to locate " + word +" with part of speech " + rule_part_of_speech)
+                    else:
+                        print("ERROR: unable to locate " + word)
+                    exit()
+                rule_dependencies.append(definition)
+            dependencies.append(rule_dependencies)
+        return dependencies
+    #end def resolve
+
+    # Order the rules into levels, where every rule depends only on roots and
+    # rules in earlier levels.
+    def get_levels(self, rule_inxs=None):
+        if rule_inxs is None:
+            rule_inxs = range(len(self.rules))
+        rule_inxs = set(rule_inxs)
+        remaining = {}
+        for rule_inx in rule_inxs:
+            remaining[rule_inx] = set(dependency for dependency in self.dependencies[rule_inx]
+                                      if isinstance(dependency,int) and dependency in rule_inxs)
+        levels = []
+        while len(remaining) > 0:
+            level = sorted(rule_inx for rule_inx in remaining if len(remaining[rule_inx]) == 0)
+            if len(level) == 0:
+                print("ERROR: derived words depend on each other in a loop:")
+                for rule_inx in sorted(remaining):
+                    print("    " + self.rules[rule_inx]['line'])
+                exit()
+            for rule_inx in level:
+                del remaining[rule_inx]
+            for rule_inx in remaining:
+                remaining[rule_inx].difference_update(level)
+            levels.append(level)
+        return levels
+    #end def get_levels
+
+    # Get the rules that depend on any of the given rules, directly or through
+    # other rules, including the given rules.
+    def get_downstream(self, rule_inxs):
+        dependents = {}
+        for rule_inx, rule_dependencies in enumerate(self.dependencies):
+            for dependency in rule_dependencies:
+                if isinstance(dependency,int):
+                    dependents.setdefault(dependency,set()).add(rule_inx)
+        downstream = set(rule_inxs)
+        pending = list(rule_inxs)
+        while len(pending) > 0:
+            for dependent in dependents.get(pending.pop(),[]):
+                if dependent not in downstream:
+                    downstream.add(dependent)
+                    pending.append(dependent)
+        return downstream
+    #end def get_downstream
+
+    # Build the phonetic form of a rule from the words it depends on.
+    def build_phonetic(self, rule_inx):
+        phonetic = ''
+        for term, dependency in zip(self.rules[rule_inx]['terms'],self.dependencies[rule_inx]):
+            if isinstance(dependency,int):
+                phonetic_part = self.phonetics[dependency]
+            else:
+                phonetic_part = dependency.phonetic
+            if term[2] is not None:
+                phonetic_part = DERIVATION_ENGINE.apply_derivational_affix(self.derivational_affixes[term[2]],phonetic_part)
+            phonetic += phonetic_part
+        return phonetic
+    #end def build_phonetic
+
+    # Build the rules, level by level, then spell and decline them.
+    def evaluate(self, rule_inxs=None):
+        levels = self.get_levels(rule_inxs)
+        for level in levels:
+            for rule_inx in level:
+                self.phonetics[rule_inx] = self.build_phonetic(rule_inx)
+
+        jobs = []
+        for level in levels:
+            for rule_inx in level:
+                rule = self.rules[rule_inx]
+                jobs.append((rule_inx,self.phonetics[rule_inx],rule['english'],rule['part_of_speech'],rule['line']))
+
+        if self.workers > 1 and len(jobs) > 1:
+            if self.cache is not None:
+                cache_settings = (self.cache.cache_dir,self.cache.max_size)
+            else:
+                cache_settings = None
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,initializer=init_derivation_worker,
+                                                        initargs=(self.affix_map,self.sound_map_list,self.decline,cache_settings)) as executor:
+                chunk_size = max(1,len(jobs) // (self.workers * 4))
+                for job, fragment in zip(jobs,executor.map(run_derivation_job,jobs,chunksize=chunk_size)):
+                    self.fragments[job[0]] = fragment
+        else:
+            for job in jobs:
+                self.fragments[job[0]] = build_derived_words(job,self.affix_map,self.sound_map_list,self.decline,self.cache)
+    #end def evaluate
+
+    # Derive all of the words, returning the lexicon fragment in the order of
+    # the derived_word_list.
+    def derive(self):
+        self.dependencies = self.resolve()
+        self.phonetics = {}
+        self.fragments = {}
+        self.evaluate()
+        return self.get_lexicon_fragment()
+    #end def derive
+
+    def get_lexicon_fragment(self):
+        lexicon_fragment = []
+        for rule_inx in range(len(self.rules)):
+            lexicon_fragment += self.fragments.get(rule_inx,[])
+        return lexicon_fragment
+
+    # Replace or add root words, then rebuild only the rules affected.  Returns
+    # the set of rules that were rebuilt.
+    def update_roots(self, entries):
+        for entry in entries:
+            for inx, root in enumerate(self.roots):
+                if root.english == entry.english and root.part_of_speech == entry.part_of_speech:
+                    self.roots[inx] = entry
+                    break
+            else:
+                self.roots.append(entry)
+        return self.update()
+    #end def update_roots
+
+    # Replace or add a derivational affix, then rebuild only the rules
+    # affected.  Returns the set of rules that were rebuilt.
+    def update_derivational_affix(self, affix_name, affix_data):
+        self.derivational_affixes[affix_name] = DERIVATION_ENGINE.compile_derivational_affix(affix_data)
+        changed = set(rule_inx for rule_inx, rule in enumerate(self.rules)
+                      if any(term[2] == affix_name for term in rule['terms']))
+        return self.update(changed)
+    #end def update_derivational_affix
+
+    # Resolve the rules again and rebuild the ones whose words changed, along
+    # with everything downstream of them.
+    def update(self, changed=set()):
+        if self.dependencies is None:
+            self.derive()
+            return set(range(len(self.rules)))
+        old_dependencies = self.dependencies
+        self.dependencies = self.resolve()
+        changed = set(changed)
+        for rule_inx in range(len(self.rules)):
+            old_words = [dependency if isinstance(dependency,int) else dependency.phonetic for dependency in old_dependencies[rule_inx]]
+            new_words = [dependency if isinstance(dependency,int) else dependency.phonetic for dependency in self.dependencies[rule_inx]]
+            if old_words != new_words:
+                changed.add(rule_inx)
+        downstream = self.get_downstream(changed)
+        if len(downstream) > 0:
+            self.evaluate(downstream)
+        return downstream
+    #end def update
+
+# End of DERIVATION_ENGINE
+
+# Build the lexicon entries for a derived word: one root entry for each of its
+# English words, or their declined forms if the words are being declined.
+def build_derived_words(job,affix_map,sound_map_list,decline,cache=None):
+    rule_inx, phonetic, english, part_of_speech, words = job
+    lexicon_fragment = []
+    spelled = spell_word(phonetic,sound_map_list)
+    for eng in english.split(','):
+        eng = eng.strip()
+        entry = LEXICON_ENTRY(phonetic,spelled,eng, part_of_speech, ['root'],derived_word=True,declined_word=False,metadata={'source':{'derrived_word':words}})
+        if part_of_speech.startswith('n'):
+            part_of_speech = 'n'
+        if decline:
+            new_word_line = eng + " : " + part_of_speech +" =" + phonetic
+            lexicon_fragment += decline_word(new_word_line,affix_map,sound_map_list,derived_word=True,cache=cache)
+        else:
+            lexicon_fragment.append(entry)
+    return lexicon_fragment
+
+#end def build_derived_words
+
+# Settings for the derivation worker processes, set by init_derivation_worker.
+DERIVATION_WORKER = {}
+
+def init_derivation_worker(affix_map,sound_map_list,decline,cache_settings):
+    DERIVATION_WORKER['affix_map'] = affix_map
+    DERIVATION_WORKER['sound_map_list'] = sound_map_list
+    DERIVATION_WORKER['decline'] = decline
+    if cache_settings is not None:
+        DERIVATION_WORKER['cache'] = DECLENSION_CACHE(cache_settings[0],cache_settings[1])
+    else:
+        DERIVATION_WORKER['cache'] = None
+
+#end def init_derivation_worker
+
+# Build the derived words for one job in a worker process.  New cache entries
+# are written at the end of each job since workers are not closed cleanly.
+def run_derivation_job(job):
+    lexicon_fragment = build_derived_words(job,DERIVATION_WORKER['affix_map'],DERIVATION_WORKER['sound_map_list'],
+                                           DERIVATION_WORKER['decline'],DERIVATION_WORKER['cache'])
+    if DERIVATION_WORKER['cache'] is not None:
+        DERIVATION_WORKER['cache'].flush()
+    return lexicon_fragment
+
+#end def run_derivation_job
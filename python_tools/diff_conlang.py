@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program compares two versions of a Conlang JSON file and writes a patch
+# of the entries added, removed, and changed and of the changes to the header,
+# which patch_conlang.py applies to the old version to get the new one.  The
+# lexicons are compared with an external sort and merge, so they do not need
+# to fit in memory.  See lexicon_patch.py for the patch format.
+#
+import sys
+from argparse import ArgumentParser
+from external_sort import parse_memory_size, DEFAULT_RUN_SIZE
+from lexicon_patch import diff_conlang_json
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Build a patch between two versions of a Conlang JSON file")
+    cli.add_argument("old", type=str, metavar="OLD_FILE",
+        help="Old version of the Conlang JSON file")
+    cli.add_argument("new", type=str, metavar="NEW_FILE",
+        help="New version of the Conlang JSON file")
+    cli.add_argument("-o","--output", type=str, metavar="FILE_PATH", required=True, dest="output",
+        help="File where the patch will be placed, compressed if it ends in .gz, .xz, or .bz2")
+    cli.add_argument("--run-size", type=int, required=False, default=DEFAULT_RUN_SIZE, dest="run_size",
+        help="Number of entries sorted in memory at a time before being spilled to disk.  Default is " + str(DEFAULT_RUN_SIZE))
+    cli.add_argument("--memory-limit", type=str, required=False, metavar="SIZE", dest="memory_limit",
+        help="Approximate amount of memory (such as 512M or 2G) to use for sorting instead of --run-size")
+    cli.add_argument("--temp-dir", type=str, required=False, metavar="DIRECTORY", dest="temp_dir",
+        help="Directory for the temporary files used when sorting")
+    arguments = cli.parse_args(argv)
+
+    memory_limit = None
+    if arguments.memory_limit:
+        memory_limit = parse_memory_size(arguments.memory_limit)
+    counts = diff_conlang_json(arguments.old,arguments.new,arguments.output,arguments.run_size,arguments.temp_dir,memory_limit)
+    print(str(counts['keep']) + " entries kept, " + str(counts['change']) + " changed, " + str(counts['add']) + " added, " +
+          str(counts['remove']) + " removed")
+
+#end def main
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
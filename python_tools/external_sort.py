@@ -0,0 +1,157 @@
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file contains an external (disk based) sort used for lexicons that are
+# too large to sort in memory.  Items are collected into runs, each run is
+# sorted and spilled to a temporary file, and the runs are then merged.
+#
+import sys
+import heapq
+import pickle
+import tempfile
+
+# Number of items held in memory, and so written to each run.
+DEFAULT_RUN_SIZE = 100000
+
+# Number of records written with each call to pickle.
+RUN_BLOCK_SIZE = 1000
+
+# Number of items measured to estimate how many fit in a memory limit.
+SIZE_SAMPLE_COUNT = 100
+
+# Multipliers for the suffixes accepted by parse_memory_size.
+MEMORY_SIZE_SUFFIXES = {'':1, 'K':1024, 'M':1024**2, 'G':1024**3, 'T':1024**4}
+
+# Sort an iterable, yielding the items in order.  Like sorted() the sort is
+# stable, so items with equal keys keep the order they were read in.  If all
+# of the items fit in one run nothing is written to disk.
+#
+# If memory_limit (in bytes) is given the run size is instead estimated from
+# the size of the first items read.  If unique is set only the first of the
+# items with equal keys is kept, so the key must include everything that makes
+# two items different.
+def external_sort(iterable, key, run_size=DEFAULT_RUN_SIZE, temp_dir=None, memory_limit=None, unique=False):
+    runs = []
+    run = []
+    try:
+        for item in iterable:
+            run.append((key(item),item))
+            if memory_limit is not None and len(runs) == 0 and len(run) == SIZE_SAMPLE_COUNT:
+                run_size = get_run_size(run,memory_limit)
+            if len(run) >= run_size:
+                runs.append(write_run(run,temp_dir,unique))
+                run = []
+
+        if len(runs) == 0:
+            run.sort(key=lambda record: record[0])
+            records = iter(run)
+        else:
+            if len(run) > 0:
+                runs.append(write_run(run,temp_dir,unique))
+            run = []
+            records = heapq.merge(*[read_run(run_file) for run_file in runs], key=lambda record: record[0])
+
+        if unique:
+            records = unique_records(records)
+        for record in records:
+            yield record[1]
+    finally:
+        for run_file in runs:
+            run_file.close()
+
+#end def external_sort
+
+# Sort a run of (key, item) records and write it to a temporary file, which is
+# returned positioned at its start.  Duplicates are dropped before the run is
+# written if unique is set.
+def write_run(run,temp_dir=None,unique=False):
+    run.sort(key=lambda record: record[0])
+    if unique:
+        run = list(unique_records(run))
+    run_file = tempfile.TemporaryFile(dir=temp_dir)
+    for start in range(0,len(run),RUN_BLOCK_SIZE):
+        pickle.dump(run[start:start+RUN_BLOCK_SIZE],run_file,pickle.HIGHEST_PROTOCOL)
+    run_file.seek(0)
+    return run_file
+
+#end def write_run
+
+# Yield the (key, item) records of a run file in order.
+def read_run(run_file):
+    while True:
+        try:
+            block = pickle.load(run_file)
+        except EOFError:
+            return
+        for record in block:
+            yield record
+
+#end def read_run
+
+# Drop the records whose key is equal to the key of the record before them.
+def unique_records(records):
+    first = True
+    last_key = None
+    for record in records:
+        if first or record[0] != last_key:
+            first = False
+            last_key = record[0]
+            yield record
+
+#end def unique_records
+
+# Estimate the number of (key, item) records that fit in memory_limit bytes
+# from a sample of records.
+def get_run_size(sample,memory_limit):
+    sample_size = 0
+    for record in sample:
+        sample_size += get_object_size(record)
+    record_size = max(1,sample_size // len(sample))
+    return max(RUN_BLOCK_SIZE,memory_limit // record_size)
+
+#end def get_run_size
+
+# Get the approximate memory used by an object and everything it holds.
+def get_object_size(obj):
+    size = sys.getsizeof(obj)
+    if isinstance(obj,dict):
+        for key in obj:
+            size += get_object_size(key) + get_object_size(obj[key])
+    elif isinstance(obj,(list,tuple,set)):
+        for item in obj:
+            size += get_object_size(item)
+    elif hasattr(obj,'__dict__'):
+        size += get_object_size(vars(obj))
+    return size
+
+#end def get_object_size
+
+# Convert a memory size such as 512M or 2G (or a plain number of bytes) into a
+# number of bytes.
+def parse_memory_size(memory_size):
+    memory_size = memory_size.strip().upper()
+    if memory_size.endswith('B'):
+        memory_size = memory_size[:-1]
+    suffix = ''
+    if memory_size[-1:] in MEMORY_SIZE_SUFFIXES:
+        suffix = memory_size[-1:]
+        memory_size = memory_size[:-1]
+    try:
+        size = float(memory_size)
+    except ValueError:
+        print("ERROR: invalid memory size " + memory_size + suffix)
+        exit()
+    return int(size * MEMORY_SIZE_SUFFIXES[suffix])
+
+#end def parse_memory_size
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program extracts the part of the lexicon of a Conlang JSON file that
+# matches a filter, such as all of the verbs with Past in their declensions or
+# only the root words that are not derived, into a smaller Conlang JSON file
+# with the same header.  The lexicon is streamed, so neither the input nor the
+# output lexicon is held in memory.
+#
+# The input may also be the directory of a sharded language, in which case only
+# the shards that can hold matching entries are read, and with --bundle the
+# filter runs on the columns of the language bundle so that only the matching
+# entries are built.  See lexicon_filter.py.
+#
+import sys
+import os
+from argparse import ArgumentParser
+from conlang_lib import write_conlang_json, open_conlang_file
+from lexicon_filter import LEXICON_FILTER, read_filtered_language
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Extract the matching part of a Conlang JSON lexicon")
+    cli.add_argument("-i","--input", type=str, metavar="FILE_PATH", required=True, dest="input",
+        help="Conlang JSON file, or sharded language directory, to extract from")
+    cli.add_argument("-o","--output", type=str, metavar="FILE_PATH", required=True, dest="output",
+        help="Conlang JSON file where the matching entries will be placed")
+    cli.add_argument("-p","--part-of-speech", type=str, action="append", required=False, dest="part_of_speech",
+        help="Part of speech to extract.  May be given more than once")
+    cli.add_argument("-d","--declension", type=str, action="append", required=False, default=[], dest="declensions",
+        help="Declension every extracted entry must have, such as Past or root.  May be given more than once")
+    cli.add_argument("--without-declension", type=str, action="append", required=False, default=[], dest="without_declensions",
+        help="Declension no extracted entry may have.  May be given more than once")
+    derived_group = cli.add_mutually_exclusive_group()
+    derived_group.add_argument("--derived", action="store_const", const=True, dest="derived_word",
+        help="Only extract derived words")
+    derived_group.add_argument("--not-derived", action="store_const", const=False, dest="derived_word",
+        help="Do not extract derived words")
+    declined_group = cli.add_mutually_exclusive_group()
+    declined_group.add_argument("--declined", action="store_const", const=True, dest="declined_word",
+        help="Only extract declined words")
+    declined_group.add_argument("--not-declined", action="store_const", const=False, dest="declined_word",
+        help="Do not extract declined words")
+    cli.add_argument("--spelled", type=str, metavar="REGEX", required=False, dest="spelled",
+        help="Regular expression the spelled form must contain a match for")
+    cli.add_argument("--phonetic", type=str, metavar="REGEX", required=False, dest="phonetic",
+        help="Regular expression the phonetic form must contain a match for")
+    cli.add_argument("--bundle", action="store_true", default=False, dest="bundle",
+        help="Filter through the language bundle of the input file, compiling it first if it is missing or out of date")
+    arguments = cli.parse_args(argv)
+
+    if os.path.abspath(arguments.input) == os.path.abspath(arguments.output):
+        print("ERROR: the output file cannot be the input file")
+        exit()
+
+    lexicon_filter = LEXICON_FILTER(arguments.part_of_speech,arguments.declensions,arguments.without_declensions,
+                                    arguments.derived_word,arguments.declined_word,arguments.spelled,arguments.phonetic)
+    language_structure, lexicon = read_filtered_language(arguments.input,lexicon_filter,arguments.bundle)
+
+    counter = {'entries':0}
+    def count(lexicon):
+        for entry in lexicon:
+            counter['entries'] += 1
+            yield entry
+
+    with open_conlang_file(arguments.output,'wt') as ofp:
+        write_conlang_json(language_structure,count(lexicon),ofp)
+
+    print(str(counter['entries']) + " entries extracted")
+
+#end def main
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
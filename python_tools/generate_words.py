@@ -0,0 +1,278 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program generates new candidate root words for a language from the
+# word initial, mid word, and word final consonants and the vowels of the
+# Vulgarlang save kept in its metadata (or from its phonetic inventory if
+# there is none), spelling each with the language's sound map.  Candidates
+# whose phonetic form (without stress marks) or spelled form is already in the
+# lexicon, or was already generated, are rejected.
+#
+# Words are built syllable by syllable: an optional word initial consonant,
+# then vowels separated by mid word consonants, then an optional word final
+# consonant.  The second vowels are used a third as often as the main vowels.
+#
+# Candidates are generated in chunks, each with its own random generator
+# seeded from --seed and the chunk number, and the chunks are checked for
+# collisions in order, so the output for a seed is the same no matter how many
+# worker processes are used.
+#
+import sys
+import json
+import random
+import collections
+import concurrent.futures
+from argparse import ArgumentParser
+from conlang_lib import compile_sound_map_list, read_conlang_json_header, iter_conlang_lexicon
+
+STRESS_MARKS = ['ˈ','ˌ']
+
+# Number of candidates generated in each chunk.
+GENERATE_CHUNK_SIZE = 20000
+
+# Candidates generated before giving up, as a multiple of the words asked for.
+MAX_ATTEMPT_FACTOR = 100
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Generate new words for a Conlang JSON language")
+    cli.add_argument("-i","--input", type=str, metavar="FILE_PATH", required=True, dest="input",
+        help="Conlang JSON file of the language")
+    cli.add_argument("-o","--output", type=str, metavar="FILE_PATH", required=False, dest="output",
+        help="File where the words will be placed.  Default is standard output")
+    cli.add_argument("-n","--count", type=int, required=False, default=100, dest="count",
+        help="Number of words to generate.  Default is 100")
+    cli.add_argument("--seed", type=int, required=False, default=0, dest="seed",
+        help="Seed for the random generators.  Default is 0")
+    cli.add_argument("--min-syllables", type=int, required=False, default=1, dest="min_syllables",
+        help="Least number of syllables in a word.  Default is 1")
+    cli.add_argument("--max-syllables", type=int, required=False, default=3, dest="max_syllables",
+        help="Greatest number of syllables in a word.  Default is 3")
+    cli.add_argument("--format", type=str, required=False, default='text', choices=['text','json'], dest="format",
+        help="Write each word as phonetic and spelled forms separated by a tab, or as a JSON object per line.  Default is text")
+    cli.add_argument("--workers", type=int, required=False, default=1, dest="workers",
+        help="Number of processes generating candidates.  Default is 1")
+    arguments = cli.parse_args(argv)
+
+    if arguments.min_syllables < 1 or arguments.max_syllables < arguments.min_syllables:
+        print("ERROR: the syllable counts must be at least 1, with the least no more than the greatest")
+        exit()
+
+    language_structure = read_conlang_json_header(arguments.input)
+    inventory = get_phonotactic_inventory(language_structure)
+    if len(inventory['vowels']) == 0:
+        print("ERROR: no vowels were found for " + arguments.input)
+        exit()
+    settings = (inventory,language_structure['sound_map_list'],arguments.min_syllables,arguments.max_syllables)
+
+    existing_phonetic, existing_spelled = get_existing_forms(iter_conlang_lexicon(arguments.input))
+
+    # JSON lines are written without a byte order mark so that each line can
+    # be parsed on its own.
+    if arguments.output and arguments.format == 'json':
+        ofp = open(arguments.output,"wt", encoding="utf-8")
+    elif arguments.output:
+        ofp = open(arguments.output,"wt", encoding="utf-8-sig")
+    else:
+        ofp = sys.stdout
+
+    written = 0
+    for phonetic, spelled in iter_new_words(settings,arguments.seed,arguments.count,arguments.workers,existing_phonetic,existing_spelled):
+        if arguments.format == 'json':
+            ofp.write(json.dumps({'phonetic':phonetic, 'spelled':spelled},ensure_ascii=False) + '\n')
+        else:
+            ofp.write(phonetic + '\t' + spelled + '\n')
+        written += 1
+    if ofp is not sys.stdout:
+        ofp.close()
+
+    if written < arguments.count:
+        print("WARNING: only " + str(written) + " new words could be generated", file=sys.stderr)
+
+#end def main
+
+# Get the consonants allowed at the start, middle, and end of a word and the
+# vowels, with their weights, from the Vulgarlang save in the metadata of a
+# language, or from its phonetic inventory if there is no save.
+def get_phonotactic_inventory(language_structure):
+    vulgarlang = None
+    for source in language_structure.get('metadata',{}).get('source',[]):
+        if isinstance(source,dict) and 'vulgarlang' in source:
+            vulgarlang = source['vulgarlang']
+            break
+
+    if vulgarlang is not None:
+        def get_sounds(key):
+            return vulgarlang.get(key,{}).get('value','').split()
+        main_vowels = get_sounds('bwsVowels')
+        second_vowels = get_sounds('bws2ndVowels')
+        if len(main_vowels) == 0:
+            main_vowels = get_sounds('customVowels')
+        consonants = get_sounds('customConsonants')
+        initial = get_sounds('wordInitialConsonants')
+        mid = get_sounds('midWordConsonants')
+        final = get_sounds('wordFinalConsonants')
+        if len(mid) == 0:
+            mid = consonants
+    else:
+        phonetic_inventory = language_structure.get('phonetic_inventory',{})
+        main_vowels = phonetic_inventory.get('vowels',[])
+        second_vowels = phonetic_inventory.get('v_diphthongs',[])
+        mid = phonetic_inventory.get('p_consonants',[]) + phonetic_inventory.get('np_consonants',[])
+        initial = mid
+        final = mid
+
+    vowels = main_vowels + second_vowels
+    vowel_weights = [3] * len(main_vowels) + [1] * len(second_vowels)
+    # An empty choice lets a word start with a vowel as often as with any one
+    # consonant, and end with a vowel as often as with any consonant.
+    return {
+        'initial':initial + [''],
+        'initial_weights':[1] * len(initial) + [1],
+        'mid':mid if len(mid) > 0 else [''],
+        'final':final + [''],
+        'final_weights':[1] * len(final) + [max(1,len(final))],
+        'vowels':vowels,
+        'vowel_weights':vowel_weights,
+    }
+
+#end def get_phonotactic_inventory
+
+# Remove the stress marks from a phonetic form.
+def strip_stress(phonetic):
+    for mark in STRESS_MARKS:
+        phonetic = phonetic.replace(mark,'')
+    return phonetic
+
+#end def strip_stress
+
+# Build the sets of phonetic forms (without stress marks) and lower case
+# spelled forms in a lexicon.
+def get_existing_forms(lexicon):
+    existing_phonetic = set()
+    existing_spelled = set()
+    for entry in lexicon:
+        existing_phonetic.add(strip_stress(entry['phonetic'].strip()))
+        existing_spelled.add(entry['spelled'].strip().lower())
+    return existing_phonetic, existing_spelled
+
+#end def get_existing_forms
+
+# Get the seed of a chunk's random generator from the seed and chunk number.
+def get_chunk_seed(seed,chunk_inx):
+    return seed * 1000003 + chunk_inx
+
+#end def get_chunk_seed
+
+# Settings for the generator worker processes, set by init_generate_worker.
+GENERATE_WORKER = {}
+
+def init_generate_worker(inventory,sound_map_list,min_syllables,max_syllables):
+    GENERATE_WORKER['inventory'] = inventory
+    GENERATE_WORKER['compiled_sound_map_list'] = [rule for rule in compile_sound_map_list(sound_map_list) if rule is not None]
+    GENERATE_WORKER['syllable_counts'] = list(range(min_syllables,max_syllables + 1))
+
+#end def init_generate_worker
+
+# Generate a chunk of candidate words, returning a list of phonetic forms and
+# a list of the spelled forms.  The candidates are built slot by slot with one
+# call to the random generator for each slot of the whole chunk, and are given
+# the stress mark the lexicon uses on the first syllable.
+def generate_chunk(seed,chunk_size):
+    rng = random.Random(seed)
+    inventory = GENERATE_WORKER['inventory']
+    syllable_counts = rng.choices(GENERATE_WORKER['syllable_counts'],k=chunk_size)
+    total_syllables = sum(syllable_counts)
+    initials = rng.choices(inventory['initial'],inventory['initial_weights'],k=chunk_size)
+    finals = rng.choices(inventory['final'],inventory['final_weights'],k=chunk_size)
+    vowels = rng.choices(inventory['vowels'],inventory['vowel_weights'],k=total_syllables)
+    mids = rng.choices(inventory['mid'],k=total_syllables)
+
+    phonetic_list = []
+    pos = 0
+    for word_inx in range(chunk_size):
+        count = syllable_counts[word_inx]
+        parts = ['ˈ',initials[word_inx],vowels[pos]]
+        for syllable_inx in range(1,count):
+            parts.append(mids[pos + syllable_inx])
+            parts.append(vowels[pos + syllable_inx])
+        parts.append(finals[word_inx])
+        pos += count
+        phonetic_list.append(''.join(parts))
+
+    # Candidates repeated within the chunk are dropped before they are
+    # spelled, then the whole chunk is spelled one rule at a time, the same
+    # as spell_word.
+    phonetic_list = list(dict.fromkeys(phonetic_list))
+    spelled_list = phonetic_list
+    for pattern, romanization in GENERATE_WORKER['compiled_sound_map_list']:
+        sub = pattern.sub
+        spelled_list = [sub(romanization,spelled) for spelled in spelled_list]
+    spelled_list = [spelled.strip() for spelled in spelled_list]
+    return phonetic_list, spelled_list
+
+#end def generate_chunk
+
+# Yield the chunks of candidates in order, generated in this process or by
+# worker processes a few chunks ahead.
+def iter_chunks(settings,seed,workers):
+    chunk_inx = 0
+    if workers <= 1:
+        init_generate_worker(*settings)
+        while True:
+            yield generate_chunk(get_chunk_seed(seed,chunk_inx),GENERATE_CHUNK_SIZE)
+            chunk_inx += 1
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,initializer=init_generate_worker,initargs=settings) as executor:
+        pending = collections.deque()
+        while True:
+            while len(pending) < workers * 2:
+                pending.append(executor.submit(generate_chunk,get_chunk_seed(seed,chunk_inx),GENERATE_CHUNK_SIZE))
+                chunk_inx += 1
+            yield pending.popleft().result()
+
+#end def iter_chunks
+
+# Yield count new words as (phonetic, spelled), skipping candidates that
+# collide with the existing forms or with words already generated.
+def iter_new_words(settings,seed,count,workers,existing_phonetic,existing_spelled):
+    if count <= 0:
+        return
+    written = 0
+    attempts = 0
+    chunks = iter_chunks(settings,seed,workers)
+    try:
+        for phonetic_list, spelled_list in chunks:
+            for phonetic, spelled in zip(phonetic_list,spelled_list):
+                phonetic_key = phonetic[1:]
+                spelled_key = spelled.lower()
+                if phonetic_key in existing_phonetic or spelled_key in existing_spelled:
+                    continue
+                existing_phonetic.add(phonetic_key)
+                existing_spelled.add(spelled_key)
+                yield phonetic, spelled
+                written += 1
+                if written >= count:
+                    return
+            attempts += len(phonetic_list)
+            if attempts >= count * MAX_ATTEMPT_FACTOR:
+                return
+    finally:
+        chunks.close()
+
+#end def iter_new_words
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
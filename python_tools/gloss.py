@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is used to gloss text written in a conlang.  Each word of the
+# text is annotated with its English glosses, which are found by stripping the
+# affixes from the word, so only the root lexicon is needed.
+#
+import sys
+import json
+import re
+from argparse import ArgumentParser
+from conlang_lib import derive_words, open_conlang_file
+from morphological_analyzer import MORPHOLOGICAL_ANALYZER
+
+# Anything that is not whitespace or punctuation is part of a word.
+TOKEN_PATTERN = re.compile(r'[^\s.,;:!?"()\[\]{}«»“”‘’¿¡]+')
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Gloss conlang text using the root lexicon")
+    cli.add_argument("-l","--languagefile", type=str, required=True, metavar="FILE_PATH", dest="language_file",
+        help='Conlang JSON file for the language of the text')
+    cli.add_argument("-i","--input", type=str, required=True, metavar="FILE_PATH", dest="input",
+        help='Text file to be glossed')
+    cli.add_argument("-o","--output", type=str, required=True, metavar="FILE_PATH", dest="output",
+        help='File where the glossed text will be placed')
+    cli.add_argument("--phonetic", action="store_true", default=False, dest="phonetic",
+        help='Indicates that the text is written phonetically rather than spelled')
+    arguments = cli.parse_args(argv)
+
+    # Read the JSON language data
+    with open_conlang_file(arguments.language_file) as ifp:
+        language_structure = json.load(ifp)
+
+    lexicon = language_structure['lexicon']
+    if not language_structure.get('derived',False) and 'derived_word_list' in language_structure:
+        lexicon = lexicon + derive_words(language_structure['derived_word_list'],
+                                         language_structure['derivational_affix_map'],
+                                         lexicon,
+                                         language_structure['affix_map'],
+                                         language_structure['sound_map_list'],
+                                         False)
+
+    analyzer = MORPHOLOGICAL_ANALYZER(lexicon,language_structure['affix_map'],language_structure['sound_map_list'])
+
+    with open(arguments.input,"r", encoding="utf-8-sig") as ifp, open(arguments.output,"wt", encoding="utf-8-sig") as ofp:
+        for line in ifp:
+            for token in TOKEN_PATTERN.findall(line):
+                ofp.write(token + '\t' + gloss_word(analyzer,token,arguments.phonetic) + '\n')
+            ofp.write('\n')
+
+#end def main
+
+# Build the gloss string for a single word.  Each analysis is given as the
+# English word, followed by its declensions, and analyses are separated by |.
+def gloss_word(analyzer,word,phonetic=False):
+    glosses = []
+    for root, declensions in analyzer.analyze(word,phonetic):
+        gloss = root.english.strip()
+        if declensions != ['root']:
+            gloss += '-' + '.'.join(declensions)
+        if gloss not in glosses:
+            glosses.append(gloss)
+    if len(glosses) == 0:
+        return '?'
+    return ' | '.join(glosses)
+
+#end def gloss_word
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
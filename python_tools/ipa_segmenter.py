@@ -0,0 +1,115 @@
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file contains the grapheme segmenter shared by the tools.  It splits IPA
+# (or romanized) strings into clusters of a base character followed by any
+# combining marks and length marks, with a tie bar joining the next base
+# character into the same cluster, so that t͡ʃ, aː, and ẽ each stay in one
+# piece.
+#
+# The codepoint classes are precomputed as ranges and compiled into a single
+# regular expression, so each string is segmented by one call into the re
+# module instead of examining its characters one at a time in Python.
+#
+import re
+
+# Codepoint ranges of the combining marks.
+COMBINING_MARK_RANGES = [
+    (0x0300, 0x036F),   # Combining Diacritical Marks
+    (0x0483, 0x0489),   # Combining Cyrillic
+    (0x1AB0, 0x1AFF),   # Combining Diacritical Marks Extended
+    (0x1DC0, 0x1DFF),   # Combining Diacritical Marks Supplement
+    (0x20D0, 0x20FF),   # Combining Diacritical Marks for Symbols
+    (0xFE20, 0xFE2F),   # Combining Half Marks
+]
+
+# Tie bars are combining marks that also join the following base character.
+TIE_BARS = ['͡', '͜']
+
+# IPA length marks, which are spacing characters but belong to the sound before.
+LENGTH_MARKS = ['ː', 'ˑ']
+
+# Build a regular expression character class body from a list of codepoint
+# ranges and single characters.
+def build_character_class(ranges, chars=[]):
+    class_body = ''
+    for start, end in ranges:
+        class_body += re.escape(chr(start)) + '-' + re.escape(chr(end))
+    for char in chars:
+        class_body += re.escape(char)
+    return class_body
+
+#end def build_character_class
+
+# The order of the combining marks in the lexical order.  A mark's value is
+# its position in this list plus one, so the value stays below the 100 between
+# two letters and a marked letter sorts after the plain one and before the next
+# letter.  The marks of the Combining Diacritical Marks block come in code
+# order, and the last value is shared by the rest of that block and the marks
+# of the other blocks.
+COMBINING_MARK_ORDER = [chr(code) for code in range(0x0300, 0x0362)]
+COMBINING_MARK_RANKS = {mark: rank + 1 for rank, mark in enumerate(COMBINING_MARK_ORDER)}
+COMBINING_MARK_LAST_RANK = len(COMBINING_MARK_ORDER) + 1
+
+COMBINING_MARK_CLASS = build_character_class(COMBINING_MARK_RANGES)
+TIE_BAR_CLASS = build_character_class([], TIE_BARS)
+MODIFIER_CLASS = build_character_class(COMBINING_MARK_RANGES, LENGTH_MARKS)
+
+# A cluster is any one character followed by modifiers, where a tie bar may be
+# followed by another base character.  A modifier at the start of a string has
+# no base, so it becomes a cluster of its own.
+GRAPHEME_PATTERN = re.compile('.(?:(?:[' + TIE_BAR_CLASS + '])[^' + MODIFIER_CLASS + ']?|[' + MODIFIER_CLASS + '])*', re.DOTALL)
+COMBINING_MARK_PATTERN = re.compile('[' + COMBINING_MARK_CLASS + ']')
+
+# Split a string into its grapheme clusters.
+def segment_graphemes(text):
+    return GRAPHEME_PATTERN.findall(text)
+
+#end def segment_graphemes
+
+# Split each of a list of strings into grapheme clusters, returning a list of
+# cluster lists.
+def segment_graphemes_batch(texts):
+    findall = GRAPHEME_PATTERN.findall
+    return [findall(text) for text in texts]
+
+#end def segment_graphemes_batch
+
+# Get the set of distinct grapheme clusters used in a collection of strings.
+def grapheme_set(texts):
+    graphemes = set()
+    findall = GRAPHEME_PATTERN.findall
+    for text in texts:
+        graphemes.update(findall(text))
+    return graphemes
+
+#end def grapheme_set
+
+# Check whether a character is a combining mark.
+def is_combining_mark(char):
+    return COMBINING_MARK_PATTERN.match(char) is not None
+
+#end def is_combining_mark
+
+# Get the value a combining mark adds to the lexical value of a letter, from 1
+# to COMBINING_MARK_LAST_RANK, or 0 if the character is not a combining mark.
+def get_combining_mark_rank(char):
+    rank = COMBINING_MARK_RANKS.get(char)
+    if rank is not None:
+        return rank
+    if is_combining_mark(char):
+        return COMBINING_MARK_LAST_RANK
+    return 0
+
+#end def get_combining_mark_rank
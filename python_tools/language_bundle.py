@@ -0,0 +1,201 @@
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file contains the LANGUAGE_BUNDLE class, which reads a compiled language
+# bundle (see compile_language_bundle in conlang_lib) through mmap.  A bundle is
+# laid out as:
+#
+#     magic (8 bytes) | header length (uint32) | header JSON | sections
+#
+# The header holds the language structure without its lexicon, the hash of the
+# source Conlang JSON file, and the offset and length of each section, with the
+# offsets counted from the end of the header aligned to 8 bytes.  The sections
+# are arrays of uint32 (or uint8 for the flags) aligned to 8 bytes:
+#
+#     string_offsets, string_data    The string pool
+#     phonetic, spelled, english,    One string number per lexicon entry
+#     part_of_speech, metadata
+#     flags                          1 = derived word, 2 = declined word
+#     declension_offsets,            The declensions of each entry
+#     declension_ids
+#     lexical_order                  Entry numbers in lexical order
+#     <index>_keys, <index>_entries  Entry numbers sorted by a key string, for
+#                                    the english, spelled, and phonetic indexes
+#
+# Nothing is parsed or copied when a bundle is opened except the header.
+#
+import sys
+import mmap
+import json
+import struct
+from array import array
+from lexicon_entry import LEXICON_ENTRY
+
+BUNDLE_MAGIC = b'CJBUNDL1'
+BUNDLE_VERSION = 1
+BUNDLE_ALIGNMENT = 8
+
+# The typecode of an unsigned 32 bit array.
+if array('I').itemsize == 4:
+    UINT32 = 'I'
+else:
+    UINT32 = 'L'
+
+BUNDLE_INDEXES = ['english','spelled','phonetic']
+
+# LANGUAGE_BUNDLE Class
+class LANGUAGE_BUNDLE:
+    def __init__(self, bundle_file):
+        self.bundle_file = bundle_file
+        self.file = open(bundle_file,'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise
+        self.open_view(memoryview(self.map),bundle_file)
+
+    # Read the header of a bundle held in a buffer and find its sections.
+    def open_view(self, view, bundle_name):
+        self.view = view
+        self.header = LANGUAGE_BUNDLE.read_header(self.view)
+        if self.header is None:
+            self.close()
+            print("ERROR: " + bundle_name + " is not a language bundle")
+            exit()
+        self.sections = {}
+        for name in self.header['sections']:
+            offset, length, typecode = self.header['sections'][name]
+            offset += self.header['data_offset']
+            section = self.view[offset:offset+length*struct.calcsize(typecode)]
+            if typecode != 'B':
+                section = section.cast(typecode)
+            self.sections[name] = section
+        self.language_structure = None
+
+    # Read and check the header of a bundle from the start of a buffer,
+    # returning None if it is not a bundle this version can read.
+    @staticmethod
+    def read_header(buffer):
+        if len(buffer) < len(BUNDLE_MAGIC) + 4 or bytes(buffer[0:len(BUNDLE_MAGIC)]) != BUNDLE_MAGIC:
+            return None
+        header_length = struct.unpack_from('<I',buffer,len(BUNDLE_MAGIC))[0]
+        start = len(BUNDLE_MAGIC) + 4
+        header = json.loads(bytes(buffer[start:start+header_length]).decode('utf-8'))
+        if header.get('version') != BUNDLE_VERSION or header.get('byteorder') != sys.byteorder:
+            return None
+        header['data_offset'] = get_aligned_offset(start + header_length)
+        return header
+    #end def read_header
+
+    # Read just the header of a bundle file, returning None if the file is not
+    # a bundle this version can read.
+    @staticmethod
+    def read_header_file(bundle_file):
+        try:
+            with open(bundle_file,'rb') as ifp:
+                start = ifp.read(len(BUNDLE_MAGIC) + 4)
+                if len(start) < len(BUNDLE_MAGIC) + 4:
+                    return None
+                header_length = struct.unpack_from('<I',start,len(BUNDLE_MAGIC))[0]
+                return LANGUAGE_BUNDLE.read_header(start + ifp.read(header_length))
+        except (OSError, ValueError):
+            return None
+    #end def read_header_file
+
+    def close(self):
+        self.sections = {}
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.header['entry_count']
+
+    def __iter__(self):
+        for inx in range(len(self)):
+            yield self.get_entry(inx)
+
+    # The language structure without its lexicon, in the same form as the
+    # Conlang JSON object.
+    def get_language(self):
+        if self.language_structure is None:
+            self.language_structure = self.header['language']
+            self.language_structure['lexicon'] = []
+        return self.language_structure
+
+    def get_string(self, string_id):
+        return self.get_string_bytes(string_id).decode('utf-8')
+
+    def get_string_bytes(self, string_id):
+        string_offsets = self.sections['string_offsets']
+        return bytes(self.sections['string_data'][string_offsets[string_id]:string_offsets[string_id+1]])
+
+    def get_declensions(self, inx):
+        declension_offsets = self.sections['declension_offsets']
+        declension_ids = self.sections['declension_ids']
+        return [self.get_string(declension_ids[pos]) for pos in range(declension_offsets[inx],declension_offsets[inx+1])]
+
+    # Get one lexicon entry as a LEXICON_ENTRY.
+    def get_entry(self, inx):
+        flags = self.sections['flags'][inx]
+        return LEXICON_ENTRY(self.get_string(self.sections['phonetic'][inx]),
+                             self.get_string(self.sections['spelled'][inx]),
+                             self.get_string(self.sections['english'][inx]),
+                             self.get_string(self.sections['part_of_speech'][inx]),
+                             self.get_declensions(inx),
+                             derived_word=bool(flags & 1),
+                             declined_word=bool(flags & 2),
+                             metadata=json.loads(self.get_string(self.sections['metadata'][inx])))
+
+    # Yield the lexicon entries in lexical order.
+    def iter_lexical(self):
+        for inx in self.sections['lexical_order']:
+            yield self.get_entry(inx)
+
+    # Get the numbers of the entries whose key in an index equals key, using a
+    # binary search of the index.  UTF-8 sorts in the same order as the code
+    # points, so the keys are compared without decoding them.
+    def lookup(self, index_name, key):
+        keys = self.sections[index_name + '_keys']
+        entries = self.sections[index_name + '_entries']
+        key = key.encode('utf-8')
+        low = 0
+        high = len(keys)
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_string_bytes(keys[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < len(keys) and self.get_string_bytes(keys[low]) == key:
+            found.append(entries[low])
+            low += 1
+        return found
+    #end def lookup
+
+# End of LANGUAGE_BUNDLE
+
+# Round an offset up to the alignment of the bundle sections.
+def get_aligned_offset(offset):
+    return (offset + BUNDLE_ALIGNMENT - 1) // BUNDLE_ALIGNMENT * BUNDLE_ALIGNMENT
+
+#end def get_aligned_offset
@@ -15,11 +15,12 @@
 # Definition of the LEXICON_ENTRY used throughout the Python code for working with
 # the Conlang JSON object.
 #
-import pdb
+from ipa_segmenter import segment_graphemes, get_combining_mark_rank
 
 # LEXICON_ENTRY Class
 class LEXICON_ENTRY:
     lexical_order_list = ['a b c d e f g h i j k l m n o p q r s t u v w k y z'.split()]
+    lexical_value_cache = {}
     def __init__(self, phonetic, spelled, english='', part_of_speech='', declension=[], derived_word=False, declined_word=False, metadata={}):
         self.phonetic = phonetic
         self.spelled = spelled
@@ -77,44 +78,38 @@ class LEXICON_ENTRY:
     @staticmethod
     def set_lexical_order_list(in_lexical_order_list):
         LEXICON_ENTRY.lexical_order_list = in_lexical_order_list
+        LEXICON_ENTRY.lexical_value_cache = {}
     
     @staticmethod
     def lexical_index(in_item):
         item = in_item.lower()
         lexical_inx = 0
         char_pos = 0
-        while char_pos < len(item):
-            char_inx = -char_pos
-            if char_pos < len(item) - 2:
-                nextchar = item[char_pos+1:char_pos+2]
-                charint = int(nextchar.encode('utf-16-be').hex(),base=16) & 0x0000ffff
-                if (charint >= 0x0300) and (charint <= 0x036f):
-                    char = item[char_pos:char_pos+2]
-                    char_pos += 2
-                else:
-                    char = item[char_pos:char_pos+1]
-                    char_pos += 1
-            else:
-                char = item[char_pos:char_pos+1]
-                char_pos += 1
-                
+        for char in segment_graphemes(item):
             if char != 'ˈ' and char != ' ':
-                lexical_inx += LEXICON_ENTRY.lexical_value(char) * (100 ** char_inx)
+                lexical_inx += LEXICON_ENTRY.lexical_value(char) * (100 ** -char_pos)
+            char_pos += len(char)
         return lexical_inx
     #end def lexical_index
 
+    # The value of a grapheme cluster in the lexical order.  A combining mark
+    # after the base character orders the cluster after the plain character
+    # and before the next one.
     @staticmethod
     def lexical_value(char):
-        char_base = char[0:1]
+        lexval = LEXICON_ENTRY.lexical_value_cache.get(char)
+        if lexval is not None:
+            return lexval
         
+        char_base = char[0:1]
         if char_base in LEXICON_ENTRY.lexical_order_list:
             lexval = LEXICON_ENTRY.lexical_order_list.index(char_base) * 100
             if len(char) > 1:
-                diacritic = char[1:]
-                lexval += round((float(int(diacritic.encode('utf-16-be').hex(),base=16) & 0x0000ffff) - 768.0))
+                lexval += get_combining_mark_rank(char[1])
         else:
             lexval = len(LEXICON_ENTRY.lexical_order_list) + 1
-            
+        
+        LEXICON_ENTRY.lexical_value_cache[char] = lexval
         return lexval
 
 # End of LEXICON_ENTRY
\ No newline at end of file
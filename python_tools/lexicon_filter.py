@@ -0,0 +1,195 @@
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file contains the LEXICON_FILTER class, which selects the lexicon
+# entries of a language by part of speech, declensions, the derived_word and
+# declined_word flags, and regular expressions on the spelled and phonetic
+# forms.  The checks are compiled once, cheapest first, and the result of
+# each check on a part of speech or form is remembered, since most of them
+# repeat many times in a lexicon.
+#
+# The filter is pushed down as far as the source of the lexicon allows:
+#
+#     Sharded language      Shards whose part of speech cannot match are never
+#                           read.
+#     Language bundle       The checks run on the bundle's columns of string
+#                           numbers and flags, so only the entries that match
+#                           are ever built.
+#     Conlang JSON file     Each entry is decoded and then checked, since the
+#                           C JSON decoder finds the end of an entry faster
+#                           than any scan of the text done in Python.
+#
+import os
+import re
+from conlang_lib import part_of_speech_matches, read_conlang_json_header, iter_conlang_lexicon, read_shard_manifest, \
+                        open_language_bundle, SHARD_MANIFEST_FILE
+
+# LEXICON_FILTER Class
+class LEXICON_FILTER:
+    def __init__(self, part_of_speech=None, declensions=[], without_declensions=[], derived_word=None, declined_word=None,
+                 spelled=None, phonetic=None):
+        if isinstance(part_of_speech,str):
+            part_of_speech = [part_of_speech]
+        self.part_of_speech = part_of_speech
+        self.declensions = set(declensions)
+        self.without_declensions = set(without_declensions)
+        self.derived_word = derived_word
+        self.declined_word = declined_word
+        try:
+            self.spelled = re.compile(spelled) if spelled is not None else None
+            self.phonetic = re.compile(phonetic) if phonetic is not None else None
+        except re.error as error:
+            print("ERROR: invalid regular expression: " + str(error))
+            exit()
+        self.part_of_speech_results = {}
+        self.spelled_results = {}
+        self.phonetic_results = {}
+
+    # Check a part of speech, remembering the result.
+    def part_of_speech_matches(self, part_of_speech):
+        result = self.part_of_speech_results.get(part_of_speech)
+        if result is None:
+            result = any(part_of_speech_matches(part_of_speech,requested) for requested in self.part_of_speech)
+            self.part_of_speech_results[part_of_speech] = result
+        return result
+
+    # Check a form against a regular expression, remembering the result.
+    @staticmethod
+    def form_matches(pattern, results, form):
+        result = results.get(form)
+        if result is None:
+            result = pattern.search(form.strip()) is not None
+            results[form] = result
+        return result
+
+    # Check the flags of an entry.
+    def flags_match(self, derived_word, declined_word):
+        if self.derived_word is not None and bool(derived_word) != self.derived_word:
+            return False
+        if self.declined_word is not None and bool(declined_word) != self.declined_word:
+            return False
+        return True
+
+    # Check the declensions of an entry.
+    def declensions_match(self, declensions):
+        if len(self.declensions) > 0 and not self.declensions.issubset(declensions):
+            return False
+        if len(self.without_declensions) > 0 and not self.without_declensions.isdisjoint(declensions):
+            return False
+        return True
+
+    # Check a lexicon entry map.
+    def matches(self, entry):
+        if not self.flags_match(entry.get('derived_word',False),entry.get('declined_word',False)):
+            return False
+        if self.part_of_speech is not None and not self.part_of_speech_matches(entry['part_of_speech']):
+            return False
+        if not self.declensions_match(entry['declensions']):
+            return False
+        if self.spelled is not None and not LEXICON_FILTER.form_matches(self.spelled,self.spelled_results,entry['spelled']):
+            return False
+        if self.phonetic is not None and not LEXICON_FILTER.form_matches(self.phonetic,self.phonetic_results,entry['phonetic']):
+            return False
+        return True
+
+    # Check whether a shard listed in a shard manifest can hold any matching
+    # entries.
+    def shard_matches(self, shard):
+        if self.part_of_speech is not None and 'part_of_speech' in shard:
+            return self.part_of_speech_matches(shard['part_of_speech'])
+        return True
+
+    # Yield the numbers of the matching entries of a language bundle, in file
+    # order.  Each string in the bundle is decoded at most once, when a check
+    # first needs it.
+    def iter_bundle_matches(self, bundle):
+        sections = bundle.sections
+        flags = sections['flags']
+        part_of_speech_ids = sections['part_of_speech']
+        spelled_ids = sections['spelled']
+        phonetic_ids = sections['phonetic']
+        declension_offsets = sections['declension_offsets']
+        declension_ids = sections['declension_ids']
+        checks_declensions = len(self.declensions) > 0 or len(self.without_declensions) > 0
+        id_results = {'part_of_speech':{}, 'spelled':{}, 'phonetic':{}}
+        declension_names = {}
+
+        def id_matches(name, string_id, check):
+            results = id_results[name]
+            result = results.get(string_id)
+            if result is None:
+                result = check(bundle.get_string(string_id))
+                results[string_id] = result
+            return result
+
+        for inx in range(len(bundle)):
+            flag = flags[inx]
+            if not self.flags_match(flag & 1,flag & 2):
+                continue
+            if self.part_of_speech is not None and not id_matches('part_of_speech',part_of_speech_ids[inx],self.part_of_speech_matches):
+                continue
+            if checks_declensions:
+                declensions = set()
+                for pos in range(declension_offsets[inx],declension_offsets[inx+1]):
+                    string_id = declension_ids[pos]
+                    if string_id not in declension_names:
+                        declension_names[string_id] = bundle.get_string(string_id)
+                    declensions.add(declension_names[string_id])
+                if not self.declensions_match(declensions):
+                    continue
+            if self.spelled is not None and not id_matches('spelled',spelled_ids[inx],
+                                                           lambda form: self.spelled.search(form.strip()) is not None):
+                continue
+            if self.phonetic is not None and not id_matches('phonetic',phonetic_ids[inx],
+                                                            lambda form: self.phonetic.search(form.strip()) is not None):
+                continue
+            yield inx
+
+# End of LEXICON_FILTER
+
+# Read a language and the lexicon entry maps that pass a filter.  The input
+# may be a Conlang JSON file (compressed or not), or the directory of a
+# sharded language.  With use_bundle the language bundle of a Conlang JSON
+# file is used, and compiled first if it is missing or out of date.  Returns
+# the language structure without its lexicon and an iterator of the matching
+# entries, in file order.
+def read_filtered_language(input_file,lexicon_filter,use_bundle=False):
+    if os.path.isdir(input_file):
+        if not os.path.isfile(os.path.join(input_file,SHARD_MANIFEST_FILE)):
+            print("ERROR: " + input_file + " is not a sharded language, it has no " + SHARD_MANIFEST_FILE)
+            exit()
+        manifest = read_shard_manifest(input_file)
+        language_structure = read_conlang_json_header(os.path.join(input_file,manifest['header']))
+        shard_files = [os.path.join(input_file,shard['file']) for shard in manifest['shards'] if lexicon_filter.shard_matches(shard)]
+        lexicon = (entry for shard_file in shard_files for entry in iter_conlang_lexicon(shard_file) if lexicon_filter.matches(entry))
+    elif use_bundle:
+        bundle = open_language_bundle(input_file)
+        language_structure = dict(bundle.get_language())
+        lexicon = iter_bundle_lexicon(bundle,lexicon_filter)
+    else:
+        language_structure = read_conlang_json_header(input_file)
+        lexicon = (entry for entry in iter_conlang_lexicon(input_file) if lexicon_filter.matches(entry))
+    language_structure['lexicon'] = []
+    return language_structure, lexicon
+
+#end def read_filtered_language
+
+# Yield the matching entries of a language bundle as entry maps, closing the
+# bundle at the end.
+def iter_bundle_lexicon(bundle,lexicon_filter):
+    with bundle:
+        for inx in lexicon_filter.iter_bundle_matches(bundle):
+            yield bundle.get_entry(inx).as_map()
+
+#end def iter_bundle_lexicon
@@ -0,0 +1,326 @@
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file contains the functions that compare two versions of a Conlang JSON
+# file and build a patch that turns the old version into the new one, and the
+# functions that apply such a patch.  Neither lexicon is ever held in memory.
+#
+# The entries of both lexicons are reduced to (collation key, entry hash,
+# position) records, which are sorted with an external sort and merged, so an
+# entry of the new lexicon is matched with an identical entry of the old one
+# wherever each of them is.  The matches are then sorted by their position in
+# the new lexicon and the new lexicon is read once more to write the patch.
+#
+# A patch is a JSON lines file (compressed if its name ends in .gz, .xz, or
+# .bz2).  The first line describes the patch:
+#
+#     {"patch_version": 1, "old_sha256": ..., "new_sha256": ...,
+#      "old_entry_count": ..., "new_entry_count": ...,
+#      "header": {"set": {key: value}, "remove": [key], "order": [key]}}
+#
+# where the hashes are of the uncompressed text of the files and header holds
+# the fields of the header (everything but the lexicon) that were changed,
+# added, or removed, and the order of the new header's fields.  Each line after
+# that is one operation on the old lexicon, applied in order:
+#
+#     {"keep": n}         Copy the next n old entries
+#     {"remove": n}       Skip the next n old entries
+#     {"change": entry}   Skip the next old entry and write entry in its place
+#     {"add": entry}      Write entry
+#
+# The old lexicon is only read forward, so of the matched entries only the
+# longest run in the same order in both lexicons (the longest increasing
+# subsequence of their old positions) is kept, and the others, which moved,
+# are removed and added again at their new positions.
+#
+import os
+import json
+import bisect
+import hashlib
+import tempfile
+from array import array
+from lexicon_entry import LEXICON_ENTRY
+from external_sort import external_sort, DEFAULT_RUN_SIZE
+from conlang_lib import open_conlang_file, read_conlang_json_header, iter_conlang_lexicon, write_conlang_json
+
+PATCH_VERSION = 1
+
+# Get the key an entry is sorted and matched under: its collation key and the
+# fields LEXICON_ENTRY compares, followed by a hash of the whole entry.
+def get_entry_record_key(entry):
+    spelled = entry['spelled']
+    entry_hash = hashlib.blake2b(json.dumps(entry,sort_keys=True,ensure_ascii=False).encode('utf-8'),digest_size=16).digest()
+    return (LEXICON_ENTRY.lexical_index(spelled),spelled,entry['phonetic'],entry['english'],entry['part_of_speech'],
+            '\0'.join(entry['declensions']),entry_hash)
+
+#end def get_entry_record_key
+
+# Get the SHA-256 hash of the uncompressed text of a Conlang JSON file.
+def get_conlang_file_hash(input_file):
+    file_hash = hashlib.sha256()
+    with open_conlang_file(input_file,'rb') as ifp:
+        for block in iter(lambda: ifp.read(1048576),b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+#end def get_conlang_file_hash
+
+# Yield the sorted (key, position) records of a lexicon, counting the entries
+# in counts[count_name].
+def iter_sorted_records(input_file,counts,count_name,run_size=DEFAULT_RUN_SIZE,temp_dir=None,memory_limit=None):
+    def iter_records():
+        for inx, entry in enumerate(iter_conlang_lexicon(input_file)):
+            counts[count_name] = inx + 1
+            yield get_entry_record_key(entry), inx
+    return external_sort(iter_records(),key=lambda record: record,run_size=run_size,temp_dir=temp_dir,memory_limit=memory_limit)
+
+#end def iter_sorted_records
+
+# Merge the sorted records of the old and new lexicons, yielding a (new
+# position, old position) pair for each new entry with an identical old entry.
+# Identical entries are paired in the order of their positions.
+def iter_matches(old_records,new_records):
+    old_record = next(old_records,None)
+    for new_record in new_records:
+        while old_record is not None and old_record[0] < new_record[0]:
+            old_record = next(old_records,None)
+        if old_record is not None and old_record[0] == new_record[0]:
+            yield new_record[1], old_record[1]
+            old_record = next(old_records,None)
+
+#end def iter_matches
+
+# Compare the headers of two languages, returning the header part of a patch.
+def diff_headers(old_header,new_header):
+    header_patch = {'set':{}, 'remove':[], 'order':list(new_header.keys())}
+    for key in new_header:
+        if key != 'lexicon' and (key not in old_header or old_header[key] != new_header[key]):
+            header_patch['set'][key] = new_header[key]
+    for key in old_header:
+        if key not in new_header:
+            header_patch['remove'].append(key)
+    return header_patch
+
+#end def diff_headers
+
+# Compare two Conlang JSON files and write the patch that turns the old one
+# into the new one.  Returns the counts of each kind of operation.
+def diff_conlang_json(old_file,new_file,patch_file,run_size=DEFAULT_RUN_SIZE,temp_dir=None,memory_limit=None):
+    old_header = read_conlang_json_header(old_file)
+    new_header = read_conlang_json_header(new_file)
+
+    # Both lexicons are sorted with the old language's collation, since they
+    # must be sorted the same way to be merged.
+    saved_lexical_order_list = LEXICON_ENTRY.lexical_order_list
+    if 'lexical_order_list' in old_header:
+        LEXICON_ENTRY.set_lexical_order_list(old_header['lexical_order_list'])
+    try:
+        counts = {'keep':0, 'remove':0, 'change':0, 'add':0, 'old_entries':0, 'new_entries':0}
+        old_records = iter_sorted_records(old_file,counts,'old_entries',run_size,temp_dir,memory_limit)
+        new_records = iter_sorted_records(new_file,counts,'new_entries',run_size,temp_dir,memory_limit)
+        matches = external_sort(iter_matches(old_records,new_records),key=lambda match: match[0],
+                                run_size=run_size,temp_dir=temp_dir,memory_limit=memory_limit)
+        # The counts of the entries are only known once the records have been
+        # read, so the operations go to a temporary file first.
+        with tempfile.TemporaryFile('w+t',encoding='utf-8',dir=temp_dir) as operations_file:
+            write_patch_operations(iter_conlang_lexicon(new_file),matches,operations_file,counts)
+            patch_header = {
+                'patch_version':PATCH_VERSION,
+                'old_sha256':get_conlang_file_hash(old_file),
+                'new_sha256':get_conlang_file_hash(new_file),
+                'old_entry_count':counts['old_entries'],
+                'new_entry_count':counts['new_entries'],
+                'header':diff_headers(old_header,new_header),
+            }
+            with open_conlang_file(patch_file,'wt',encoding='utf-8') as ofp:
+                ofp.write(json.dumps(patch_header,ensure_ascii=False) + '\n')
+                operations_file.seek(0)
+                for line in operations_file:
+                    ofp.write(line)
+    finally:
+        LEXICON_ENTRY.set_lexical_order_list(saved_lexical_order_list)
+    return counts
+
+#end def diff_conlang_json
+
+# Yield the matches, sorted by new position, whose old positions make up the
+# longest increasing subsequence of old positions, so that moving a few
+# entries only removes and adds those entries.  This is a patience sort: the
+# last match of the best increasing run of each length found so far is kept,
+# along with the match before each match in its run, so only the positions of
+# the matches are held in memory.
+def iter_increasing_matches(matches):
+    new_positions = array('q')
+    old_positions = array('q')
+    previous = array('q')
+    tail_old = []
+    tail_match = []
+    for new_inx, old_inx in matches:
+        match_inx = len(new_positions)
+        new_positions.append(new_inx)
+        old_positions.append(old_inx)
+        length = bisect.bisect_left(tail_old,old_inx)
+        previous.append(tail_match[length - 1] if length > 0 else -1)
+        if length == len(tail_old):
+            tail_old.append(old_inx)
+            tail_match.append(match_inx)
+        else:
+            tail_old[length] = old_inx
+            tail_match[length] = match_inx
+
+    increasing = array('q',bytes(8 * len(tail_match)))
+    match_inx = tail_match[-1] if len(tail_match) > 0 else -1
+    for length in range(len(tail_match) - 1,-1,-1):
+        increasing[length] = match_inx
+        match_inx = previous[match_inx]
+    for match_inx in increasing:
+        yield new_positions[match_inx], old_positions[match_inx]
+
+#end def iter_increasing_matches
+
+# Write the operations of a patch, walking the new lexicon in order with the
+# matches sorted by new position.  Only the matches in the same order in both
+# lexicons are kept.  The old entries skipped over between two kept entries
+# are removed, or changed into the new entries in between.
+def write_patch_operations(new_lexicon,matches,ofp,counts):
+    matches = iter_increasing_matches(matches)
+    state = {'cursor':0, 'keep':0, 'remove':0, 'add':[]}
+
+    def write_operation(operation,value):
+        ofp.write(json.dumps({operation:value},ensure_ascii=False) + '\n')
+
+    def flush():
+        if state['keep'] > 0:
+            write_operation('keep',state['keep'])
+            counts['keep'] += state['keep']
+            state['keep'] = 0
+        changes = min(state['remove'],len(state['add']))
+        for entry in state['add'][:changes]:
+            write_operation('change',entry)
+        if state['remove'] > changes:
+            write_operation('remove',state['remove'] - changes)
+        for entry in state['add'][changes:]:
+            write_operation('add',entry)
+        counts['change'] += changes
+        counts['remove'] += state['remove'] - changes
+        counts['add'] += len(state['add']) - changes
+        state['remove'] = 0
+        state['add'] = []
+
+    # Both lexicons have been read, and counted, by the time the first match
+    # comes out of the sort.
+    match = next(matches,None)
+    for new_inx, entry in enumerate(new_lexicon):
+        if match is not None and match[0] == new_inx:
+            old_inx = match[1]
+            match = next(matches,None)
+            if old_inx >= state['cursor']:
+                if old_inx > state['cursor'] or len(state['add']) > 0:
+                    if state['keep'] > 0:
+                        flush()
+                    state['remove'] += old_inx - state['cursor']
+                    flush()
+                state['keep'] += 1
+                state['cursor'] = old_inx + 1
+                continue
+        if state['keep'] > 0:
+            flush()
+        state['add'].append(entry)
+
+    # Whatever is left of the old lexicon is removed.
+    if state['keep'] > 0:
+        flush()
+    state['remove'] += counts['old_entries'] - state['cursor']
+    flush()
+
+#end def write_patch_operations
+
+# Read the header line of a patch file.
+def read_patch_header(ifp,patch_file):
+    try:
+        patch_header = json.loads(ifp.readline())
+    except json.JSONDecodeError:
+        patch_header = None
+    if not isinstance(patch_header,dict) or patch_header.get('patch_version') != PATCH_VERSION:
+        print("ERROR: " + patch_file + " is not a Conlang JSON patch this version can apply")
+        exit()
+    return patch_header
+
+#end def read_patch_header
+
+# Apply the header part of a patch to the header of the old language.
+def apply_header_patch(old_header,header_patch):
+    new_header = {}
+    for key in header_patch['order']:
+        if key in header_patch['set']:
+            new_header[key] = header_patch['set'][key]
+        elif key == 'lexicon':
+            new_header[key] = []
+        else:
+            new_header[key] = old_header[key]
+    return new_header
+
+#end def apply_header_patch
+
+# Yield the entries of the new lexicon from the old lexicon and the operations
+# of a patch.
+def iter_patched_lexicon(old_lexicon,operations,patch_file):
+    old_lexicon = iter(old_lexicon)
+    for line_number, line in enumerate(operations,2):
+        operation = json.loads(line)
+        if 'keep' in operation or 'remove' in operation or 'change' in operation:
+            count = operation.get('keep',operation.get('remove',1))
+            for inx in range(count):
+                old_entry = next(old_lexicon,None)
+                if old_entry is None:
+                    print("ERROR: line " + str(line_number) + " of " + patch_file + " goes past the end of the old lexicon")
+                    exit()
+                if 'keep' in operation:
+                    yield old_entry
+            if 'change' in operation:
+                yield operation['change']
+        elif 'add' in operation:
+            yield operation['add']
+        else:
+            print("ERROR: unknown operation on line " + str(line_number) + " of " + patch_file)
+            exit()
+
+#end def iter_patched_lexicon
+
+# Apply a patch to an old Conlang JSON file, writing the new one.  The output
+# may be the old file, which is only replaced once the new file is complete.
+# Returns False if the new file does not have the hash the patch expects,
+# which happens when the old file was written with different formatting.
+def apply_conlang_patch(old_file,patch_file,output_file,verify=True):
+    with open_conlang_file(patch_file,encoding='utf-8') as ifp:
+        patch = read_patch_header(ifp,patch_file)
+        if verify and get_conlang_file_hash(old_file) != patch['old_sha256']:
+            print("ERROR: " + old_file + " is not the file the patch " + patch_file + " was made from")
+            exit()
+        new_header = apply_header_patch(read_conlang_json_header(old_file),patch['header'])
+
+        output_directory = os.path.dirname(os.path.abspath(output_file))
+        ofd, temp_file = tempfile.mkstemp(dir=output_directory,suffix='.tmp' + os.path.splitext(output_file)[1])
+        os.close(ofd)
+        try:
+            with open_conlang_file(temp_file,'wt') as ofp:
+                write_conlang_json(new_header,iter_patched_lexicon(iter_conlang_lexicon(old_file),ifp,patch_file),ofp)
+            os.chmod(temp_file,os.stat(old_file).st_mode & 0o777)
+            os.replace(temp_file,output_file)
+        except BaseException:
+            os.remove(temp_file)
+            raise
+    return get_conlang_file_hash(output_file) == patch['new_sha256']
+
+#end def apply_conlang_patch
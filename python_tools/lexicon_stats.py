@@ -0,0 +1,373 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program reports statistics on the lexicon of a Conlang JSON file and on
+# corpora of sentences in the language (such as the output of not_madlibs.py):
+#
+#     Phonetic forms    Segment frequency, frequency of each class of sound
+#                       (from get_ipa_symbol_map), segments not in the
+#                       language's phoneme_inventory, word lengths in segments,
+#                       syllable counts, and stress marks per word
+#     Spelled forms     Grapheme frequency and word lengths, for the lexicon
+#                       and for each corpus
+#     Affixes           The number of forms and of distinct words each
+#                       declension appears on, and the number of derived word
+#                       rules using each derivational affix
+#
+# A syllable is counted for each run of vowels, with ˈ, ˌ, and . ending a run,
+# so a stress mark between two vowels separates their syllables.
+#
+# The forms are read in chunks.  Each chunk is split into grapheme clusters,
+# which are numbered, and the statistics are taken from the resulting arrays of
+# numbers with NumPy, so memory use depends on the chunk size and the number of
+# distinct clusters, words, and declensions rather than on the number of forms.
+# Requires NumPy.
+#
+import sys
+import re
+import csv
+import json
+import itertools
+import numpy
+from argparse import ArgumentParser
+from conlang_lib import read_conlang_json_header, iter_conlang_lexicon, open_conlang_file, get_ipa_symbol_map
+from ipa_segmenter import segment_graphemes_batch
+from derivation_engine import DERIVATION_ENGINE
+
+# Number of forms read into each chunk by default.
+DEFAULT_STATS_CHUNK_SIZE = 100000
+
+STRESS_MARKS = ['ˈ','ˌ']
+SYLLABLE_BREAKS = STRESS_MARKS + ['.']
+
+# Characters that separate the words of a corpus.
+CORPUS_WORD_SEPARATOR = re.compile(r'[\s.,;:!?¡¿"“”„«»()\[\]{}]+')
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Report statistics on a Conlang JSON lexicon and corpora")
+    cli.add_argument("-i","--input", type=str, metavar="FILE_PATH", required=True, dest="input",
+        help="Conlang JSON file of the language")
+    cli.add_argument("-c","--corpus", type=str, metavar="FILE_PATH", action="append", required=False, default=[], dest="corpora",
+        help="Text file of sentences in the language.  May be given more than once")
+    cli.add_argument("-o","--output", type=str, metavar="FILE_PATH", required=True, dest="output",
+        help="File where the report will be placed")
+    cli.add_argument("--format", type=str, required=False, default='json', choices=['json','csv'], dest="format",
+        help="Write the report as JSON, or as CSV rows of section, key, and values.  Default is json")
+    cli.add_argument("--chunk-size", type=int, required=False, default=DEFAULT_STATS_CHUNK_SIZE, dest="chunk_size",
+        help="Number of forms read and counted at a time.  Default is " + str(DEFAULT_STATS_CHUNK_SIZE))
+    arguments = cli.parse_args(argv)
+
+    language_structure = read_conlang_json_header(arguments.input)
+
+    phonetic_stats = FORM_STATS(get_phonetic_classes(language_structure))
+    spelled_stats = FORM_STATS()
+    affix_stats = AFFIX_STATS()
+    for chunk in iter_chunks(iter_conlang_lexicon(arguments.input),arguments.chunk_size):
+        phonetic_stats.add_forms([entry['phonetic'].strip() for entry in chunk])
+        spelled_stats.add_forms([entry['spelled'].strip().lower() for entry in chunk])
+        affix_stats.add_entries(chunk)
+
+    report = {
+        'language':language_structure.get('english_name',''),
+        'phonetic':phonetic_stats.get_report(),
+        'spelled':spelled_stats.get_report(),
+        'declensions':affix_stats.get_report(),
+        'derivational_affixes':get_derivational_affix_counts(language_structure),
+        'corpora':{},
+    }
+    inventory = set(language_structure.get('phoneme_inventory',[]))
+    report['phonetic']['not_in_inventory'] = [segment for segment in report['phonetic']['segments']
+                                              if len(inventory) > 0 and segment not in inventory]
+
+    for corpus_file in arguments.corpora:
+        corpus_stats = FORM_STATS()
+        for chunk in iter_chunks(iter_corpus_words(corpus_file),arguments.chunk_size):
+            corpus_stats.add_forms(chunk)
+        report['corpora'][corpus_file] = corpus_stats.get_report()
+
+    if arguments.format == 'csv':
+        with open(arguments.output,"w", newline='', encoding="utf-8-sig") as ofp:
+            write_csv_report(report,csv.writer(ofp))
+    else:
+        with open(arguments.output,"wt", encoding="utf-8-sig") as ofp:
+            json.dump(report, ofp, ensure_ascii=False, indent=4)
+
+#end def main
+
+# Yield the items of an iterable in lists of chunk_size.
+def iter_chunks(iterable,chunk_size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator,chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+#end def iter_chunks
+
+# Yield the lower case words of a corpus file.
+def iter_corpus_words(corpus_file):
+    with open_conlang_file(corpus_file) as ifp:
+        for line in ifp:
+            for word in CORPUS_WORD_SEPARATOR.split(line.lower()):
+                if word != '':
+                    yield word
+
+#end def iter_corpus_words
+
+# Get the class of each sound in get_ipa_symbol_map, with the language's
+# phonetic_inventory taking precedence, and the stress marks and syllable
+# break given classes of their own.
+def get_phonetic_classes(language_structure):
+    classes = {}
+    for sound_class, symbols in get_ipa_symbol_map().items():
+        for symbol in symbols:
+            classes.setdefault(symbol,sound_class)
+    for sound_class, symbols in language_structure.get('phonetic_inventory',{}).items():
+        if sound_class == 'v_diphthongs':
+            sound_class = 'vowels'
+        for symbol in symbols:
+            classes[symbol] = sound_class
+    for symbol in STRESS_MARKS:
+        classes[symbol] = 'stress'
+    classes['.'] = 'syllable_break'
+    return classes
+
+#end def get_phonetic_classes
+
+# Grow a count array to at least size entries.
+def grow_counts(counts,size):
+    if len(counts) >= size:
+        return counts
+    return numpy.concatenate((counts,numpy.zeros(size - len(counts),dtype=counts.dtype)))
+
+#end def grow_counts
+
+# Add an array of counts to a running total, growing the total if needed.
+def add_counts(total,counts):
+    total = grow_counts(total,len(counts))
+    total[:len(counts)] += counts
+    return total
+
+#end def add_counts
+
+# FORM_STATS Class
+#
+# Counts the grapheme clusters of a set of forms and the lengths of the forms.
+# Each distinct cluster is given a number, and the classes of the clusters
+# (when classes is given) are kept in arrays indexed by those numbers.
+class FORM_STATS:
+    def __init__(self, classes=None):
+        self.classes = classes
+        self.cluster_ids = {}
+        self.clusters = []
+        self.class_names = []
+        self.class_ids = {}
+        self.cluster_class = numpy.zeros(0,dtype=numpy.int32)
+        self.cluster_is_vowel = numpy.zeros(0,dtype=bool)
+        self.cluster_is_break = numpy.zeros(0,dtype=bool)
+        self.cluster_is_stress = numpy.zeros(0,dtype=bool)
+        self.cluster_counts = numpy.zeros(0,dtype=numpy.int64)
+        self.length_counts = numpy.zeros(0,dtype=numpy.int64)
+        self.syllable_counts = numpy.zeros(0,dtype=numpy.int64)
+        self.stress_counts = numpy.zeros(0,dtype=numpy.int64)
+        self.form_count = 0
+
+    # Number the clusters not seen before and record their classes.
+    def add_clusters(self, new_clusters):
+        self.clusters += new_clusters
+        classes = []
+        for cluster in new_clusters:
+            sound_class = self.get_class(cluster)
+            if sound_class not in self.class_ids:
+                self.class_ids[sound_class] = len(self.class_names)
+                self.class_names.append(sound_class)
+            classes.append(self.class_ids[sound_class])
+        self.cluster_class = numpy.concatenate((self.cluster_class,numpy.array(classes,dtype=numpy.int32)))
+        self.cluster_is_vowel = numpy.concatenate((self.cluster_is_vowel,numpy.array([self.get_class(cluster) == 'vowels' for cluster in new_clusters],dtype=bool)))
+        self.cluster_is_break = numpy.concatenate((self.cluster_is_break,numpy.array([cluster in SYLLABLE_BREAKS for cluster in new_clusters],dtype=bool)))
+        self.cluster_is_stress = numpy.concatenate((self.cluster_is_stress,numpy.array([cluster in STRESS_MARKS for cluster in new_clusters],dtype=bool)))
+
+    # Get the class of a cluster from its first character, or 'other'.
+    def get_class(self, cluster):
+        if self.classes is None:
+            return 'other'
+        return self.classes.get(cluster,self.classes.get(cluster[0:1],'other'))
+
+    # Count a chunk of forms.
+    def add_forms(self, forms):
+        segmented = segment_graphemes_batch(forms)
+        cluster_ids = self.cluster_ids
+        new_clusters = []
+        for clusters in segmented:
+            for cluster in clusters:
+                if cluster not in cluster_ids:
+                    cluster_ids[cluster] = len(cluster_ids)
+                    new_clusters.append(cluster)
+        if len(new_clusters) > 0:
+            self.add_clusters(new_clusters)
+
+        sizes = numpy.fromiter((len(clusters) for clusters in segmented),dtype=numpy.int64,count=len(segmented))
+        total = int(sizes.sum())
+        codes = numpy.fromiter((cluster_ids[cluster] for clusters in segmented for cluster in clusters),dtype=numpy.int32,count=total)
+        form_index = numpy.repeat(numpy.arange(len(forms)),sizes)
+        self.form_count += len(forms)
+
+        # The stress marks and syllable breaks are counted separately from
+        # the other clusters and are not part of a form's length.
+        is_break = self.cluster_is_break[codes]
+        is_stress = self.cluster_is_stress[codes]
+        self.cluster_counts = add_counts(self.cluster_counts,numpy.bincount(codes,minlength=len(self.clusters)))
+        lengths = numpy.bincount(form_index,weights=~is_break,minlength=len(forms)).astype(numpy.int64)
+        self.length_counts = add_counts(self.length_counts,numpy.bincount(lengths))
+        stresses = numpy.bincount(form_index,weights=is_stress,minlength=len(forms)).astype(numpy.int64)
+        self.stress_counts = add_counts(self.stress_counts,numpy.bincount(stresses))
+
+        # A syllable starts at each vowel that does not follow another vowel
+        # of the same form.
+        if self.classes is not None:
+            is_vowel = self.cluster_is_vowel[codes]
+            follows_vowel = numpy.zeros(total,dtype=bool)
+            follows_vowel[1:] = is_vowel[:-1]
+            starts = numpy.cumsum(sizes) - sizes
+            follows_vowel[starts[sizes > 0]] = False
+            syllables = numpy.bincount(form_index,weights=is_vowel & ~follows_vowel,minlength=len(forms)).astype(numpy.int64)
+            self.syllable_counts = add_counts(self.syllable_counts,numpy.bincount(syllables))
+
+    # Get the report on the forms counted, with the clusters from most to
+    # least frequent and the histograms as {value: count}.
+    def get_report(self):
+        is_counted = ~self.cluster_is_break
+        order = numpy.argsort(-self.cluster_counts,kind='stable')
+        report = {
+            'forms':self.form_count,
+            'segments':{self.clusters[inx]:int(self.cluster_counts[inx]) for inx in order if is_counted[inx]},
+            'length':get_histogram(self.length_counts),
+        }
+        if self.classes is not None:
+            class_counts = numpy.bincount(self.cluster_class,weights=self.cluster_counts,minlength=len(self.class_names))
+            report['classes'] = {self.class_names[inx]:int(class_counts[inx]) for inx in numpy.argsort(-class_counts,kind='stable')}
+            report['syllables'] = get_histogram(self.syllable_counts)
+            report['stress_marks'] = get_histogram(self.stress_counts)
+        lengths = numpy.arange(len(self.length_counts))
+        if self.form_count > 0:
+            report['mean_length'] = float((lengths * self.length_counts).sum() / self.form_count)
+        return report
+
+# End of FORM_STATS
+
+# Convert an array of counts indexed by value into {value: count}, leaving out
+# the values with no count.
+def get_histogram(counts):
+    return {str(value):int(counts[value]) for value in numpy.nonzero(counts)[0]}
+
+#end def get_histogram
+
+# AFFIX_STATS Class
+#
+# Counts the declined forms with each declension and the distinct words they
+# were declined from, which is kept as a table of flags with a row for each
+# word and a column for each declension.
+class AFFIX_STATS:
+    def __init__(self):
+        self.declension_ids = {}
+        self.word_ids = {}
+        self.form_counts = numpy.zeros(0,dtype=numpy.int64)
+        self.word_flags = numpy.zeros((0,0),dtype=bool)
+
+    def get_id(self, ids, key):
+        inx = ids.get(key)
+        if inx is None:
+            inx = len(ids)
+            ids[key] = inx
+        return inx
+
+    # Count a chunk of lexicon entries.
+    def add_entries(self, entries):
+        declension_codes = []
+        word_codes = []
+        for entry in entries:
+            if not entry.get('declined_word',False):
+                continue
+            source = entry.get('metadata',{}).get('source',{})
+            word = source.get('declined_word',{}) if isinstance(source,dict) else {}
+            word_id = self.get_id(self.word_ids,(word.get('phonetic',''),word.get('english',entry['english']),entry['part_of_speech']))
+            for declension in entry['declensions']:
+                declension_codes.append(self.get_id(self.declension_ids,declension))
+                word_codes.append(word_id)
+        if len(declension_codes) == 0:
+            return
+
+        declension_codes = numpy.array(declension_codes,dtype=numpy.int64)
+        word_codes = numpy.array(word_codes,dtype=numpy.int64)
+        self.form_counts = add_counts(self.form_counts,numpy.bincount(declension_codes,minlength=len(self.declension_ids)))
+        # The rows are added in blocks, doubling the table each time.
+        rows = self.word_flags.shape[0]
+        if len(self.word_ids) > rows:
+            rows = max(len(self.word_ids),rows * 2)
+        columns = len(self.declension_ids)
+        if rows > self.word_flags.shape[0] or columns > self.word_flags.shape[1]:
+            word_flags = numpy.zeros((rows,columns),dtype=bool)
+            word_flags[:self.word_flags.shape[0],:self.word_flags.shape[1]] = self.word_flags
+            self.word_flags = word_flags
+        self.word_flags[word_codes,declension_codes] = True
+
+    # Get the report of each declension, from the most to the least forms.
+    def get_report(self):
+        word_counts = self.word_flags.sum(axis=0)
+        declensions = list(self.declension_ids.keys())
+        report = {}
+        for inx in numpy.argsort(-self.form_counts,kind='stable'):
+            report[declensions[inx]] = {'forms':int(self.form_counts[inx]), 'words':int(word_counts[inx])}
+        return report
+
+# End of AFFIX_STATS
+
+# Count the derived word rules using each derivational affix.
+def get_derivational_affix_counts(language_structure):
+    counts = {affix_name:0 for affix_name in language_structure.get('derivational_affix_map',{})}
+    for words in language_structure.get('derived_word_list',[]):
+        rule = DERIVATION_ENGINE.parse_derivation_rule(words)
+        for term in rule['terms']:
+            if term[2] is not None:
+                counts[term[2]] = counts.get(term[2],0) + 1
+    return dict(sorted(counts.items(),key=lambda item: -item[1]))
+
+#end def get_derivational_affix_counts
+
+# Write the report as CSV rows of section, key, and values.
+def write_csv_report(report,writer):
+    writer.writerow(['section','key','count','words'])
+    sections = [('phonetic',report['phonetic']),('spelled',report['spelled'])]
+    sections += [('corpus ' + corpus_file,corpus_report) for corpus_file, corpus_report in report['corpora'].items()]
+    for name, form_report in sections:
+        writer.writerow([name,'forms',form_report['forms']])
+        if 'mean_length' in form_report:
+            writer.writerow([name,'mean_length',form_report['mean_length']])
+        for field in ['segments','classes','length','syllables','stress_marks']:
+            for key, count in form_report.get(field,{}).items():
+                writer.writerow([name + ' ' + field,key,count])
+    for segment in report['phonetic']['not_in_inventory']:
+        writer.writerow(['phonetic not_in_inventory',segment])
+    for declension, counts in report['declensions'].items():
+        writer.writerow(['declensions',declension,counts['forms'],counts['words']])
+    for affix_name, count in report['derivational_affixes'].items():
+        writer.writerow(['derivational_affixes',affix_name,count])
+
+#end def write_csv_report
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
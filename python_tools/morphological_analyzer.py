@@ -0,0 +1,324 @@
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Definition of the MORPHOLOGICAL_ANALYZER used to find the root word and the
+# declensions of a declined word by stripping the affixes described in the
+# affix_map, rather than by matching against a fully declined lexicon.
+#
+import re
+from lexicon_entry import LEXICON_ENTRY
+from conlang_lib import spell_word, apply_affix_rule
+
+# AFFIX_TRIE Class
+# A character trie holding affix strings.  When built from reversed strings it
+# is used for suffixes, so both kinds of affix can be found in a single pass
+# over the word.
+class AFFIX_TRIE:
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, affix, value):
+        node = self.root
+        for char in affix:
+            if char not in node:
+                node[char] = {}
+            node = node[char]
+        if None not in node:
+            node[None] = []
+        node[None].append(value)
+
+    # Yields the length and stored values for every affix in the trie that
+    # the word starts with.
+    def matches(self, word):
+        node = self.root
+        if None in node:
+            yield 0, node[None]
+        for inx in range(len(word)):
+            node = node.get(word[inx])
+            if node is None:
+                return
+            if None in node:
+                yield inx + 1, node[None]
+
+# End of AFFIX_TRIE
+
+# MORPHOLOGICAL_ANALYZER Class
+class MORPHOLOGICAL_ANALYZER:
+    def __init__(self, lexicon, affix_map, sound_map_list):
+        self.affix_map = affix_map
+        self.sound_map_list = sound_map_list
+
+        # Index the root words by both phonetic (without the leading stress
+        # mark, since declining a word removes it) and spelled representation.
+        self.phonetic_roots = {}
+        self.spelled_roots = {}
+        for raw_entry in lexicon:
+            if isinstance(raw_entry,dict):
+                entry = LEXICON_ENTRY(raw_entry['phonetic'],raw_entry['spelled'],raw_entry['english'],raw_entry['part_of_speech'],raw_entry['declensions'],
+                                      derived_word=raw_entry.get('derived_word',False),declined_word=raw_entry.get('declined_word',False),metadata=raw_entry.get('metadata',{}))
+            elif isinstance(raw_entry,LEXICON_ENTRY):
+                entry = raw_entry
+            else:
+                print("ERROR invalid input to MORPHOLOGICAL_ANALYZER")
+                print([raw_entry,type(raw_entry)])
+                exit()
+            if entry.declined_word or 'root' not in entry.declension:
+                continue
+            phonetic_key = MORPHOLOGICAL_ANALYZER.strip_stress(entry.phonetic.strip())
+            if phonetic_key not in self.phonetic_roots:
+                self.phonetic_roots[phonetic_key] = []
+            self.phonetic_roots[phonetic_key].append(entry)
+            spelled_key = entry.spelled.strip().lower()
+            if spelled_key not in self.spelled_roots:
+                self.spelled_roots[spelled_key] = []
+            self.spelled_roots[spelled_key].append(entry)
+
+        # Invert the affix map.  The layers for each part of speech are put in
+        # the same order used by decline_word, and each affix is recorded with
+        # its part of speech, layer, and declension.
+        self.layers = {}
+        self.prefix_tries = {'phonetic':AFFIX_TRIE(), 'spelled':AFFIX_TRIE()}
+        self.suffix_tries = {'phonetic':AFFIX_TRIE(), 'spelled':AFFIX_TRIE()}
+        self.replacements = {'phonetic':[], 'spelled':[]}
+        self.identities = []
+        for part_of_speech in affix_map:
+            layer_list = sorted(affix_map[part_of_speech],key=lambda x: list(x)[0])
+            self.layers[part_of_speech] = layer_list
+            for layer_inx in range(len(layer_list)):
+                affix = list(layer_list[layer_inx].keys())[0]
+                if affix == 'particle':
+                    continue
+                for entry in layer_list[layer_inx][affix]:
+                    declension = list(entry.keys())[0]
+                    rules = entry[declension]
+                    value = (part_of_speech,layer_inx,declension)
+                    if not bool(rules):
+                        self.identities.append(value)
+                    elif affix == 'prefix' or affix == 'suffix':
+                        if 'pronunciation_regex' in rules:
+                            phonetic_adds = [rules['t_pronunciation_add'],rules['f_pronunciation_add']]
+                            spelled_adds = [rules.get('t_spelling_add',''),rules.get('f_spelling_add','')]
+                        else:
+                            phonetic_adds = [rules['pronunciation_add']]
+                            spelled_adds = [rules.get('spelling_add','')]
+                        for form, adds in (('phonetic',phonetic_adds),('spelled',spelled_adds)):
+                            for add in set(adds):
+                                if form == 'spelled':
+                                    add = add.lower()
+                                if affix == 'prefix':
+                                    self.prefix_tries[form].insert(add,value)
+                                else:
+                                    self.suffix_tries[form].insert(add[::-1],value)
+                    elif affix == 'replacement':
+                        for form, regex_key, replacement_key in (('phonetic','pronunciation_regex','pronunciation_replacement'),
+                                                                ('spelled','spelling_regex','spelling_replacement')):
+                            if regex_key not in rules or replacement_key not in rules:
+                                continue
+                            inverse = MORPHOLOGICAL_ANALYZER.invert_replacement(rules[regex_key],rules[replacement_key])
+                            if inverse is None:
+                                print("Warning replacement rule " + rules[regex_key] + " for " + declension + " cannot be inverted and will not be analyzed")
+                            else:
+                                self.replacements[form].append((value,inverse))
+
+    # Find all of the analyses for a word.  The result is a list of tuples of
+    # the root LEXICON_ENTRY and the list of declensions that produce the word.
+    def analyze(self, word, phonetic=False):
+        form = 'phonetic' if phonetic else 'spelled'
+        if phonetic:
+            word = MORPHOLOGICAL_ANALYZER.strip_stress(word.strip())
+        else:
+            word = word.strip().lower()
+        analyses = []
+        seen = set()
+        candidates = []
+        self._strip_affixes(form, word, None, None, [], candidates)
+        for root, chosen in candidates:
+            key = (id(root), tuple(chosen))
+            if key in seen:
+                continue
+            seen.add(key)
+            if self._verify(root, chosen, word, phonetic):
+                if len(chosen) > 0:
+                    analyses.append((root, [declension for layer_inx, declension in sorted(chosen)]))
+                else:
+                    analyses.append((root, ['root']))
+        return analyses
+
+    # Recursively strip affixes from the end of the declension process back to
+    # its start.  Layers are applied in increasing order when declining, so they
+    # must be stripped in decreasing order here.  Spelled words are also tried
+    # with the phonetic affixes since the spelling of a declined word comes from
+    # spelling the declined phonetic, not from the spelling affixes.  Every
+    # candidate is verified afterwards, so extra candidates are harmless.
+    def _strip_affixes(self, form, word, part_of_speech, limit, chosen, candidates):
+        if form == 'phonetic':
+            roots = self.phonetic_roots.get(word, [])
+            affix_forms = ['phonetic']
+        else:
+            roots = self.spelled_roots.get(word, [])
+            affix_forms = ['spelled','phonetic']
+        for root in roots:
+            if part_of_speech is None or root.part_of_speech == part_of_speech:
+                candidates.append((root,chosen))
+
+        reversed_word = word[::-1]
+        for affix_form in affix_forms:
+            for length, values in self.prefix_tries[affix_form].matches(word):
+                for value in values:
+                    if self._allowed(value, part_of_speech, limit):
+                        self._strip_affixes(form, word[length:], value[0], value[1], chosen + [(value[1],value[2])], candidates)
+
+            for length, values in self.suffix_tries[affix_form].matches(reversed_word):
+                for value in values:
+                    if self._allowed(value, part_of_speech, limit):
+                        self._strip_affixes(form, word[:len(word)-length], value[0], value[1], chosen + [(value[1],value[2])], candidates)
+
+            # A replacement rule that does not match leaves the word unchanged,
+            # so the word itself is always a candidate stem.
+            for value, inverse in self.replacements[affix_form]:
+                if self._allowed(value, part_of_speech, limit):
+                    stems = set(MORPHOLOGICAL_ANALYZER.apply_inverse(inverse, word))
+                    stems.add(word)
+                    for stem in stems:
+                        self._strip_affixes(form, stem, value[0], value[1], chosen + [(value[1],value[2])], candidates)
+
+        for value in self.identities:
+            if self._allowed(value, part_of_speech, limit):
+                self._strip_affixes(form, word, value[0], value[1], chosen + [(value[1],value[2])], candidates)
+
+    def _allowed(self, value, part_of_speech, limit):
+        if part_of_speech is not None and value[0] != part_of_speech:
+            return False
+        return limit is None or value[1] < limit
+
+    # Decline the root forward with the chosen declensions to confirm that it
+    # really produces the word being analyzed.
+    def _verify(self, root, chosen, word, phonetic):
+        new_word = root.phonetic.strip()
+        if len(chosen) > 0:
+            layer_list = self.layers[root.part_of_speech]
+            for layer_inx, declension in sorted(chosen):
+                affix = list(layer_list[layer_inx].keys())[0]
+                for entry in layer_list[layer_inx][affix]:
+                    if declension in entry:
+                        new_word = apply_affix_rule(affix,entry[declension],new_word)
+                        break
+        if phonetic:
+            return MORPHOLOGICAL_ANALYZER.strip_stress(new_word) == word
+        elif len(chosen) == 0:
+            return root.spelled.strip().lower() == word
+        else:
+            return spell_word(new_word,self.sound_map_list).lower() == word
+
+    @staticmethod
+    def strip_stress(word):
+        if word[0:1] == 'ˈ':
+            return word[1:]
+        return word
+
+    # Build the inverse of a replacement rule.  This is only possible when the
+    # regular expression is a sequence of capture groups, optionally anchored,
+    # and every group is used in the replacement, which is the form produced
+    # for Vulgarlang replacement rules.
+    @staticmethod
+    def invert_replacement(regex, replacement):
+        groups = []
+        head = ''
+        tail = ''
+        pos = 0
+        if regex.startswith('^'):
+            head = '^'
+            pos = 1
+        while pos < len(regex):
+            if regex[pos] != '(':
+                tail = regex[pos:]
+                break
+            end = MORPHOLOGICAL_ANALYZER._group_end(regex, pos)
+            if end < 0:
+                return None
+            group = regex[pos+1:end]
+            if group.startswith('?') or '(' in group.replace('\\(','').replace('(?:',''):
+                return None
+            groups.append(group)
+            pos = end + 1
+        if tail not in ('', '$', r'\s*$'):
+            return None
+
+        inverse = head
+        used = set()
+        for token in re.findall(r'\$\d+|[^$]+|\$', replacement):
+            if re.match(r'\$\d+$', token):
+                group_num = int(token[1:])
+                if group_num < 1 or group_num > len(groups):
+                    return None
+                if group_num in used:
+                    inverse += '(?P=g' + str(group_num) + ')'
+                else:
+                    inverse += '(?P<g' + str(group_num) + '>' + groups[group_num-1] + ')'
+                    used.add(group_num)
+            else:
+                inverse += re.escape(token)
+        if len(used) != len(groups):
+            return None
+        inverse += tail
+        try:
+            return (re.compile(inverse), len(groups))
+        except re.error:
+            return None
+
+    # Yields the candidate stems for a word given an inverted replacement rule.
+    @staticmethod
+    def apply_inverse(inverse, word):
+        pattern, group_count = inverse
+        pos = 0
+        while pos <= len(word):
+            match = pattern.search(word, pos)
+            if not match:
+                return
+            stem = word[:match.start()]
+            for group_num in range(1, group_count+1):
+                stem += match.group('g' + str(group_num))
+            yield stem + word[match.end():]
+            pos = match.start() + 1
+
+    # Find the closing parenthesis for the group starting at pos, skipping
+    # escapes and character classes.
+    @staticmethod
+    def _group_end(regex, pos):
+        depth = 0
+        in_class = False
+        while pos < len(regex):
+            char = regex[pos]
+            if char == '\\':
+                pos += 2
+                continue
+            if in_class:
+                if char == ']':
+                    in_class = False
+            elif char == '[':
+                in_class = True
+                if regex[pos+1:pos+2] == ']':
+                    pos += 1
+                elif regex[pos+1:pos+3] == '^]':
+                    pos += 2
+            elif char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+                if depth == 0:
+                    return pos
+            pos += 1
+        return -1
+
+# End of MORPHOLOGICAL_ANALYZER
@@ -1,14 +1,13 @@
 #!/usr/bin/python3 
 import sys
-import getopt
 import json
-import pdb
 import re
 import random
 from argparse import ArgumentParser
 sys.path.insert(0, '../speak_general')
 from lexicon_entry import LEXICON_ENTRY
-from conlang_lib import spell_word, decline_word, derive_words
+from conlang_lib import spell_word, decline_word, derive_words, open_conlang_file
+from declension_cache import add_cache_arguments, get_declension_cache
 
 def main(argv):
     # Define and parse the command line arguments
@@ -16,7 +15,8 @@ def main(argv):
     cli.add_argument("-l","--languagefile", type=str, required=True, metavar="FILE_PATH", dest="language_file")
     cli.add_argument("-o","--output", type=str, required=True, metavar="FILE_PATH", dest="output")
     cli.add_argument("-c","--count", type=int, required=False, dest="count")
-    arguments = cli.parse_args()
+    add_cache_arguments(cli)
+    arguments = cli.parse_args(argv)
     
     language_file = arguments.language_file
         
@@ -28,13 +28,16 @@ def main(argv):
     output_file = arguments.output
     
     # Read the JSON language data
-    with open(language_file,"r", encoding="utf-8-sig") as ifp:
+    with open_conlang_file(language_file) as ifp:
         language_structure = json.load(ifp)
         
     lexicon = language_structure["lexicon"]
+    cache = get_declension_cache(arguments)
     add_lexicon = []
     for word in lexicon:
-        add_lexicon += decline_word(word,language_structure['affix_map'],language_structure['sound_map_list'])
+        add_lexicon += decline_word(word,language_structure['affix_map'],language_structure['sound_map_list'],cache=cache)
+    if cache is not None:
+        cache.close()
     for lex_entry in add_lexicon:
         lexicon.append(lex_entry.as_map())
     language_structure['lexicon'] = lexicon
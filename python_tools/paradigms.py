@@ -0,0 +1,219 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program builds a paradigm table for each word of a Conlang JSON lexicon
+# that is not itself a declined form, for use in reference grammars.  The axes
+# of a table are the layers of the affix map for the word's part of speech (in
+# the order decline_phonetic applies them): the last layer gives the columns
+# and the combinations of the others give the rows, so a noun with number and
+# case layers gets a row for each number and a column for each case.  Only the
+# forms with a declension from every layer are shown.
+#
+# Each cell is built by applying one rule from every layer, the same way
+# decline_phonetic builds its forms, rather than being read from a declined
+# lexicon.  decline_phonetic drops a form that sounds the same as a form with
+# fewer declensions, which would leave the unmarked cells (such as nominative
+# singular) empty.  Each table is kept only until it is written, and with
+# --workers the words are declined in batches by worker processes, with the
+# tables still written in lexicon order.
+#
+import sys
+import csv
+import json
+import html
+import itertools
+import collections
+import concurrent.futures
+from argparse import ArgumentParser
+from conlang_lib import apply_affix_rule, spell_word, part_of_speech_matches, read_conlang_json_header, iter_conlang_lexicon
+
+# Number of words sent to a worker process at a time.
+PARADIGM_BATCH_SIZE = 200
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Build paradigm tables for the words of a Conlang JSON lexicon")
+    cli.add_argument("-i","--input", type=str, metavar="FILE_PATH", required=True, dest="input",
+        help="Conlang JSON file of the language")
+    cli.add_argument("-o","--output", type=str, metavar="FILE_PATH", required=True, dest="output",
+        help="File where the tables will be placed")
+    cli.add_argument("--format", type=str, required=False, default='csv', choices=['csv','html','json'], dest="format",
+        help="Write the tables as blocks of CSV rows, as an HTML page, or as a JSON object per line.  Default is csv")
+    cli.add_argument("--cell", type=str, required=False, default='spelled', choices=['spelled','phonetic','both'], dest="cell",
+        help="Form shown in each cell of a CSV or HTML table.  Default is spelled")
+    cli.add_argument("-p","--part-of-speech", type=str, action="append", required=False, dest="part_of_speech",
+        help="Only build tables for this part of speech.  May be given more than once")
+    cli.add_argument("--workers", type=int, required=False, default=1, dest="workers",
+        help="Number of processes declining the words.  Default is 1")
+    arguments = cli.parse_args(argv)
+
+    language_structure = read_conlang_json_header(arguments.input)
+    affix_map = language_structure.get('affix_map',{})
+    sound_map_list = language_structure['sound_map_list']
+
+    words = iter_paradigm_words(iter_conlang_lexicon(arguments.input),affix_map,arguments.part_of_speech)
+    paradigms = iter_paradigms(words,affix_map,sound_map_list,arguments.workers)
+
+    # JSON lines are written without a byte order mark so that each line can
+    # be parsed on its own.
+    if arguments.format == 'json':
+        with open(arguments.output,"wt", encoding="utf-8") as ofp:
+            for paradigm in paradigms:
+                ofp.write(json.dumps(paradigm,ensure_ascii=False) + '\n')
+    elif arguments.format == 'html':
+        with open(arguments.output,"wt", encoding="utf-8") as ofp:
+            write_html_paradigms(paradigms,language_structure.get('english_name',''),arguments.cell,ofp)
+    else:
+        with open(arguments.output,"w", newline='', encoding="utf-8-sig") as ofp:
+            write_csv_paradigms(paradigms,arguments.cell,ofp)
+
+#end def main
+
+# Yield the words of a lexicon that have a paradigm: those that are not
+# declined forms and whose part of speech has declensions.
+def iter_paradigm_words(lexicon,affix_map,part_of_speech=None):
+    for entry in lexicon:
+        if entry.get('declined_word',False) or len(get_paradigm_axes(affix_map,entry['part_of_speech'])) == 0:
+            continue
+        if part_of_speech is not None and not any(part_of_speech_matches(entry['part_of_speech'],requested) for requested in part_of_speech):
+            continue
+        yield entry
+
+#end def iter_paradigm_words
+
+# Get the axes of the paradigm of a part of speech, one list of (affix,
+# declension, rules) for each layer of its affix map, in the order the layers
+# are applied.  Particle layers are left out since they do not change the word.
+def get_paradigm_axes(affix_map,part_of_speech):
+    axes = []
+    if part_of_speech not in affix_map:
+        return axes
+    for layer in sorted(affix_map[part_of_speech],key=lambda x: list(x)[0]):
+        affix = list(layer.keys())[0]
+        if affix == 'particle':
+            continue
+        axes.append([(affix,list(rule.keys())[0],list(rule.values())[0]) for rule in layer[affix]])
+    return axes
+
+#end def get_paradigm_axes
+
+# Build the paradigm of a word.  The cells hold [spelled, phonetic] for each
+# row and column.
+def build_paradigm(entry,affix_map,sound_map_list):
+    axes = get_paradigm_axes(affix_map,entry['part_of_speech'])
+    rows = list(itertools.product(*axes[:-1]))
+    cells = []
+    for row in rows:
+        row_phonetic = entry['phonetic']
+        for affix, declension, rules in row:
+            row_phonetic = apply_affix_rule(affix,rules,row_phonetic)
+        row_cells = []
+        for affix, declension, rules in axes[-1]:
+            phonetic = apply_affix_rule(affix,rules,row_phonetic)
+            row_cells.append([spell_word(phonetic,sound_map_list).strip(),phonetic.strip()])
+        cells.append(row_cells)
+    return {
+        'english':entry['english'].strip(),
+        'part_of_speech':entry['part_of_speech'].strip(),
+        'spelled':entry['spelled'].strip(),
+        'phonetic':entry['phonetic'].strip(),
+        'axes':[[declension for affix, declension, rules in axis] for axis in axes],
+        'rows':[' '.join(declension for affix, declension, rules in row) for row in rows],
+        'columns':[declension for affix, declension, rules in axes[-1]],
+        'cells':cells,
+    }
+
+#end def build_paradigm
+
+# Settings for the paradigm worker processes, set by init_paradigm_worker.
+PARADIGM_WORKER = {}
+
+def init_paradigm_worker(affix_map,sound_map_list):
+    PARADIGM_WORKER['affix_map'] = affix_map
+    PARADIGM_WORKER['sound_map_list'] = sound_map_list
+
+#end def init_paradigm_worker
+
+# Build the paradigms of a batch of words in a worker process.
+def build_paradigm_batch(entries):
+    return [build_paradigm(entry,PARADIGM_WORKER['affix_map'],PARADIGM_WORKER['sound_map_list']) for entry in entries]
+
+#end def build_paradigm_batch
+
+# Yield the paradigms of the words in order, built here or by worker
+# processes a few batches ahead.
+def iter_paradigms(words,affix_map,sound_map_list,workers=1):
+    if workers <= 1:
+        for entry in words:
+            yield build_paradigm(entry,affix_map,sound_map_list)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,initializer=init_paradigm_worker,
+                                                initargs=(affix_map,sound_map_list)) as executor:
+        pending = collections.deque()
+        while True:
+            batch = list(itertools.islice(words,PARADIGM_BATCH_SIZE))
+            if len(batch) > 0:
+                pending.append(executor.submit(build_paradigm_batch,batch))
+            if len(pending) == 0:
+                return
+            if len(batch) == 0 or len(pending) >= workers * 2:
+                for paradigm in pending.popleft().result():
+                    yield paradigm
+
+#end def iter_paradigms
+
+# Get the text of a cell of a table.
+def get_cell_text(cell,cell_form):
+    if cell_form == 'spelled':
+        return cell[0]
+    if cell_form == 'phonetic':
+        return cell[1]
+    return cell[0] + ' [' + cell[1] + ']'
+
+#end def get_cell_text
+
+# Write the paradigms as CSV, each a title row, a row of column headings, the
+# rows of the table, and an empty row.
+def write_csv_paradigms(paradigms,cell_form,ofp):
+    writer = csv.writer(ofp)
+    for paradigm in paradigms:
+        writer.writerow([paradigm['spelled'],paradigm['english'],paradigm['part_of_speech'],paradigm['phonetic']])
+        writer.writerow([''] + paradigm['columns'])
+        for row, cells in zip(paradigm['rows'],paradigm['cells']):
+            writer.writerow([row] + [get_cell_text(cell,cell_form) for cell in cells])
+        writer.writerow([])
+
+#end def write_csv_paradigms
+
+# Write the paradigms as an HTML page with a table for each.
+def write_html_paradigms(paradigms,language_name,cell_form,ofp):
+    title = html.escape(language_name + ' Paradigms')
+    ofp.write('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>' + title + '</title>\n</head>\n<body>\n')
+    ofp.write('<h1>' + title + '</h1>\n')
+    for paradigm in paradigms:
+        ofp.write('<table>\n<caption><b>' + html.escape(paradigm['spelled']) + '</b> /' + html.escape(paradigm['phonetic']) +
+                  '/ (' + html.escape(paradigm['part_of_speech']) + ') ' + html.escape(paradigm['english']) + '</caption>\n')
+        ofp.write('<tr><th></th>' + ''.join('<th>' + html.escape(column) + '</th>' for column in paradigm['columns']) + '</tr>\n')
+        for row, cells in zip(paradigm['rows'],paradigm['cells']):
+            ofp.write('<tr><th>' + html.escape(row) + '</th>' +
+                      ''.join('<td>' + html.escape(get_cell_text(cell,cell_form)) + '</td>' for cell in cells) + '</tr>\n')
+        ofp.write('</table>\n')
+    ofp.write('</body>\n</html>\n')
+
+#end def write_html_paradigms
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
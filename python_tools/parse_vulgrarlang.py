@@ -22,16 +22,18 @@
 # to the Vulgarlang tool, or that all available Vulgarlang configurations will be properly parsed.
 #
 # 
-import getopt
 import json
-import pdb
 import re
 import copy
 import sys
-import re
+import itertools
 from argparse import ArgumentParser
 from lexicon_entry import LEXICON_ENTRY
-from conlang_lib import spell_word, derive_words, dedup_lexicon, decline_word, get_number_word, get_ipa_symbol_map
+from conlang_lib import spell_word, derive_words, dedup_lexicon, decline_word, get_number_word, get_ipa_symbol_map, sort_dedup_lexicon, write_conlang_json, open_conlang_file, write_sharded_conlang_json, publish_shared_lexicon, SHARD_FIELDS, SHARD_EXTENSIONS
+from external_sort import parse_memory_size
+from declension_cache import add_cache_arguments, get_declension_cache
+from conversion_pipeline import CONVERSION_PIPELINE, decline_batch, decline_shared_batch, get_shared_ranges, encode_batch
+from ipa_segmenter import grapheme_set
 
 # Define the global patterns for matching consonants and vowels.
 IPA_VOWELS_PATTERN = "[aioeu\u032f\u02d0]"
@@ -54,19 +56,32 @@ def main(argv):
     cli.add_argument("-l","--language", type=str, required=False, dest="language",
         help='Language which should be used to select the phonetics when speaking this language')
     cli.add_argument("-o","--output", type=str, required=True, metavar="FILE_PATH", dest="outputfile",
-        help='File where the conlang JSON object should be placed')
+        help='File where the conlang JSON object should be placed, or the directory for it with --shard-by')
     cli.add_argument("--derive", action="store_true", default=True, dest="derive",
         help='Indicates that the JSON object should contain derived words in addition to root words.  Default is to derive words')
     cli.add_argument("--decline", action="store_true", default=False, dest="decline",
         help='Indicates that the JSON object should contain the decilend form of all the words.  Default is to not decline words.  Using this option will produce a large JSON object')
-    arguments = cli.parse_args()
+    cli.add_argument("--memory-limit", type=str, required=False, metavar="SIZE", dest="memory_limit",
+        help='Approximate amount of memory (such as 512M or 2G) to use for sorting the lexicon.  Lexicon entries beyond this are sorted on disk and duplicates are removed while they are merged.  Default is to sort in memory')
+    cli.add_argument("--temp-dir", type=str, required=False, metavar="DIRECTORY", dest="temp_dir",
+        help='Directory for the temporary files used when --memory-limit is given')
+    cli.add_argument("--workers", type=int, required=False, default=1, dest="workers",
+        help='Number of processes used to spell and decline the words and encode the lexicon, with the stages run at the same time when more than 1.  Default is 1')
+    cli.add_argument("--pipeline-stats", action="store_true", default=False, dest="pipeline_stats",
+        help='Report the queue depth and stall times of each pipeline stage when --workers is more than 1')
+    cli.add_argument("--shard-by", type=str, action="append", choices=SHARD_FIELDS, required=False, dest="shard_by",
+        help='Write the output as a directory with the language header, a manifest, and the lexicon split into shards by part of speech and/or the initial letter of the spelled form.  May be given twice to shard by both')
+    cli.add_argument("--shard-extension", type=str, choices=SHARD_EXTENSIONS, required=False, default='.json', dest="shard_extension",
+        help='Extension, and so compression, of the header and shard files written with --shard-by.  Default is .json')
+    add_cache_arguments(cli)
+    arguments = cli.parse_args(argv)
 
     inputfile = arguments.inputfile
     outputfile = arguments.outputfile
 
     # Load the vulgarlang JSON save structure inconsantListuding the spelling (Romanization) rules and 
     # word list
-    with open(inputfile,"rt", encoding="utf-8") as ifp:
+    with open_conlang_file(inputfile,"rt", encoding="utf-8") as ifp:
         vulgarlang = json.load(ifp)
     
     comma_replace = re.compile(r'(\(\s*\w+\s*),(\s*\w+\s*\))')
@@ -132,6 +147,8 @@ def main(argv):
     # Merge the two parts of the lexicon we have so far.
     lexicon = lexicon_fragment1 + lexicon_fragment2
     
+    cache = get_declension_cache(arguments)
+    
     # Derive words if requested.
     if arguments.derive:
         add_lexicon = derive_words(derived_word_list,
@@ -139,29 +156,61 @@ def main(argv):
                             lexicon,
                             affix_map,
                             sound_map_list,
-                            arguments.decline)
+                            arguments.decline,
+                            cache,
+                            arguments.workers)
     
         lexicon += add_lexicon
     
-    # Decline the lexicon if requested
-    if arguments.decline:
-        add_lexicon = []
-        for word in lexicon:
-            add_lexicon += decline_word(word,affix_map,sound_map_list)
-        lexicon += add_lexicon
+    # With more than one worker the words are declined and the lexicon is
+    # encoded by a pipeline of worker processes, running alongside the
+    # sorting and writing done here.
+    pipeline = None
+    if arguments.workers > 1:
+        pipeline = CONVERSION_PIPELINE(arguments.workers,affix_map,sound_map_list,cache)
+
+    if arguments.memory_limit:
+        # Decline the lexicon as it is sorted, keeping only the part of the
+        # lexicon that fits in the memory limit in memory at a time.
+        if arguments.decline and pipeline is not None:
+            lexicon = itertools.chain(lexicon,pipeline.flatten(pipeline.map('decline',decline_batch,lexicon)))
+        elif arguments.decline:
+            lexicon = iter_declined_lexicon(lexicon,affix_map,sound_map_list,cache)
+        lexicon = sort_dedup_lexicon(lexicon,parse_memory_size(arguments.memory_limit),arguments.temp_dir)
+        lexicon_list = (entry.as_map() for entry in lexicon)
+    else:
+        # Decline the lexicon if requested.  The workers read the words from
+        # shared memory, so only the ranges of words are sent to them.
+        if arguments.decline and pipeline is not None:
+            shared_lexicon = publish_shared_lexicon({'affix_map':affix_map, 'sound_map_list':sound_map_list},lexicon)
+            try:
+                lexicon += list(pipeline.flatten(pipeline.map('decline',decline_shared_batch,get_shared_ranges(shared_lexicon),1)))
+            finally:
+                shared_lexicon.close()
+        elif arguments.decline:
+            add_lexicon = []
+            for word in lexicon:
+                add_lexicon += decline_word(word,affix_map,sound_map_list,cache=cache)
+            lexicon += add_lexicon
+            
+        # Attempt to remove duplicate entries in the lexicon.
+        clean_lexicon = dedup_lexicon(lexicon)
+        if len(clean_lexicon) < len(lexicon):
+            lexicon = clean_lexicon
         
-    # Attempt to remove duplicate entries in the lexicon.
-    clean_lexicon = dedup_lexicon(lexicon)
-    if len(clean_lexicon) < len(lexicon):
-        lexicon = clean_lexicon
-    
-    # Put the lexicon into order.
-    lexicon.sort()
-    
-    # Convert the lexicon into a list
-    lexicon_list = []
-    for entry in lexicon:
-        lexicon_list.append(entry.as_map())
+        # Put the lexicon into order.
+        lexicon.sort()
+        
+        # Convert the lexicon into a list
+        lexicon_list = []
+        if pipeline is None or arguments.shard_by:
+            for entry in lexicon:
+                lexicon_list.append(entry.as_map())
+
+    # Start encoding the sorted lexicon while the rest of the language is
+    # built, in the order it will be written.
+    if pipeline is not None and not arguments.shard_by:
+        lexicon_list = pipeline.flatten(pipeline.map('encode',encode_batch,lexicon))
     
     # Get the phoneme inventory
     phoneme_inventory = get_phoneme_inventory(vulgarlang)
@@ -225,12 +274,40 @@ def main(argv):
     language_structure['metadata'] = {'source':[{'vulgarlang':vulgarlang}]}
 
     # Save the file into a UTF-8 Byte Order Mark signed file to ensure that 
-    # other tools can properly read it.
-    with open(outputfile, 'wt', encoding="utf-8-sig") as ofp:
-        json.dump(language_structure, ofp, ensure_ascii=False, indent=4)
+    # other tools can properly read it.  The file is compressed if its name
+    # ends in .gz, .xz, or .bz2.  A sharded language is written as a directory.
+    if arguments.shard_by:
+        write_sharded_conlang_json(language_structure, lexicon_list, outputfile, arguments.shard_by, arguments.shard_extension)
+    else:
+        with open_conlang_file(outputfile, 'wt', encoding="utf-8-sig") as ofp:
+            if pipeline is not None:
+                write_conlang_json(language_structure, lexicon_list, ofp, formatted=True)
+            elif arguments.memory_limit:
+                write_conlang_json(language_structure, lexicon_list, ofp)
+            else:
+                json.dump(language_structure, ofp, ensure_ascii=False, indent=4)
+    
+    if pipeline is not None:
+        pipeline.close()
+        if arguments.pipeline_stats:
+            pipeline.report()
+    if cache is not None:
+        cache.close()
 
 #end def main(argv)
 
+# Yield the words of the lexicon followed by their declined forms.  This is the
+# same order the in memory path uses, so the same entry of each set of
+# duplicates is kept.
+def iter_declined_lexicon(lexicon,affix_map,sound_map_list,cache=None):
+    for word in lexicon:
+        yield word
+    for word in lexicon:
+        for declined_word in decline_word(word,affix_map,sound_map_list,cache=cache):
+            yield declined_word
+
+#end def iter_declined_lexicon
+
 # This function is used during setup on at this point since it is used 
 # for building a lexical order when one doesn't exist.
 def get_spelling_symbol_list(vulgarlang,spelling_rule_list):
@@ -248,20 +325,11 @@ def get_spelling_symbol_list(vulgarlang,spelling_rule_list):
         spelling_symbol = spell_word(sound,spelling_rule_list)
         spelling_symbol_list1.append(spelling_symbol)
   
-    spelling_symbol_set1 = set(spelling_symbol_list1)
-    spelling_symbol_list2 = []
-    nextchar = ''
-    for char in reversed(''.join(spelling_symbol_set1)):
-        charint = int(char.encode('utf-16-be').hex(),base=16) & 0x0000ffff
-        if (charint >= 0x0300) and (charint <= 0x036f):
-            nextchar = char
-        elif nextchar != '':
-            spelling_symbol_list2.append(char + nextchar)
-            nextchar = ''
-        else:
-            spelling_symbol_list2.append(char)
-    
-    return list(set(spelling_symbol_list2))
+    # Split the spellings into their symbols, keeping diacritics with the
+    # character they modify.  Before the segmenter was used a length mark was
+    # its own symbol and a tie bar only stayed with the character before it,
+    # so a lexical order built from these can differ from one built then.
+    return list(grapheme_set(set(spelling_symbol_list1)))
 #end get_spelling_symbol_list
 
 # Extract the IPA patterns from the customVowels and bwsVowles fields of the
@@ -272,20 +340,12 @@ def get_IPA_patterns(vulgarlang):
     sound_list += vulgarlang['bwsVowels']['value'].split()
     sound_set = set(sound_list)
     
-    ipa_symbol_list2 = []
-    nextchar = ''
-    # This block of code is used to tie diacritics to the proceeding character 
-    for char in reversed(''.join(sound_set)):
-        charint = int(char.encode('utf-16-be').hex(),base=16) & 0x0000ffff
-        if (charint >= 0x0300) and (charint <= 0x036f):
-            nextchar = char
-        elif nextchar != '':
-            ipa_symbol_list2.append(char + nextchar)
-            nextchar = ''
-        else:
-            ipa_symbol_list2.append(char)
-    # Turn the set back into a list.
-    ipa_vowel_list = list(set(ipa_symbol_list2))
+    # Split the sounds into their symbols, keeping diacritics, tie bars, and
+    # length marks with the character they modify.  Before the segmenter was
+    # used, a custom vowel such as aː or t͡ʃ was split into a, ː, t͡, and ʃ, so
+    # the length mark and the ʃ were wrongly taken as vowels.
+    ipa_symbol_set = grapheme_set(sound_set)
+    ipa_vowel_list = list(ipa_symbol_set)
     
     global IPA_VOWELS_PATTERN
     global IPA_CONSONANT_PATTERN
@@ -296,7 +356,7 @@ def get_IPA_patterns(vulgarlang):
     # strings that are known to only contain IPA.
     IPA_VOWELS_PATTERN = '['+ ''.join(ipa_vowel_list) + ']'
     IPA_CONSONANT_PATTERN = '[^'+ ''.join(ipa_vowel_list) + ']'
-    IPA_VOWEL_SET = set(ipa_symbol_list2)
+    IPA_VOWEL_SET = ipa_symbol_set
 
 #end def get_IPA_patterns
 
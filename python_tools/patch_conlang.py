@@ -0,0 +1,46 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program applies a patch written by diff_conlang.py to the old version
+# of a Conlang JSON file, writing the new version.  Both versions are streamed,
+# so the lexicon does not need to fit in memory.  The old file is checked
+# against the hash in the patch before anything is written, and the output may
+# replace the old file.
+#
+import sys
+from argparse import ArgumentParser
+from lexicon_patch import apply_conlang_patch
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Apply a patch to a Conlang JSON file")
+    cli.add_argument("-i","--input", type=str, metavar="FILE_PATH", required=True, dest="input",
+        help="Old version of the Conlang JSON file")
+    cli.add_argument("-p","--patch", type=str, metavar="FILE_PATH", required=True, dest="patch",
+        help="Patch written by diff_conlang.py")
+    cli.add_argument("-o","--output", type=str, metavar="FILE_PATH", required=False, dest="output",
+        help="File where the new version will be placed.  Default is to replace the input file")
+    cli.add_argument("--no-verify", action="store_false", default=True, dest="verify",
+        help="Apply the patch even if the input file is not the one the patch was made from")
+    arguments = cli.parse_args(argv)
+
+    output = arguments.output if arguments.output else arguments.input
+    if not apply_conlang_patch(arguments.input,arguments.patch,output,arguments.verify):
+        print("WARNING: " + output + " does not match the hash of the new version in the patch")
+
+#end def main
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,300 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program updates the spelled forms of a lexicon after its sound_map_list
+# has been edited, without spelling every word again.
+#
+# Each time it runs it saves a spelling index next to the JSON file it writes
+# (with a .spelling extension) holding the sound_map_list the lexicon was
+# spelled with and, for each phonetic form, which of its rules changed the
+# word, along with the size, modification time, and SHA-256 hash of the JSON
+# file so that an index is not used with a file it does not describe.  The next
+# time it runs, the old and new rules are matched up, and a word is only
+# spelled again if one of the rules that changed it was removed, edited, or
+# moved, or if an added, edited, or moved rule now changes it.  Rules that did
+# not change a word before still do not, since the word they see is the same,
+# so for the other words only the rules that changed them and the new rules
+# have to be run.
+#
+# Without a spelling index (the first time, or with --rebuild) every word is
+# spelled again.
+#
+import sys
+import os
+import json
+import hashlib
+import difflib
+import tempfile
+from argparse import ArgumentParser
+from conlang_lib import compile_sound_map_list, spell_word_traced, read_conlang_json_header, iter_conlang_lexicon, write_conlang_json, open_conlang_file
+
+SPELLING_INDEX_VERSION = 2
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Update the spelling of a lexicon after its sound map has changed")
+    cli.add_argument("-i","--input", type=str, metavar="FILE_PATH", required=True, dest="input",
+        help="Conlang JSON file to be respelled")
+    cli.add_argument("-o","--output", type=str, metavar="FILE_PATH", required=False, dest="output",
+        help="File where the respelled Conlang JSON object will be placed.  Default is to update the input file in place")
+    cli.add_argument("-s","--sound-map", type=str, metavar="FILE_PATH", required=False, dest="sound_map",
+        help="JSON file holding the new sound_map_list, either as a list or as a Conlang JSON object.  Default is the sound_map_list in the input file")
+    cli.add_argument("--delta", type=str, metavar="FILE_PATH", required=False, dest="delta",
+        help="Write the changed entries as JSON lines to this file instead of writing the Conlang JSON object")
+    cli.add_argument("--index", type=str, metavar="FILE_PATH", required=False, dest="index",
+        help="Spelling index file.  Default is the output file with a .spelling extension")
+    cli.add_argument("--rebuild", action="store_true", default=False, dest="rebuild",
+        help="Ignore the spelling index and spell every word again")
+    arguments = cli.parse_args(argv)
+
+    if arguments.delta and arguments.output:
+        print("ERROR: --delta and --output can not be used together")
+        exit()
+
+    language_structure = read_conlang_json_header(arguments.input)
+    if arguments.sound_map:
+        with open(arguments.sound_map,"r", encoding="utf-8-sig") as ifp:
+            sound_map_list = json.load(ifp)
+        if isinstance(sound_map_list,dict):
+            sound_map_list = sound_map_list['sound_map_list']
+        language_structure['sound_map_list'] = sound_map_list
+    sound_map_list = language_structure['sound_map_list']
+
+    output_file = arguments.output
+    if output_file is None:
+        output_file = arguments.input
+
+    # The index read describes the input file, and the index written describes
+    # the output file, so without --index they are different files when the
+    # output is not written over the input.
+    input_index_file = arguments.index
+    output_index_file = arguments.index
+    if arguments.index is None:
+        input_index_file = get_spelling_index_file(arguments.input)
+        output_index_file = get_spelling_index_file(output_file)
+    spelling_index = None
+    if not arguments.rebuild:
+        spelling_index = load_spelling_index(input_index_file,arguments.input)
+
+    respeller = get_respeller(spelling_index,sound_map_list)
+    lexicon = iter_respelled_lexicon(iter_conlang_lexicon(arguments.input),respeller)
+
+    if arguments.delta:
+        # Only the changes are written, so the input file still has the old
+        # spelling and the spelling index is left as it was.
+        with open(arguments.delta,"wt", encoding="utf-8") as ofp:
+            for entry_inx, entry, old_spelled in lexicon:
+                if old_spelled is not None and old_spelled != entry['spelled']:
+                    ofp.write(json.dumps({'index':entry_inx, 'phonetic':entry['phonetic'], 'english':entry['english'],
+                                          'part_of_speech':entry['part_of_speech'], 'declensions':entry['declensions'],
+                                          'old_spelled':old_spelled, 'spelled':entry['spelled']},ensure_ascii=False) + '\n')
+    else:
+        write_conlang_file(language_structure,(entry for entry_inx, entry, old_spelled in lexicon),output_file,arguments.input)
+        save_spelling_index(output_index_file,output_file,sound_map_list,respeller['new_fired'])
+
+    print(str(respeller['counts']['respelled']) + " forms respelled, " + str(respeller['counts']['checked']) + " checked against the changed rules, " +
+          str(respeller['counts']['unchanged']) + " unaffected, " + str(respeller['counts']['changed_entries']) + " entries changed")
+
+#end def main
+
+# Get the default spelling index file for a Conlang JSON file.
+def get_spelling_index_file(input_file):
+    return os.path.splitext(input_file)[0] + '.spelling'
+
+#end def get_spelling_index_file
+
+# Get the SHA-256 hash of a file.
+def get_file_sha256(input_file):
+    file_hash = hashlib.sha256()
+    with open(input_file,'rb') as ifp:
+        for block in iter(lambda: ifp.read(1048576),b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+#end def get_file_sha256
+
+# Load the spelling index of a Conlang JSON file, returning None if there is no
+# usable index.  As with language bundles, the file is taken to be unchanged if
+# its size and modification time match the index, and otherwise its hash is
+# checked.
+def load_spelling_index(index_file,input_file):
+    if not os.path.exists(index_file):
+        return None
+    with open(index_file,"r", encoding="utf-8") as ifp:
+        spelling_index = json.load(ifp)
+    if spelling_index.get('version') != SPELLING_INDEX_VERSION:
+        return None
+    source_stat = os.stat(input_file)
+    if source_stat.st_size == spelling_index['source_size'] and source_stat.st_mtime_ns == spelling_index['source_mtime_ns']:
+        return spelling_index
+    if get_file_sha256(input_file) != spelling_index['source_sha256']:
+        return None
+    return spelling_index
+
+#end def load_spelling_index
+
+# Save the spelling index of a Conlang JSON file, writing to a temporary file
+# first so that an interrupted run does not leave a partial index.
+def save_spelling_index(index_file,input_file,sound_map_list,fired_map):
+    source_stat = os.stat(input_file)
+    index_directory = os.path.dirname(os.path.abspath(index_file))
+    ofd, temp_file = tempfile.mkstemp(dir=index_directory,suffix='.tmp')
+    try:
+        with os.fdopen(ofd,'wt', encoding="utf-8") as ofp:
+            json.dump({'version':SPELLING_INDEX_VERSION, 'source_size':source_stat.st_size, 'source_mtime_ns':source_stat.st_mtime_ns,
+                       'source_sha256':get_file_sha256(input_file), 'sound_map_list':sound_map_list, 'fired':fired_map},ofp,ensure_ascii=False)
+        os.replace(temp_file,index_file)
+    except BaseException:
+        os.remove(temp_file)
+        raise
+
+#end def save_spelling_index
+
+# Write a Conlang JSON file, replacing it only once the whole file has been
+# written since the lexicon may be read from the same file.
+def write_conlang_file(language_structure,lexicon,output_file,input_file):
+    output_directory = os.path.dirname(os.path.abspath(output_file))
+    # The temporary file keeps the extension so that it is compressed the same
+    # way as the output file.
+    ofd, temp_file = tempfile.mkstemp(dir=output_directory,suffix='.tmp' + os.path.splitext(output_file)[1])
+    os.close(ofd)
+    try:
+        with open_conlang_file(temp_file,'wt') as ofp:
+            write_conlang_json(language_structure,lexicon,ofp)
+        os.chmod(temp_file,os.stat(input_file).st_mode & 0o777)
+        os.replace(temp_file,output_file)
+    except BaseException:
+        os.remove(temp_file)
+        raise
+
+#end def write_conlang_file
+
+# Get the key of a sound map rule.  Only the parts of a rule used by
+# spell_word are part of the key, and a rule without a romanization has no
+# effect on spelling.
+def get_rule_key(sound_map):
+    if 'romanization' not in sound_map:
+        return None
+    return json.dumps([sound_map['spelling_regex'],sound_map['romanization']],ensure_ascii=False)
+
+#end def get_rule_key
+
+# Match up the rules of the old and new sound map lists.  Returns a map from
+# the position of each old rule that is still used, in the same order relative
+# to the other such rules, to its position in the new list, and the positions
+# of the new rules that are not matched to an old rule.
+def match_rules(old_sound_map_list,new_sound_map_list):
+    old_keys = [get_rule_key(sound_map) for sound_map in old_sound_map_list]
+    new_keys = [get_rule_key(sound_map) for sound_map in new_sound_map_list]
+    matcher = difflib.SequenceMatcher(None,old_keys,new_keys,autojunk=False)
+    stable_rules = {}
+    for old_start, new_start, size in matcher.get_matching_blocks():
+        for offset in range(size):
+            stable_rules[old_start + offset] = new_start + offset
+    matched = set(stable_rules.values())
+    changed_rules = [rule_inx for rule_inx, key in enumerate(new_keys) if rule_inx not in matched and key is not None]
+    return stable_rules, changed_rules
+
+#end def match_rules
+
+# Set up the state used to respell words: the compiled new rules, how they
+# match the rules in the spelling index, and the results so far.
+def get_respeller(spelling_index,sound_map_list):
+    respeller = {'compiled':compile_sound_map_list(sound_map_list), 'old_fired':None, 'new_fired':{}, 'results':{}, 'stable_rules':{}, 'changed_rules':set(),
+                 'counts':{'respelled':0, 'checked':0, 'unchanged':0, 'changed_entries':0}}
+    if spelling_index is not None:
+        respeller['old_fired'] = spelling_index['fired']
+        stable_rules, changed_rules = match_rules(spelling_index['sound_map_list'],sound_map_list)
+        respeller['stable_rules'] = stable_rules
+        respeller['changed_rules'] = set(changed_rules)
+    return respeller
+
+#end def get_respeller
+
+# Work out whether a phonetic form has to be spelled again under the new
+# rules.  Returns the new spelled form, or None if the spelling is unaffected.
+def respell_phonetic(phonetic,respeller):
+    results = respeller['results']
+    if phonetic in results:
+        return results[phonetic]
+
+    compiled = respeller['compiled']
+    old_fired = respeller['old_fired']
+    stable_rules = respeller['stable_rules']
+    if old_fired is None or phonetic not in old_fired or any(rule_inx not in stable_rules for rule_inx in old_fired[phonetic]):
+        spelled, fired = spell_word_traced(phonetic,compiled)
+        respeller['counts']['respelled'] += 1
+        respeller['new_fired'][phonetic] = fired
+        results[phonetic] = spelled
+        return spelled
+
+    # The rules that changed the word are all still there and in the same
+    # order.  Run them along with the changed rules in the order of the new
+    # list; if none of the changed rules alters the word, neither does the
+    # new list as a whole.
+    fired = [stable_rules[rule_inx] for rule_inx in old_fired[phonetic]]
+    changed_rules = respeller['changed_rules']
+    if len(changed_rules) > 0:
+        respeller['counts']['checked'] += 1
+        spelled = phonetic
+        for rule_inx in sorted(changed_rules.union(fired)):
+            rule = compiled[rule_inx]
+            new_spelled = rule[0].sub(rule[1],spelled)
+            if new_spelled != spelled and rule_inx in changed_rules:
+                spelled, fired = spell_word_traced(phonetic,compiled)
+                respeller['counts']['respelled'] += 1
+                respeller['new_fired'][phonetic] = fired
+                results[phonetic] = spelled
+                return spelled
+            spelled = new_spelled
+    else:
+        respeller['counts']['unchanged'] += 1
+    respeller['new_fired'][phonetic] = fired
+    results[phonetic] = None
+    return None
+
+#end def respell_phonetic
+
+# Respell an entry of the lexicon, along with the copies of the words it was
+# declined from in its metadata.  Returns True if anything changed.
+def respell_entry(entry,respeller):
+    changed = False
+    word = entry
+    while isinstance(word,dict):
+        spelled = respell_phonetic(word['phonetic'],respeller)
+        if spelled is not None and spelled != word['spelled']:
+            word['spelled'] = spelled
+            changed = True
+        source = word.get('metadata',{}).get('source',{})
+        word = source.get('declined_word') if isinstance(source,dict) else None
+    return changed
+
+#end def respell_entry
+
+# Respell each entry of the lexicon, yielding the position of the entry, the
+# entry, and its old spelled form if the entry changed or None if it did not.
+def iter_respelled_lexicon(lexicon,respeller):
+    for entry_inx, entry in enumerate(lexicon):
+        old_spelled = entry['spelled']
+        if respell_entry(entry,respeller):
+            respeller['counts']['changed_entries'] += 1
+            yield entry_inx, entry, old_spelled
+        else:
+            yield entry_inx, entry, None
+
+#end def iter_respelled_lexicon
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,177 @@
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file contains the SHARED_LEXICON class, which reads a lexicon published
+# in multiprocessing.shared_memory by publish_shared_lexicon in conlang_lib, and
+# the LEXICON_ENTRY_VIEW class for its entries.  The block of shared memory is
+# laid out as a language bundle (see language_bundle.py) with one more section,
+#
+#     declension_bits     A bitset of the declensions of each entry, with the
+#                         bit numbers given by declension_features in the
+#                         header and feature_words 32 bit words per entry
+#
+# so the string pool, the columns of string numbers, and the indexes are read
+# in place.  A worker process attaches to the block by its name, which costs
+# the same however large the lexicon is, and no entry is decoded until it is
+# used.  The language structure, including the affix_map and sound_map_list,
+# is in the header.
+#
+# The process that published the lexicon owns the block, and removes it when
+# it closes its SHARED_LEXICON.  The others only detach from it.
+#
+import json
+from multiprocessing import shared_memory
+from language_bundle import LANGUAGE_BUNDLE
+
+# SHARED_LEXICON Class
+class SHARED_LEXICON(LANGUAGE_BUNDLE):
+    def __init__(self, name, memory=None):
+        self.owner = memory is not None
+        if memory is None:
+            memory = shared_memory.SharedMemory(name=name)
+        self.memory = memory
+        self.name = memory.name
+        self.open_view(memory.buf,'shared lexicon ' + self.name)
+        self.feature_words = self.header['feature_words']
+        self.feature_bits = {}
+        for feature, declension in enumerate(self.header['declension_features']):
+            self.feature_bits[declension] = (feature // 32, 1 << (feature % 32))
+
+    # The views of the sections are released first since the memory cannot
+    # be closed while they exist.
+    def close(self):
+        for section in self.sections.values():
+            section.release()
+        self.sections = {}
+        self.view = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def get_view(self, inx):
+        return LEXICON_ENTRY_VIEW(self,inx)
+
+    def iter_views(self):
+        for inx in range(len(self)):
+            yield LEXICON_ENTRY_VIEW(self,inx)
+
+    # Check whether an entry has a declension using its bitset.
+    def has_declension(self, inx, declension):
+        bit = self.feature_bits.get(declension)
+        if bit is None:
+            return False
+        return self.sections['declension_bits'][inx * self.feature_words + bit[0]] & bit[1] != 0
+
+    # Yield the numbers of the entries that have all of the declensions.
+    def iter_with_declensions(self, declensions):
+        bits = [self.feature_bits.get(declension) for declension in declensions]
+        if None in bits:
+            return
+        declension_bits = self.sections['declension_bits']
+        words = self.feature_words
+        for inx in range(len(self)):
+            if all(declension_bits[inx * words + word] & mask for word, mask in bits):
+                yield inx
+
+# End of SHARED_LEXICON
+
+# LEXICON_ENTRY_VIEW Class
+#
+# One entry of a SHARED_LEXICON, with the same fields as a LEXICON_ENTRY.  Each
+# field is read from the shared memory when it is used, so a view is only the
+# lexicon and the number of the entry.
+class LEXICON_ENTRY_VIEW:
+    __slots__ = ('lexicon','inx')
+
+    def __init__(self, lexicon, inx):
+        self.lexicon = lexicon
+        self.inx = inx
+
+    def get_field(self, name):
+        return self.lexicon.get_string(self.lexicon.sections[name][self.inx])
+
+    @property
+    def phonetic(self):
+        return self.get_field('phonetic')
+
+    @property
+    def spelled(self):
+        return self.get_field('spelled')
+
+    @property
+    def english(self):
+        return self.get_field('english')
+
+    @property
+    def part_of_speech(self):
+        return self.get_field('part_of_speech')
+
+    @property
+    def declension(self):
+        return self.lexicon.get_declensions(self.inx)
+
+    @property
+    def derived_word(self):
+        return bool(self.lexicon.sections['flags'][self.inx] & 1)
+
+    @property
+    def declined_word(self):
+        return bool(self.lexicon.sections['flags'][self.inx] & 2)
+
+    @property
+    def metadata(self):
+        return json.loads(self.get_field('metadata'))
+
+    def has_declension(self, declension):
+        return self.lexicon.has_declension(self.inx,declension)
+
+    # Copy the entry out of the shared memory as a LEXICON_ENTRY.
+    def get_entry(self):
+        return self.lexicon.get_entry(self.inx)
+
+    def as_map(self):
+        return self.get_entry().as_map()
+
+    def __repr__(self):
+        return 'LEXICON_ENTRY_VIEW(' + self.lexicon.name + ', ' + str(self.inx) + ')'
+
+# End of LEXICON_ENTRY_VIEW
+
+# Write bytes into a buffer in order, in place of a file, for
+# write_language_bundle.
+class SHARED_MEMORY_WRITER:
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.position = 0
+
+    def write(self, data):
+        data = memoryview(data).cast('B')
+        self.buffer[self.position:self.position+len(data)] = data
+        self.position += len(data)
+
+    def tell(self):
+        return self.position
+
+# End of SHARED_MEMORY_WRITER
+
+# Shared lexicons attached by this process, by name, so that a worker process
+# attaches to each lexicon only once.
+SHARED_LEXICON_WORKER = {}
+
+def attach_shared_lexicon(name):
+    if name not in SHARED_LEXICON_WORKER:
+        SHARED_LEXICON_WORKER[name] = SHARED_LEXICON(name)
+    return SHARED_LEXICON_WORKER[name]
+
+#end def attach_shared_lexicon
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program finds the words in a lexicon that are within a number of edits
+# of candidate words, counting IPA graphemes (a character with its diacritics)
+# as the units.  It is meant to be used before adding new roots to find near
+# homophones.  The candidates are given on the command line or read from a
+# file with one candidate per line.
+#
+import sys
+import json
+from argparse import ArgumentParser
+from lexicon_entry import LEXICON_ENTRY
+from conlang_lib import build_similarity_index, query_similarity_index_batch, open_conlang_file
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Find words similar to candidate words")
+    cli.add_argument("-l","--languagefile", type=str, required=True, metavar="FILE_PATH", dest="language_file",
+        help='Conlang JSON file to be searched')
+    cli.add_argument("-i","--input", type=str, required=False, metavar="FILE_PATH", dest="input",
+        help='File of candidate words, one per line')
+    cli.add_argument("-o","--output", type=str, required=False, metavar="FILE_PATH", dest="output",
+        help='File where the results will be placed.  Default is standard output')
+    cli.add_argument("-k","--max-distance", type=int, required=False, default=1, dest="max_distance",
+        help='Largest number of grapheme edits for a word to be reported.  Default is 1')
+    cli.add_argument("--spelled", action="store_true", default=False, dest="spelled",
+        help='The candidates are spelled forms rather than phonetic forms')
+    cli.add_argument("words", type=str, nargs='*', metavar="WORD",
+        help='Candidate words')
+    arguments = cli.parse_args(argv)
+
+    if arguments.spelled:
+        field = 'spelled'
+    else:
+        field = 'phonetic'
+
+    words = list(arguments.words)
+    if arguments.input:
+        with open(arguments.input,"r", encoding="utf-8-sig") as ifp:
+            for line in ifp:
+                if line.strip() != '':
+                    words.append(line.strip())
+    if len(words) == 0:
+        print("ERROR: no candidate words were given")
+        exit()
+
+    # Read the JSON language data
+    with open_conlang_file(arguments.language_file) as ifp:
+        language_structure = json.load(ifp)
+    if 'lexical_order_list' in language_structure:
+        LEXICON_ENTRY.set_lexical_order_list(language_structure['lexical_order_list'])
+
+    similarity_index = build_similarity_index(language_structure['lexicon'],[field])
+    del language_structure
+
+    if arguments.output:
+        ofp = open(arguments.output,"wt", encoding="utf-8-sig")
+    else:
+        ofp = sys.stdout
+
+    for word, results in zip(words,query_similarity_index_batch(similarity_index,words,arguments.max_distance,field)):
+        ofp.write(word + ': ' + str(len(results)) + ' similar words\n')
+        for distance, entry in results:
+            ofp.write('    ' + str(distance) + ' ' + entry.spelled + ' /' + entry.phonetic + '/ ' + entry.english + ' (' + entry.part_of_speech + ') [' + '.'.join(entry.declension) + ']\n')
+        ofp.write('\n')
+
+    if ofp is not sys.stdout:
+        ofp.close()
+
+#end def main
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
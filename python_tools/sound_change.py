@@ -0,0 +1,430 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program evolves a language by applying an ordered list of sound changes
+# to every phonetic form in its lexicon, writing the result as a daughter
+# language with the changed words spelled again from its sound_map_list.
+#
+# Sound changes are written one per line in the Vulgarlang sound change
+# notation, such as:
+#
+#   k > g / V_V
+#   {p,t,k} > {b,d,g} / #_
+#   e > / _#
+#   s > h / !_{t,k}
+#
+# C and V stand for any consonant or vowel of the language, {a,b} for any of a
+# list of sounds, and # for the start or end of the word.  Lines starting with
+# / are comments.  parse_sound_change turns this notation into spelling rules
+# that replace the context along with the sound; here the context is only
+# checked, so the rules are compiled into regular expressions with the
+# environment as a group (before) and a lookahead (after), one time, before the
+# lexicon is read.
+#
+# The lexicon is read and written as a stream.  Its phonetic forms are sent to
+# the rules in batches, each rule being run over the whole batch in turn, and
+# the batches can be spread over worker processes.  The affix map is kept as
+# it is; declined forms are evolved along with the rest of the lexicon.
+#
+import sys
+import re
+import json
+import time
+import collections
+import concurrent.futures
+from argparse import ArgumentParser
+from conlang_lib import spell_word, read_conlang_json_header, iter_conlang_lexicon, write_conlang_json, open_conlang_file
+from ipa_segmenter import grapheme_set, MODIFIER_CLASS
+
+STRESS_MARKS = 'ˈˌ'
+
+# Number of lexicon entries sent to the rules at a time.
+SOUND_CHANGE_BATCH_SIZE = 5000
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Apply sound changes to a Conlang JSON lexicon to create a daughter language")
+    cli.add_argument("-i","--input", type=str, metavar="FILE_PATH", required=True, dest="input",
+        help="Conlang JSON file of the parent language")
+    cli.add_argument("-c","--changes", type=str, metavar="FILE_PATH", required=True, dest="changes",
+        help="File of sound changes, one per line, applied in order")
+    cli.add_argument("-o","--output", type=str, metavar="FILE_PATH", required=True, dest="output",
+        help="File where the Conlang JSON object of the daughter language will be placed")
+    cli.add_argument("-n","--name", type=str, required=False, dest="name",
+        help="English name of the daughter language.  Default is the name of the parent language")
+    cli.add_argument("--log", type=str, metavar="FILE_PATH", required=False, dest="log",
+        help="File where the number of forms each change applied to, and its time, is written.  Default is standard output")
+    cli.add_argument("--trace", type=str, metavar="FILE_PATH", required=False, dest="trace",
+        help="Write each changed form, with the changes that applied to it, as JSON lines to this file")
+    cli.add_argument("--workers", type=int, required=False, default=1, dest="workers",
+        help="Number of processes the batches are spread over.  Default is 1")
+    cli.add_argument("--batch-size", type=int, required=False, default=SOUND_CHANGE_BATCH_SIZE, dest="batch_size",
+        help="Number of lexicon entries in each batch.  Default is " + str(SOUND_CHANGE_BATCH_SIZE))
+    arguments = cli.parse_args(argv)
+
+    with open(arguments.changes,"r", encoding="utf-8-sig") as ifp:
+        change_list = [line.strip() for line in ifp if line.strip() != '' and not line.strip().startswith('/')]
+
+    language_structure = read_conlang_json_header(arguments.input)
+    vowels = get_language_vowels(language_structure)
+    # Compiling the changes here reports any errors in them before the lexicon
+    # is read.
+    compiled_list = compile_sound_changes(change_list,vowels)
+
+    sound_map_list = language_structure['sound_map_list']
+    parent_name = language_structure.get('english_name','')
+    if arguments.name:
+        language_structure['english_name'] = arguments.name
+    if language_structure.get('native_name_phonetic'):
+        native_name = apply_sound_changes([language_structure['native_name_phonetic']],compiled_list)[0][0]
+        if native_name != language_structure['native_name_phonetic']:
+            language_structure['native_name_phonetic'] = native_name
+            language_structure['native_name_english'] = spell_word(native_name,sound_map_list).capitalize()
+    metadata = language_structure.get('metadata',{})
+    if not isinstance(metadata.get('source'),list):
+        metadata['source'] = []
+    metadata['source'].append({'sound_changes':{'parent':parent_name, 'changes':change_list}})
+    language_structure['metadata'] = metadata
+
+    totals = {'counts':[0] * len(change_list), 'times':[0.0] * len(change_list), 'forms':0, 'changed':0}
+    trace_fp = None
+    if arguments.trace:
+        trace_fp = open(arguments.trace,"wt", encoding="utf-8")
+    start_time = time.perf_counter()
+    lexicon = iter_evolved_lexicon(iter_conlang_lexicon(arguments.input),change_list,vowels,sound_map_list,
+                                   arguments.batch_size,arguments.workers,totals,trace_fp)
+    with open_conlang_file(arguments.output,"wt") as ofp:
+        write_conlang_json(language_structure,lexicon,ofp)
+    total_time = time.perf_counter() - start_time
+    if trace_fp is not None:
+        trace_fp.close()
+
+    if arguments.log:
+        log_fp = open(arguments.log,"wt", encoding="utf-8-sig")
+    else:
+        log_fp = sys.stdout
+    write_sound_change_log(log_fp,change_list,totals,total_time)
+    if log_fp is not sys.stdout:
+        log_fp.close()
+
+#end def main
+
+# Get the vowels of a language from its phonetic inventory, or failing that
+# from the vowels known to get_ipa_symbol_map.
+def get_language_vowels(language_structure):
+    inventory = language_structure.get('phonetic_inventory',{})
+    vowels = list(inventory.get('vowels',[])) + list(inventory.get('v_diphthongs',[]))
+    if len(vowels) == 0:
+        from conlang_lib import get_ipa_symbol_map
+        vowels = get_ipa_symbol_map()['vowels']
+    return vowels
+
+#end def get_language_vowels
+
+# Translate a sound or context in the sound change notation into a regular
+# expression.  C and V become the consonant and vowel patterns, {a,b} becomes
+# a choice, and everything else is matched as it is.
+def translate_sound_pattern(text,patterns):
+    regex = ''
+    pos = 0
+    while pos < len(text):
+        char = text[pos]
+        if char == '{':
+            end = text.find('}',pos)
+            if end < 0:
+                print("ERROR: unmatched { in " + text)
+                exit()
+            choices = sorted([choice.strip() for choice in text[pos+1:end].split(',')],key=len,reverse=True)
+            regex += '(?:' + '|'.join(translate_sound_pattern(choice,patterns) for choice in choices) + ')'
+            pos = end + 1
+            continue
+        if char == 'C':
+            regex += patterns['C']
+        elif char == 'V':
+            regex += patterns['V']
+        else:
+            regex += re.escape(char)
+        pos += 1
+    return regex
+
+#end def translate_sound_pattern
+
+# Split a sound change into its sound, replacement, and environment, the
+# sound and replacement as lists so that {p,t,k} > {b,d,g} pairs them up.
+def parse_sound_change_rule(sound_change):
+    match = re.match(r'^(.*?)>([^/]*)(?:/(.*))?$',sound_change)
+    if not match:
+        print("ERROR: unable to parse sound change " + sound_change)
+        exit()
+    sound = match.group(1).strip()
+    replacement = match.group(2).strip()
+    environment = (match.group(3) or '_').strip()
+    if replacement in ['∅','0','Ø']:
+        replacement = ''
+
+    replacement_list = None
+    set_match = re.match(r'^\{(.*)\}$',replacement)
+    if set_match:
+        replacement_list = [part.strip() for part in set_match.group(1).split(',')]
+        if replacement_list == ['']:
+            replacement_list = None
+            replacement = ''
+    sound_list = None
+    set_match = re.match(r'^\{(.*)\}$',sound)
+    if set_match:
+        sound_list = [part.strip() for part in set_match.group(1).split(',')]
+    if replacement_list is not None and (sound_list is None or len(sound_list) != len(replacement_list)):
+        print("ERROR: the sounds and replacements of " + sound_change + " do not pair up")
+        exit()
+    if '_' not in environment:
+        print("ERROR: the environment of " + sound_change + " has no _")
+        exit()
+    return sound, replacement, sound_list, replacement_list, environment
+
+#end def parse_sound_change_rule
+
+# Get the function a sound is replaced with when a template is not enough:
+# when the sounds and replacements are paired up, or when the environment is
+# negated, in which case a match that is in the environment is left alone.
+def get_sound_replacer(replacement,replacement_map=None,before_check=None,after_check=None):
+    def replace_sound(match):
+        if before_check is not None or after_check is not None:
+            in_environment = True
+            if before_check is not None and not before_check.search(match.string,0,match.start(2)):
+                in_environment = False
+            if after_check is not None and not after_check.match(match.string,match.end(2)):
+                in_environment = False
+            if in_environment:
+                return match.group(0)
+        if replacement_map is not None:
+            return match.group(1) + replacement_map.get(match.group(2),match.group(2))
+        return match.group(1) + replacement
+    return replace_sound
+
+#end def get_sound_replacer
+
+# Compile a list of sound changes for apply_sound_changes.  Each is compiled
+# into a regular expression whose first group is the context before the sound
+# and whose second group is the sound, along with either a replacement
+# template or a function to build the replacement.
+def compile_sound_changes(change_list,vowels):
+    vowel_list = sorted(grapheme_set(vowels) | set(vowels),key=len,reverse=True)
+    vowel_pattern = '(?:' + '|'.join(re.escape(vowel) for vowel in vowel_list) + ')[' + MODIFIER_CLASS + ']*'
+    patterns = {
+        'V':vowel_pattern,
+        'C':'(?:(?!' + vowel_pattern + ')[^' + STRESS_MARKS + r'\s.][' + MODIFIER_CLASS + ']*)'
+    }
+
+    compiled_list = []
+    for sound_change in change_list:
+        sound, replacement, sound_list, replacement_list, environment = parse_sound_change_rule(sound_change)
+        negate = environment.startswith('!')
+        if negate:
+            environment = environment[1:].strip()
+        before, after = environment.split('_',1)
+        before = before.strip()
+        after = after.strip()
+
+        # A word boundary at the start lets the stress mark on the first
+        # syllable through, and the mark is kept as part of the context.
+        before_regex = ''
+        if before.startswith('#'):
+            before_regex = '^[' + STRESS_MARKS + ']?'
+            before = before[1:]
+        before_regex += translate_sound_pattern(before,patterns)
+        after_regex = ''
+        after_boundary = after.endswith('#')
+        if after_boundary:
+            after = after[:-1]
+        after_regex = translate_sound_pattern(after,patterns)
+        if after_boundary:
+            after_regex += '$'
+
+        sound_regex = translate_sound_pattern(sound,patterns)
+        replacement_map = None
+        if replacement_list is not None:
+            replacement_map = dict(zip(sound_list,replacement_list))
+        if negate:
+            # The context can be of any length, so it is checked around each
+            # match instead of being part of the expression.
+            regex = re.compile('()(' + sound_regex + ')')
+            before_check = re.compile('(?:' + before_regex + ')$') if before_regex else None
+            after_check = re.compile(after_regex) if after_regex else None
+            compiled_list.append((regex,None,get_sound_replacer(replacement,replacement_map,before_check,after_check)))
+            continue
+
+        regex = re.compile('(' + before_regex + ')(' + sound_regex + ')' + ('(?=' + after_regex + ')' if after_regex else ''))
+        if replacement_map is not None:
+            compiled_list.append((regex,None,get_sound_replacer(replacement,replacement_map)))
+        else:
+            compiled_list.append((regex,'\\1' + replacement.replace('\\','\\\\'),None))
+    return compiled_list
+
+#end def compile_sound_changes
+
+# Apply compiled sound changes to a list of phonetic forms.  Each change is
+# run over the whole list before the next one.  Returns the new forms, the
+# number of forms each change applied to, the time spent on each change, and
+# for each form the positions of the changes that applied to it.
+def apply_sound_changes(forms,compiled_list,trace=False):
+    forms = list(forms)
+    counts = []
+    times = []
+    fired = None
+    if trace:
+        fired = [[] for form in forms]
+    for change_inx, (regex, template, replacer) in enumerate(compiled_list):
+        start_time = time.perf_counter()
+        sub = regex.sub
+        if template is not None:
+            new_forms = [sub(template,form) for form in forms]
+        else:
+            new_forms = [sub(replacer,form) for form in forms]
+        count = 0
+        for form_inx in range(len(forms)):
+            if new_forms[form_inx] is not forms[form_inx] and new_forms[form_inx] != forms[form_inx]:
+                count += 1
+                if trace:
+                    fired[form_inx].append(change_inx)
+        forms = new_forms
+        counts.append(count)
+        times.append(time.perf_counter() - start_time)
+    return forms, counts, times, fired
+
+#end def apply_sound_changes
+
+# Settings for the sound change worker processes, set by init_sound_change_worker.
+SOUND_CHANGE_WORKER = {}
+
+def init_sound_change_worker(change_list,vowels,sound_map_list,trace):
+    SOUND_CHANGE_WORKER['compiled_list'] = compile_sound_changes(change_list,vowels)
+    SOUND_CHANGE_WORKER['sound_map_list'] = sound_map_list
+    SOUND_CHANGE_WORKER['trace'] = trace
+
+#end def init_sound_change_worker
+
+# Evolve one batch of distinct phonetic forms, spelling the ones that changed.
+# Returns a map from each old form to its new phonetic and spelled forms (the
+# spelled form is None if the form did not change), with the counts, times,
+# and changes that applied to each form.
+def run_sound_change_batch(forms):
+    new_forms, counts, times, fired = apply_sound_changes(forms,SOUND_CHANGE_WORKER['compiled_list'],SOUND_CHANGE_WORKER['trace'])
+    sound_map_list = SOUND_CHANGE_WORKER['sound_map_list']
+    results = {}
+    for form_inx, form in enumerate(forms):
+        new_form = new_forms[form_inx]
+        if new_form != form:
+            results[form] = (new_form,spell_word(new_form,sound_map_list),fired[form_inx] if fired is not None else None)
+        else:
+            results[form] = (form,None,None)
+    return results, counts, times
+
+#end def run_sound_change_batch
+
+# Get the phonetic forms of an entry and the copies of the words it was
+# declined from in its metadata.
+def get_entry_words(entry):
+    words = []
+    word = entry
+    while isinstance(word,dict):
+        words.append(word)
+        source = word.get('metadata',{}).get('source',{})
+        word = source.get('declined_word') if isinstance(source,dict) else None
+    return words
+
+#end def get_entry_words
+
+# Update the entries of a batch from the results of run_sound_change_batch.
+def update_batch(batch,results,counts,times,totals,trace_fp):
+    for change_inx in range(len(counts)):
+        totals['counts'][change_inx] += counts[change_inx]
+        totals['times'][change_inx] += times[change_inx]
+    for entry in batch:
+        totals['forms'] += 1
+        for word_inx, word in enumerate(get_entry_words(entry)):
+            new_phonetic, spelled, fired = results[word['phonetic']]
+            if spelled is None:
+                continue
+            if word_inx == 0:
+                totals['changed'] += 1
+                if trace_fp is not None:
+                    trace_fp.write(json.dumps({'english':word['english'], 'part_of_speech':word['part_of_speech'], 'declensions':word['declensions'],
+                                               'old_phonetic':word['phonetic'], 'phonetic':new_phonetic, 'changes':[change_inx + 1 for change_inx in fired]},ensure_ascii=False) + '\n')
+            word['phonetic'] = new_phonetic
+            word['spelled'] = spelled
+
+#end def update_batch
+
+# Yield the entries of the lexicon with the sound changes applied.  The
+# batches are run in order, with a few of them ahead when using workers so
+# that the workers are kept busy while the results are written.
+def iter_evolved_lexicon(lexicon,change_list,vowels,sound_map_list,batch_size,workers,totals,trace_fp=None):
+    trace = trace_fp is not None
+    batches = iter_batches(lexicon,batch_size)
+    if workers <= 1:
+        init_sound_change_worker(change_list,vowels,sound_map_list,trace)
+        for batch, forms in batches:
+            results, counts, times = run_sound_change_batch(forms)
+            update_batch(batch,results,counts,times,totals,trace_fp)
+            yield from batch
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,initializer=init_sound_change_worker,
+                                                initargs=(change_list,vowels,sound_map_list,trace)) as executor:
+        pending = collections.deque()
+        for batch, forms in batches:
+            pending.append((batch,executor.submit(run_sound_change_batch,forms)))
+            if len(pending) >= workers * 2:
+                batch, future = pending.popleft()
+                update_batch(batch,*future.result(),totals,trace_fp)
+                yield from batch
+        while len(pending) > 0:
+            batch, future = pending.popleft()
+            update_batch(batch,*future.result(),totals,trace_fp)
+            yield from batch
+
+#end def iter_evolved_lexicon
+
+# Split the lexicon into batches, yielding each batch of entries with the
+# list of distinct phonetic forms in it.
+def iter_batches(lexicon,batch_size):
+    batch = []
+    forms = {}
+    for entry in lexicon:
+        batch.append(entry)
+        for word in get_entry_words(entry):
+            forms[word['phonetic']] = True
+        if len(batch) >= batch_size:
+            yield batch, list(forms)
+            batch = []
+            forms = {}
+    if len(batch) > 0:
+        yield batch, list(forms)
+
+#end def iter_batches
+
+# Write the number of forms each change applied to and the time it took.
+def write_sound_change_log(log_fp,change_list,totals,total_time):
+    width = max([len(sound_change) for sound_change in change_list] + [10])
+    log_fp.write('#'.rjust(4) + '  ' + 'change'.ljust(width) + '  ' + 'forms'.rjust(10) + '  ' + 'seconds'.rjust(10) + '\n')
+    for change_inx, sound_change in enumerate(change_list):
+        log_fp.write(str(change_inx + 1).rjust(4) + '  ' + sound_change.ljust(width) + '  ' + str(totals['counts'][change_inx]).rjust(10) + '  ' +
+                     ('%.4f' % totals['times'][change_inx]).rjust(10) + '\n')
+    log_fp.write(str(totals['changed']) + " of " + str(totals['forms']) + " entries changed in " + ('%.2f' % total_time) + " seconds\n")
+
+#end def write_sound_change_log
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
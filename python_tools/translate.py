@@ -0,0 +1,288 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is used to translate tagged English into a conlang.  The input
+# is either a word list with one word per line, or simple Subject Verb Object
+# sentences with one sentence per line.  Each word is written as:
+#
+#     english/tag/Declension.Declension
+#
+# where the tag (n, pron, v, adj, det, num, prep, adv, ...) and the declensions
+# are optional, and spaces in multi-word English glosses are written as
+# underscores.  For example:
+#
+#     the/det big/adj dog/n/Plural see/v/Past a/det cat/n with/prep key/n.
+#
+# Only the root lexicon is used.  Declined forms are produced on demand, and
+# the input is read and written in batches so that large corpora can be
+# translated without holding them, or a declined lexicon, in memory.
+#
+import sys
+import json
+import functools
+from argparse import ArgumentParser
+from conlang_lib import derive_words, build_gloss_index, lookup_gloss, decline_word_features, open_conlang_file
+
+NOUN_TAGS = ['n','pron']
+MODIFIER_TAGS = ['adj','num']
+ADPOSITION_TAGS = ['prep','post','adp']
+PUNCTUATION = '.,;:!?'
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Translate tagged English into a conlang")
+    cli.add_argument("-l","--languagefile", type=str, required=True, metavar="FILE_PATH", dest="language_file",
+        help='Conlang JSON file for the language to translate into')
+    cli.add_argument("-i","--input", type=str, required=True, metavar="FILE_PATH", dest="input",
+        help='Tagged English word list or sentences')
+    cli.add_argument("-o","--output", type=str, required=True, metavar="FILE_PATH", dest="output",
+        help='File where the conlang text will be placed')
+    cli.add_argument("--words", action="store_true", default=False, dest="words",
+        help='Indicates that the input is a word list rather than sentences')
+    cli.add_argument("--phonetic", action="store_true", default=False, dest="phonetic",
+        help='Write the phonetic form of the words rather than the spelled form')
+    cli.add_argument("--batch-size", type=int, required=False, default=10000, dest="batch_size",
+        help='Number of input lines translated and written at a time.  Default is 10000')
+    arguments = cli.parse_args(argv)
+
+    # Read the JSON language data
+    with open_conlang_file(arguments.language_file) as ifp:
+        language_structure = json.load(ifp)
+
+    lexicon = language_structure['lexicon']
+    if not language_structure.get('derived',False) and 'derived_word_list' in language_structure:
+        lexicon = lexicon + derive_words(language_structure['derived_word_list'],
+                                         language_structure['derivational_affix_map'],
+                                         lexicon,
+                                         language_structure['affix_map'],
+                                         language_structure['sound_map_list'],
+                                         False)
+    gloss_index = build_gloss_index(lexicon)
+    del lexicon
+    del language_structure['lexicon']
+
+    affix_map = language_structure.get('affix_map',{})
+    sound_map_list = language_structure.get('sound_map_list',[])
+
+    # The same words are declined the same way many times over in a corpus, so
+    # keep the most recent results.
+    @functools.lru_cache(maxsize=65536)
+    def decline(phonetic, part_of_speech, features):
+        return decline_word_features(phonetic,part_of_speech,features,affix_map,sound_map_list)
+
+    translator = {
+        'gloss_index':gloss_index,
+        'decline':decline,
+        'phonetic':arguments.phonetic,
+        'word_order':get_word_order(language_structure),
+        'adjective_position':language_structure.get('adjective_position','Before'),
+        'pre_post_position':language_structure.get('pre_post_position','preposition'),
+    }
+
+    with open(arguments.input,"r", encoding="utf-8-sig") as ifp, open(arguments.output,"wt", encoding="utf-8-sig") as ofp:
+        batch = []
+        for line in ifp:
+            batch.append(line)
+            if len(batch) >= arguments.batch_size:
+                ofp.writelines(translate_batch(batch,translator,arguments.words))
+                batch = []
+        if len(batch) > 0:
+            ofp.writelines(translate_batch(batch,translator,arguments.words))
+
+#end def main
+
+# Get the word order from the language, falling back to SVO if it is missing
+# or not a valid arrangement of S, V, and O.
+def get_word_order(language_structure):
+    word_order = language_structure.get('word_order','SVO').strip().upper()
+    if sorted(word_order) != ['O','S','V']:
+        word_order = 'SVO'
+    return word_order
+
+#end def get_word_order
+
+# Translate a batch of input lines, returning the output lines.
+def translate_batch(batch,translator,words=False):
+    output = []
+    for line in batch:
+        tokens = [parse_token(token) for token in line.split()]
+        if len(tokens) == 0:
+            output.append('\n')
+        elif words:
+            output.append(' '.join(translate_token(token,translator) for token in tokens) + '\n')
+        else:
+            output.append(translate_sentence(tokens,translator) + '\n')
+    return output
+
+#end def translate_batch
+
+# Split a tagged input word into the English, the tag, the declensions, and any
+# punctuation that trailed it.
+def parse_token(token):
+    punctuation = ''
+    while len(token) > 0 and token[-1] in PUNCTUATION:
+        punctuation = token[-1] + punctuation
+        token = token[:-1]
+    parts = token.split('/')
+    english = parts[0]
+    tag = ''
+    features = []
+    if len(parts) > 1:
+        tag = parts[1].strip().lower()
+    if len(parts) > 2 and parts[2].strip() != '':
+        features = [feature.replace('_',' ') for feature in parts[2].split('.')]
+    return {'english':english, 'tag':tag, 'features':features, 'punctuation':punctuation}
+
+#end def parse_token
+
+# Translate a single tagged word.  Multi-word glosses that are not found in the
+# lexicon are translated one word at a time, and words that cannot be found
+# are written as <english>.
+def translate_token(token,translator,extra_features=[]):
+    english = token['english']
+    entries = lookup_gloss(translator['gloss_index'],english,token['tag'])
+    if len(entries) == 0:
+        english_words = english.replace('_',' ').split()
+        if len(english_words) > 1:
+            return ' '.join(translate_token({'english':word,'tag':token['tag'],'features':token['features'],'punctuation':''},translator,extra_features)
+                            for word in english_words)
+        return '<' + english + '>'
+
+    entry = entries[0]
+    features = tuple(token['features'] + [feature for feature in extra_features if feature not in token['features']])
+    if len(features) == 0:
+        if translator['phonetic']:
+            return entry.phonetic.strip()
+        return entry.spelled.strip()
+    phonetic, spelled, declensions = translator['decline'](entry.phonetic.strip(),entry.part_of_speech,features)
+    if translator['phonetic']:
+        return phonetic
+    return spelled
+
+#end def translate_token
+
+# Translate a simple sentence.  The tagged words are grouped into the subject,
+# verb, object, and any adpositional phrases, which are then arranged by the
+# language's word_order, adjective_position, and pre_post_position.  Sentences
+# that do not fit this pattern are translated word for word.
+def translate_sentence(tokens,translator):
+    punctuation = tokens[-1]['punctuation']
+    phrases = []
+    verb = None
+    inx = 0
+    while inx < len(tokens):
+        token = tokens[inx]
+        if token['tag'] == 'v' and verb is None:
+            verb = [token]
+            phrases.append(('V',verb))
+            inx += 1
+            while inx < len(tokens) and tokens[inx]['tag'] == 'adv':
+                verb.append(tokens[inx])
+                inx += 1
+        elif token['tag'] in ADPOSITION_TAGS:
+            noun_phrase, inx = collect_noun_phrase(tokens,inx+1)
+            if noun_phrase is None:
+                return ' '.join(translate_token(token,translator) for token in tokens) + punctuation
+            phrases.append(('P',(token,noun_phrase)))
+        else:
+            noun_phrase, inx = collect_noun_phrase(tokens,inx)
+            if noun_phrase is None:
+                return ' '.join(translate_token(token,translator) for token in tokens) + punctuation
+            phrases.append(('N',noun_phrase))
+
+    # The first noun phrase before the verb is the subject and the first after
+    # the verb is the object.
+    subject = None
+    direct_object = None
+    adpositional_phrases = []
+    seen_verb = False
+    for phrase_type, phrase in phrases:
+        if phrase_type == 'V':
+            seen_verb = True
+        elif phrase_type == 'P':
+            adpositional_phrases.append(phrase)
+        elif not seen_verb and subject is None:
+            subject = phrase
+        elif seen_verb and direct_object is None:
+            direct_object = phrase
+        else:
+            return ' '.join(translate_token(token,translator) for token in tokens) + punctuation
+    if verb is None:
+        return ' '.join(translate_token(token,translator) for token in tokens) + punctuation
+
+    parts = {'S':'', 'V':' '.join(translate_token(token,translator) for token in verb), 'O':''}
+    if subject is not None:
+        parts['S'] = translate_noun_phrase(subject,translator,['Nominative'])
+    if direct_object is not None:
+        parts['O'] = translate_noun_phrase(direct_object,translator,['Accusative'])
+    adpositional_text = []
+    for adposition, noun_phrase in adpositional_phrases:
+        noun_phrase_text = translate_noun_phrase(noun_phrase,translator)
+        adposition_text = translate_token(adposition,translator)
+        if translator['pre_post_position'] == 'postposition':
+            adpositional_text.append(noun_phrase_text + ' ' + adposition_text)
+        else:
+            adpositional_text.append(adposition_text + ' ' + noun_phrase_text)
+
+    # Adpositional phrases come before a final verb, otherwise at the end.
+    clause = [parts[part] for part in translator['word_order'] if parts[part] != '']
+    if translator['word_order'][-1] == 'V':
+        clause = clause[:-1] + adpositional_text + clause[-1:]
+    else:
+        clause += adpositional_text
+    sentence = ' '.join(clause)
+    return sentence[0:1].upper() + sentence[1:] + punctuation
+
+#end def translate_sentence
+
+# Collect a noun phrase starting at inx.  Returns the phrase, which is the
+# determiners, modifiers, and head noun, along with the index of the next word,
+# or None if no head noun is found.
+def collect_noun_phrase(tokens,inx):
+    noun_phrase = {'determiners':[], 'modifiers':[], 'head':None}
+    while inx < len(tokens):
+        token = tokens[inx]
+        inx += 1
+        if token['tag'] == 'det':
+            noun_phrase['determiners'].append(token)
+        elif token['tag'] in MODIFIER_TAGS:
+            noun_phrase['modifiers'].append(token)
+        elif token['tag'] in NOUN_TAGS:
+            noun_phrase['head'] = token
+            return noun_phrase, inx
+        else:
+            return None, inx
+    return None, inx
+
+#end def collect_noun_phrase
+
+# Translate a noun phrase, placing the adjectives by the adjective_position.
+# Determiners that are not in the lexicon are dropped since many conlangs
+# mark definiteness with a declension instead.
+def translate_noun_phrase(noun_phrase,translator,case=[]):
+    determiners = []
+    for token in noun_phrase['determiners']:
+        if len(lookup_gloss(translator['gloss_index'],token['english'],'det')) > 0:
+            determiners.append(translate_token(token,translator))
+    modifiers = [translate_token(token,translator) for token in noun_phrase['modifiers']]
+    head = translate_token(noun_phrase['head'],translator,case)
+    if translator['adjective_position'] == 'After':
+        return ' '.join(determiners + [head] + modifiers)
+    return ' '.join(determiners + modifiers + [head])
+
+#end def translate_noun_phrase
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,496 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program checks Conlang JSON files against the structure described in
+# doc/conlang_json_spec, so that problems are found before decline_word or
+# derive_words stop on them partway through a long run.  Each problem is
+# reported with the path to the value and the line of the file it starts on.
+#
+# Breaking the specification is an ERROR, as is anything the tools would fail
+# on (such as a regular expression that does not compile, or a replacement
+# using a group the expression does not have).  Things that are allowed but
+# are probably mistakes, such as unknown keys or a part of speech that is not
+# in the part_of_speech_list, are a WARNING.
+#
+# The file is read in one pass with iter_conlang_json, so only one lexicon
+# entry (or one batch of entries when using workers) is held at a time.
+#
+import sys
+import re
+import json
+import collections
+import concurrent.futures
+from argparse import ArgumentParser
+from conlang_lib import iter_conlang_json, open_conlang_file
+
+TOP_LEVEL_KEYS = ['version','english_name','phonetic_characters','native_name_phonetic','native_name_english','preferred_voices',
+                  'preferred_language','derived','declined','noun_gender_list','part_of_speech_list','phoneme_inventory',
+                  'phonetic_inventory','word_order','adjective_position','pre_post_position','sound_map_list','lexical_order_list',
+                  'affix_map','derivational_affix_map','lexicon','derived_word_list','metadata']
+REQUIRED_TOP_LEVEL_KEYS = ['version','english_name','native_name_phonetic','lexicon']
+PHONETIC_CHARACTERS = ['ipa','x-sampa','sampa']
+ADJECTIVE_POSITIONS = ['before','after']
+PRE_POST_POSITIONS = ['preposition','postposition']
+PHONETIC_INVENTORY_KEYS = ['p_consonants','np_consonants','vowels','v_diphthongs']
+
+# The keys of a sound map entry, paired with the key each requires.
+SOUND_MAP_PAIRS = {'pronunciation_regex':'phoneme', 'phoneme':'pronunciation_regex', 'spelling_regex':'romanization', 'romanization':'spelling_regex'}
+
+AFFIX_TYPES = ['particle','prefix','suffix','replacement','pronunciation_add']
+ADD_KEYS = ['pronunciation_add','spelling_add']
+REGEX_ADD_KEYS = ['pronunciation_regex','t_pronunciation_add','f_pronunciation_add','spelling_regex','t_spelling_add','f_spelling_add']
+REPLACEMENT_KEYS = ['pronunciation_regex','pronunciation_replacement','spelling_regex','spelling_replacement']
+DERIVATIONAL_AFFIX_TYPES = ['PREFIX','SUFFIX']
+
+LEXICON_ENTRY_KEYS = ['phonetic','spelled','english','part_of_speech','declensions','derived_word','declined_word','metadata']
+
+DERIVED_WORD_PATTERN = re.compile(r'^[^:=]+:[^:=]+=.+$')
+GROUP_REFERENCE_PATTERN = re.compile(r'\$(\d+)')
+
+# Number of lexicon entries given to a worker at a time.
+VALIDATE_BATCH_SIZE = 5000
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Check Conlang JSON files against the Conlang JSON specification")
+    cli.add_argument("input", type=str, metavar="FILE_PATH", nargs='+',
+        help="Conlang JSON files to be checked")
+    cli.add_argument("--max-reports", type=int, required=False, default=100, dest="max_reports",
+        help="Number of problems reported for each file; the rest are only counted.  Default is 100")
+    cli.add_argument("--no-warnings", action="store_true", default=False, dest="no_warnings",
+        help="Only report errors")
+    cli.add_argument("--workers", type=int, required=False, default=1, dest="workers",
+        help="Number of processes the lexicon entries are checked in.  Default is 1")
+    arguments = cli.parse_args(argv)
+
+    failed = False
+    for input_file in arguments.input:
+        counts = validate_conlang_file(input_file,arguments.workers,arguments.max_reports,arguments.no_warnings)
+        print(input_file + ": " + str(counts['ERROR']) + " errors, " + str(counts['WARNING']) + " warnings")
+        if counts['ERROR'] > 0:
+            failed = True
+    if failed:
+        exit(1)
+
+#end def main
+
+# Check one Conlang JSON file, printing its problems.  Returns the number of
+# errors and warnings found.
+def validate_conlang_file(input_file,workers=1,max_reports=100,no_warnings=False):
+    counts = {'ERROR':0, 'WARNING':0}
+    context = {'keys':set(), 'part_of_speech_list':None, 'affix_map':None, 'declined':False,
+               'entry_count':0, 'part_of_speech_counts':collections.Counter(), 'line':1, 'read_error':None}
+
+    def report(issues):
+        for level, location, line, message in issues:
+            if no_warnings and level == 'WARNING':
+                continue
+            counts[level] += 1
+            if counts['ERROR'] + counts['WARNING'] <= max_reports:
+                print(level + " " + input_file + ":" + str(line) + " " + location + ": " + message)
+
+    try:
+        with open_conlang_file(input_file) as ifp:
+            lexicon = iter_header_and_lexicon(iter_conlang_json(ifp,positions=True),context,report)
+            for issues in iter_lexicon_issues(lexicon,workers):
+                report(issues)
+        if context['read_error'] is not None:
+            raise context['read_error']
+    except json.JSONDecodeError as error:
+        report([('ERROR','',context['line'],"the file is not valid JSON after this point: " + error.msg)])
+        return counts
+    except UnicodeDecodeError as error:
+        report([('ERROR','',context['line'],"the file is not UTF-8: " + str(error))])
+        return counts
+
+    report(validate_after_read(context))
+    return counts
+
+#end def validate_conlang_file
+
+# Check the top level fields as they are read, yielding the lexicon entries
+# as (index, line, entry) for checking.  An error reading the file ends the
+# entries and is kept in the context, to be raised once the entries read
+# before it, which may still be waiting in a batch, have been checked.
+def iter_header_and_lexicon(fields,context,report):
+    entry_inx = 0
+    try:
+        for key, value, line in fields:
+            context['line'] = line
+            if key == 'lexicon':
+                context['keys'].add(key)
+                context['entry_count'] += 1
+                if isinstance(value,dict):
+                    part_of_speech = value.get('part_of_speech')
+                    if isinstance(part_of_speech,str):
+                        context['part_of_speech_counts'][part_of_speech] += 1
+                yield entry_inx, line, value
+                entry_inx += 1
+            else:
+                if key in context['keys']:
+                    report([('WARNING',key,line,"the key appears more than once; the last one is used")])
+                context['keys'].add(key)
+                report(validate_top_level_field(key,value,line,context))
+    except (json.JSONDecodeError,UnicodeDecodeError) as error:
+        context['read_error'] = error
+
+#end def iter_header_and_lexicon
+
+# Yield the problems found in each batch of lexicon entries, in order, checked
+# here or by worker processes a few batches ahead.
+def iter_lexicon_issues(lexicon,workers=1):
+    batches = iter_entry_batches(lexicon,VALIDATE_BATCH_SIZE)
+    if workers <= 1:
+        for batch in batches:
+            yield validate_lexicon_batch(batch)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for batch in batches:
+            pending.append(executor.submit(validate_lexicon_batch,batch))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+#end def iter_lexicon_issues
+
+# Split the lexicon entries into lists of batch_size entries.
+def iter_entry_batches(lexicon,batch_size):
+    batch = []
+    for item in lexicon:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+#end def iter_entry_batches
+
+# Check a batch of lexicon entries, returning the problems found.
+def validate_lexicon_batch(batch):
+    issues = []
+    for entry_inx, line, entry in batch:
+        issues += validate_lexicon_entry(entry,'lexicon[' + str(entry_inx) + ']',line)
+    return issues
+
+#end def validate_lexicon_batch
+
+# Check the parts of the file that can only be checked once all of it has
+# been read.
+def validate_after_read(context):
+    issues = []
+    for key in REQUIRED_TOP_LEVEL_KEYS:
+        if key not in context['keys']:
+            issues.append(('ERROR','',1,"the required key " + key + " is missing"))
+
+    if context['part_of_speech_list'] is not None:
+        for part_of_speech, count in sorted(context['part_of_speech_counts'].items()):
+            if part_of_speech not in context['part_of_speech_list'] and not part_of_speech.startswith('n'):
+                issues.append(('WARNING','lexicon',context['line'],str(count) + " entries have the part of speech " + part_of_speech +
+                               " which is not in the part_of_speech_list"))
+    return issues
+
+#end def validate_after_read
+
+# Check a value is a list of strings.
+def validate_string_list(value,location,line,level='ERROR'):
+    if not isinstance(value,list):
+        return [(level,location,line,"must be a list of strings")]
+    issues = []
+    for inx, item in enumerate(value):
+        if not isinstance(item,str):
+            issues.append((level,location + '[' + str(inx) + ']',line,"must be a string"))
+    return issues
+
+#end def validate_string_list
+
+# Check a regular expression compiles, returning the problems found and the
+# number of groups it has (None if it does not compile).
+def validate_regex(regex,location,line):
+    if not isinstance(regex,str):
+        return [('ERROR',location,line,"must be a string")], None
+    try:
+        return [], re.compile(regex).groups
+    except re.error as error:
+        return [('ERROR',location,line,"the regular expression does not compile: " + str(error))], None
+
+#end def validate_regex
+
+# Check the $n group references of a replacement are groups of its regular
+# expression.
+def validate_replacement(replacement,groups,location,line):
+    if not isinstance(replacement,str):
+        return [('ERROR',location,line,"must be a string")]
+    issues = []
+    if groups is not None:
+        for reference in GROUP_REFERENCE_PATTERN.findall(replacement):
+            if int(reference) > groups:
+                issues.append(('ERROR',location,line,"refers to group $" + reference + " but the regular expression has " + str(groups) + " groups"))
+    return issues
+
+#end def validate_replacement
+
+# Check a top level field of the Conlang JSON object.
+def validate_top_level_field(key,value,line,context):
+    if key == 'version':
+        if str(value) != '1.0':
+            return [('ERROR',key,line,"must be 1.0, not " + json.dumps(value))]
+    elif key in ['english_name','native_name_phonetic','native_name_english','preferred_language']:
+        if not isinstance(value,str):
+            return [('ERROR',key,line,"must be a string")]
+    elif key == 'phonetic_characters':
+        if not isinstance(value,str) or value.lower() not in PHONETIC_CHARACTERS:
+            return [('ERROR',key,line,"must be one of " + ', '.join(PHONETIC_CHARACTERS))]
+    elif key == 'preferred_voices':
+        if not isinstance(value,dict):
+            return [('ERROR',key,line,"must be an object")]
+    elif key in ['derived','declined']:
+        if not isinstance(value,bool):
+            return [('ERROR',key,line,"must be true or false")]
+        context[key] = value
+    elif key == 'part_of_speech_list':
+        issues = validate_string_list(value,key,line)
+        if len(issues) == 0:
+            context['part_of_speech_list'] = set(value)
+        return issues
+    elif key in ['noun_gender_list','phoneme_inventory','lexical_order_list']:
+        return validate_string_list(value,key,line)
+    elif key == 'phonetic_inventory':
+        if not isinstance(value,dict):
+            return [('ERROR',key,line,"must be an object")]
+        issues = []
+        for inventory_key, inventory in value.items():
+            if inventory_key not in PHONETIC_INVENTORY_KEYS:
+                issues.append(('WARNING',key + '.' + inventory_key,line,"is not one of the usual keys " + ', '.join(PHONETIC_INVENTORY_KEYS)))
+            issues += validate_string_list(inventory,key + '.' + inventory_key,line)
+        return issues
+    elif key == 'word_order':
+        if not isinstance(value,str) or sorted(value.upper()) != ['O','S','V']:
+            return [('ERROR',key,line,"must be an arrangement of S, V, and O")]
+    elif key == 'adjective_position':
+        if not isinstance(value,str) or value.lower() not in ADJECTIVE_POSITIONS:
+            return [('ERROR',key,line,"must be Before or After")]
+    elif key == 'pre_post_position':
+        if not isinstance(value,str) or value.lower() not in PRE_POST_POSITIONS:
+            return [('ERROR',key,line,"must be preposition or postposition")]
+    elif key == 'sound_map_list':
+        return validate_sound_map_list(value,key,line)
+    elif key == 'affix_map':
+        context['affix_map'] = value
+        return validate_affix_map(value,key,line,context)
+    elif key == 'derivational_affix_map':
+        return validate_derivational_affix_map(value,key,line)
+    elif key == 'derived_word_list':
+        return validate_derived_word_list(value,key,line)
+    elif key == 'metadata':
+        if not isinstance(value,dict):
+            return [('ERROR',key,line,"must be an object")]
+    elif key not in TOP_LEVEL_KEYS:
+        return [('WARNING',key,line,"is not a key of the Conlang JSON specification")]
+    return []
+
+#end def validate_top_level_field
+
+# Check the sound_map_list.
+def validate_sound_map_list(sound_map_list,location,line):
+    if not isinstance(sound_map_list,list):
+        return [('ERROR',location,line,"must be a list of objects")]
+    issues = []
+    for inx, sound_map in enumerate(sound_map_list):
+        sound_map_location = location + '[' + str(inx) + ']'
+        if not isinstance(sound_map,dict):
+            issues.append(('ERROR',sound_map_location,line,"must be an object"))
+            continue
+        for key in sound_map:
+            if key not in SOUND_MAP_PAIRS:
+                issues.append(('WARNING',sound_map_location + '.' + key,line,"is not a key of a sound map entry"))
+            elif SOUND_MAP_PAIRS[key] not in sound_map:
+                issues.append(('ERROR',sound_map_location,line,"has " + key + " without " + SOUND_MAP_PAIRS[key]))
+        for regex_key, replacement_key in [('spelling_regex','romanization'),('pronunciation_regex','phoneme')]:
+            groups = None
+            if regex_key in sound_map:
+                regex_issues, groups = validate_regex(sound_map[regex_key],sound_map_location + '.' + regex_key,line)
+                issues += regex_issues
+            if replacement_key in sound_map and groups is not None:
+                issues += validate_replacement(sound_map[replacement_key],groups,sound_map_location + '.' + replacement_key,line)
+    return issues
+
+#end def validate_sound_map_list
+
+# Check the affix_map.
+def validate_affix_map(affix_map,location,line,context):
+    if not isinstance(affix_map,dict):
+        return [('ERROR',location,line,"must be an object")]
+    issues = []
+    for part_of_speech, affix_list in affix_map.items():
+        pos_location = location + '.' + part_of_speech
+        if context['part_of_speech_list'] is not None and part_of_speech not in context['part_of_speech_list'] and not part_of_speech.startswith('n'):
+            issues.append(('WARNING',pos_location,line,"is not in the part_of_speech_list"))
+        if not isinstance(affix_list,list):
+            issues.append(('ERROR',pos_location,line,"must be a list of objects"))
+            continue
+        for layer_inx, affix_layer in enumerate(affix_list):
+            layer_location = pos_location + '[' + str(layer_inx) + ']'
+            if not isinstance(affix_layer,dict) or len(affix_layer) != 1:
+                issues.append(('ERROR',layer_location,line,"must be an object with a single key, one of " + ', '.join(AFFIX_TYPES)))
+                continue
+            affix = list(affix_layer.keys())[0]
+            if affix not in AFFIX_TYPES:
+                issues.append(('ERROR',layer_location + '.' + affix,line,"is not an affix type, which are " + ', '.join(AFFIX_TYPES)))
+                continue
+            if affix == 'particle':
+                issues.append(('WARNING',layer_location + '.' + affix,line,"particles are deprecated, and are skipped when declining"))
+            entries = affix_layer[affix]
+            if not isinstance(entries,list):
+                issues.append(('ERROR',layer_location + '.' + affix,line,"must be a list of objects"))
+                continue
+            for entry_inx, entry in enumerate(entries):
+                entry_location = layer_location + '.' + affix + '[' + str(entry_inx) + ']'
+                if not isinstance(entry,dict) or len(entry) != 1:
+                    issues.append(('ERROR',entry_location,line,"must be an object with a single key, the declension"))
+                    continue
+                declension = list(entry.keys())[0]
+                if not isinstance(entry[declension],dict):
+                    issues.append(('ERROR',entry_location + '.' + declension,line,"must be an object"))
+                elif affix == 'replacement':
+                    issues += validate_replacement_rules(entry[declension],entry_location + '.' + declension,line)
+                elif affix != 'particle':
+                    issues += validate_add_rules(entry[declension],entry_location + '.' + declension,line)
+    return issues
+
+#end def validate_affix_map
+
+# Check the rules of a prefix or suffix, or of a derivational affix.  The
+# pronunciation and spelling sides each use either an add or a regular
+# expression with a t_ and f_ add.
+def validate_add_rules(rules,location,line,extra_keys=[]):
+    issues = []
+    for key in rules:
+        if key not in ADD_KEYS and key not in REGEX_ADD_KEYS and key not in extra_keys:
+            issues.append(('WARNING',location + '.' + key,line,"is not a key of an affix rule"))
+        elif key not in extra_keys and not isinstance(rules[key],str):
+            issues.append(('ERROR',location + '.' + key,line,"must be a string"))
+    for side in ['pronunciation','spelling']:
+        add_key = side + '_add'
+        regex_key = side + '_regex'
+        if add_key in rules and regex_key in rules:
+            issues.append(('ERROR',location,line,"has both " + add_key + " and " + regex_key))
+        if regex_key in rules:
+            issues += validate_regex(rules[regex_key],location + '.' + regex_key,line)[0]
+            for key in ['t_' + add_key,'f_' + add_key]:
+                if key not in rules:
+                    issues.append(('ERROR',location,line,"has " + regex_key + " without " + key))
+        else:
+            for key in ['t_' + add_key,'f_' + add_key]:
+                if key in rules:
+                    issues.append(('ERROR',location,line,"has " + key + " without " + regex_key))
+    if ('pronunciation_add' in rules) != ('spelling_add' in rules):
+        issues.append(('WARNING',location,line,"has only one of pronunciation_add and spelling_add"))
+    return issues
+
+#end def validate_add_rules
+
+# Check the rules of a replacement.
+def validate_replacement_rules(rules,location,line):
+    issues = []
+    for key in rules:
+        if key not in REPLACEMENT_KEYS:
+            issues.append(('WARNING',location + '.' + key,line,"is not a key of a replacement rule"))
+    for side in ['pronunciation','spelling']:
+        regex_key = side + '_regex'
+        replacement_key = side + '_replacement'
+        if (regex_key in rules) != (replacement_key in rules):
+            issues.append(('ERROR',location,line,"must have both or neither of " + regex_key + " and " + replacement_key))
+        if regex_key in rules:
+            regex_issues, groups = validate_regex(rules[regex_key],location + '.' + regex_key,line)
+            issues += regex_issues
+            if replacement_key in rules:
+                issues += validate_replacement(rules[replacement_key],groups,location + '.' + replacement_key,line)
+    return issues
+
+#end def validate_replacement_rules
+
+# Check the derivational_affix_map.
+def validate_derivational_affix_map(derivational_affix_map,location,line):
+    if not isinstance(derivational_affix_map,dict):
+        return [('ERROR',location,line,"must be an object")]
+    issues = []
+    for name, affix_data in derivational_affix_map.items():
+        affix_location = location + '.' + name
+        if not isinstance(affix_data,dict):
+            issues.append(('ERROR',affix_location,line,"must be an object"))
+            continue
+        if affix_data.get('type') not in DERIVATIONAL_AFFIX_TYPES:
+            issues.append(('ERROR',affix_location + '.type',line,"is required, and must be PREFIX or SUFFIX"))
+        issues += validate_add_rules(affix_data,affix_location,line,['type'])
+    return issues
+
+#end def validate_derivational_affix_map
+
+# Check the derived_word_list, whose entries use the Vulgarlang form of
+# "english : part of speech = words".
+def validate_derived_word_list(derived_word_list,location,line):
+    issues = validate_string_list(derived_word_list,location,line)
+    if len(issues) > 0:
+        return issues
+    for inx, derived_word in enumerate(derived_word_list):
+        if derived_word.strip() != '' and not DERIVED_WORD_PATTERN.match(derived_word.strip()):
+            issues.append(('ERROR',location + '[' + str(inx) + ']',line,"must have the form english : part_of_speech = words"))
+    return issues
+
+#end def validate_derived_word_list
+
+# Check a lexicon entry.
+def validate_lexicon_entry(entry,location,line):
+    if not isinstance(entry,dict):
+        return [('ERROR',location,line,"must be an object")]
+    issues = []
+    for key in entry:
+        if key not in LEXICON_ENTRY_KEYS:
+            issues.append(('WARNING',location + '.' + key,line,"is not a key of a lexicon entry"))
+    if 'phonetic' not in entry and 'spelled' not in entry:
+        issues.append(('ERROR',location,line,"must have phonetic or spelled"))
+    for key in ['phonetic','spelled']:
+        if key in entry and not isinstance(entry[key],str):
+            issues.append(('ERROR',location + '.' + key,line,"must be a string"))
+    for key in ['english','part_of_speech']:
+        if key not in entry:
+            issues.append(('ERROR',location,line,"the required key " + key + " is missing"))
+        elif not isinstance(entry[key],str):
+            issues.append(('ERROR',location + '.' + key,line,"must be a string"))
+    if 'declensions' not in entry:
+        issues.append(('ERROR',location,line,"the required key declensions is missing"))
+    elif not isinstance(entry['declensions'],list) or len(entry['declensions']) == 0:
+        issues.append(('ERROR',location + '.declensions',line,"must be a list of at least one string"))
+    else:
+        issues += validate_string_list(entry['declensions'],location + '.declensions',line)
+        if 'root' in entry['declensions'] and len(entry['declensions']) > 1:
+            issues.append(('ERROR',location + '.declensions',line,"a root word must have only the declension root"))
+    for key in ['derived_word','declined_word']:
+        if key not in entry:
+            issues.append(('ERROR',location,line,"the required key " + key + " is missing"))
+        elif not isinstance(entry[key],bool):
+            issues.append(('ERROR',location + '.' + key,line,"must be true or false"))
+    if 'metadata' in entry and not isinstance(entry['metadata'],dict):
+        issues.append(('ERROR',location + '.metadata',line,"must be an object"))
+    return issues
+
+#end def validate_lexicon_entry
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
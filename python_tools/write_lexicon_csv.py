@@ -1,4 +1,4 @@
-#!/usr/bin/python3 
+#!/usr/bin/python3
 # Copyright (C) 2024 Ronald B. Oakes
 #
 # This program is free software: you can redistribute it and/or modify it under
@@ -16,66 +16,178 @@
 # This program is used to convert a Conlang JSON object into a CSV file that can
 # be imported into a spreadsheet or other program for various uses.
 #
+# The lexicon is streamed from the Conlang JSON file, derived and declined as it
+# is read if needed, sorted with an external sort, and written out in batches,
+# so lexicons that do not fit in memory can still be converted.
+#
 import sys
-import getopt
-import json
-import pdb
-import re
+import os
 import csv
-import codecs
+import itertools
 from argparse import ArgumentParser
-from lexicon_entry import LEXICON_ENTRY
-from conlang_lib import spell_word, decline_word, derive_words, dedup_lexicon
-
-# Define and parse the command line arguments
-cli = ArgumentParser(description="Build a CSV version of the lexicon")
-cli.add_argument("-i","--input", type=str, metavar="FILE_PATH", required=True, dest="input",
-    help="Conlang JSON file to be converted into a CSV file")
-cli.add_argument("-o","--output", type=str, metavar="FILE_PATH", required=True, dest="output",
-    help="CSV file where the conlang information will be placed")
-arguments = cli.parse_args()
-
-inputfile = arguments.input
-outputfile = arguments.output
-
-# Read the JSON language data
-with open(inputfile,"r", encoding="utf-8-sig") as ifp:
-    language_structure = json.load(ifp)
-
-lexicon = language_structure["lexicon"]
-
-# Derive words if needed.
-if not language_structure["derived"]:
-    add_lexicon = []
-    add_lexicon += derive_words(language_structure['derived_word_list'],
-                                language_structure['derivational_affix_map'],
-                                language_structure['lexicon'],
-                                language_structure['sound_map_list'],
-                                false)
-    clean_lexicon = dedup_lexicon(add_lexicon)
-    if len(clean_lexicon) < len(add_lexicon):
-        add_lexicon = clean_lexicon
-    for lex_entry in add_lexicon:
-        lexicon.append(lex_entry.as_map())
-
-# Decline words if needed.
-if not language_structure["declined"]:
-    add_lexicon = []
-    for word in lexicon:
-        add_lexicon += decline_word(word,language_structure['affix_map'],language_structure['sound_map_list'])
-    clean_lexicon = dedup_lexicon(add_lexicon)
-    if len(clean_lexicon) < len(add_lexicon):
-        add_lexicon = clean_lexicon
-    for lex_entry in add_lexicon:
-        lexicon.append(lex_entry.as_map())
-
-# Sort the language on its English words.
-lexicon = sorted(language_structure["lexicon"], key=lambda x: x['english'].lower())
-
-# Write it out in CSV format.
-with open(outputfile, "w", newline='', encoding="utf-8-sig") as ofp:
-    lexcsvwriter = csv.writer(ofp, dialect='excel')
-    
-    lexcsvwriter.writerow(['English Word',language_structure['native_name_english']+' Word','Part of Speech','Declensions','Pronunciation'])
+from conlang_lib import decline_word, derive_words, dedup_lexicon, read_conlang_json_header, iter_conlang_lexicon
+from external_sort import external_sort, parse_memory_size, DEFAULT_RUN_SIZE
+from declension_cache import add_cache_arguments, get_declension_cache
+
+# The columns that can be written, and their titles.  The title of the spelled
+# column comes from the name of the language.
+CSV_COLUMN_TITLES = {
+    'english':'English Word',
+    'spelled':' Word',
+    'part_of_speech':'Part of Speech',
+    'declensions':'Declensions',
+    'phonetic':'Pronunciation',
+    'derived_word':'Derived Word',
+    'declined_word':'Declined Word',
+}
+DEFAULT_CSV_COLUMNS = 'english,spelled,part_of_speech,declensions,phonetic'
+
+# Number of rows passed to each call to writerows.
+WRITE_BATCH_SIZE = 10000
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Build a CSV version of the lexicon")
+    cli.add_argument("-i","--input", type=str, metavar="FILE_PATH", required=True, dest="input",
+        help="Conlang JSON file to be converted into a CSV file")
+    cli.add_argument("-o","--output", type=str, metavar="FILE_PATH", required=True, dest="output",
+        help="CSV file where the conlang information will be placed")
+    cli.add_argument("--columns", type=str, required=False, default=DEFAULT_CSV_COLUMNS, dest="columns",
+        help="Comma separated list of the columns to write, from " + ', '.join(CSV_COLUMN_TITLES.keys()) +
+             ".  Default is " + DEFAULT_CSV_COLUMNS)
+    cli.add_argument("--split-by", type=str, required=False, choices=['part_of_speech','initial'], dest="split_by",
+        help="Write a separate CSV file for each part of speech or for each initial letter of the English word.  " +
+             "The files are named after the output file with the part of speech or letter added")
+    cli.add_argument("--run-size", type=int, required=False, default=DEFAULT_RUN_SIZE, dest="run_size",
+        help="Number of lexicon entries sorted in memory at a time before being spilled to disk.  Default is " + str(DEFAULT_RUN_SIZE))
+    cli.add_argument("--memory-limit", type=str, required=False, metavar="SIZE", dest="memory_limit",
+        help="Approximate amount of memory (such as 512M or 2G) to use for sorting instead of --run-size.  " +
+             "Duplicate entries are also removed across the whole lexicon while the sorted runs are merged")
+    cli.add_argument("--temp-dir", type=str, required=False, metavar="DIRECTORY", dest="temp_dir",
+        help="Directory for the temporary files used when sorting")
+    add_cache_arguments(cli)
+    arguments = cli.parse_args(argv)
+
+    columns = [column.strip() for column in arguments.columns.split(',')]
+    for column in columns:
+        if column not in CSV_COLUMN_TITLES:
+            print("ERROR: unknown column " + column)
+            exit()
+
+    # Read everything but the lexicon, which is streamed below.
+    language_structure = read_conlang_json_header(arguments.input)
+
+    lexicon = iter_conlang_lexicon(arguments.input)
+
+    # Derive words if needed.
+    if not language_structure.get("derived",False):
+        lexicon = itertools.chain(lexicon,derive_lexicon(language_structure,arguments.input))
+
+    # Decline words if needed.
+    cache = None
+    if not language_structure.get("declined",False):
+        cache = get_declension_cache(arguments)
+        lexicon = decline_lexicon(lexicon,language_structure['affix_map'],language_structure['sound_map_list'],cache)
+
+    # Sort the language on its English words.
+    if arguments.memory_limit:
+        lexicon = external_sort(lexicon,key=get_unique_sort_key,temp_dir=arguments.temp_dir,
+                                memory_limit=parse_memory_size(arguments.memory_limit),unique=True)
+    else:
+        lexicon = external_sort(lexicon,key=lambda x: x['english'].lower(),run_size=arguments.run_size,temp_dir=arguments.temp_dir)
+
+    # Write it out in CSV format.
+    titles = []
+    for column in columns:
+        if column == 'spelled':
+            titles.append(language_structure['native_name_english'] + CSV_COLUMN_TITLES[column])
+        else:
+            titles.append(CSV_COLUMN_TITLES[column])
+    write_lexicon_csv(lexicon,arguments.output,columns,titles,arguments.split_by)
+    if cache is not None:
+        cache.close()
+
+#end def main
+
+# Derive the words in the derived_word_list, returning their lexicon entry maps.
+# Only the root words are needed, so they are read from the file separately.
+def derive_lexicon(language_structure,input_file):
+    roots = (entry for entry in iter_conlang_lexicon(input_file) if 'root' in entry['declensions'])
+    add_lexicon = derive_words(language_structure['derived_word_list'],
+                               language_structure['derivational_affix_map'],
+                               roots,
+                               language_structure['affix_map'],
+                               language_structure['sound_map_list'],
+                               False)
+    for lex_entry in dedup_lexicon(add_lexicon):
+        yield lex_entry.as_map()
+
+#end def derive_lexicon
+
+# Yield each entry of the lexicon followed by its declined forms.
+def decline_lexicon(lexicon,affix_map,sound_map_list,cache=None):
     for entry in lexicon:
-        lexcsvwriter.writerow([entry['english'],entry['spelled'],entry['part_of_speech'],entry['declensions'],entry['phonetic']])
+        yield entry
+        for lex_entry in dedup_lexicon(decline_word(entry,affix_map,sound_map_list,cache=cache)):
+            yield lex_entry.as_map()
+
+#end def decline_lexicon
+
+# The sort key used when removing duplicates.  It sorts on the English word like
+# the normal key, followed by the rest of the fields that make entries differ.
+def get_unique_sort_key(entry):
+    return (entry['english'].lower(), entry['english'], entry['spelled'], entry['phonetic'],
+            entry['part_of_speech'], ''.join(entry['declensions']))
+
+#end def get_unique_sort_key
+
+# Get the name of the file a row is written to when the output is split.
+def get_split_file(output_file,split_key):
+    split_key = split_key.replace(os.sep,'_').replace(' ','_')
+    if split_key == '':
+        split_key = 'none'
+    root, extension = os.path.splitext(output_file)
+    return root + '_' + split_key + extension
+
+#end def get_split_file
+
+# Write the lexicon to one CSV file, or to one for each part of speech or initial
+# letter, in batches of rows.
+def write_lexicon_csv(lexicon,output_file,columns,titles,split_by=None):
+    writers = {}
+    try:
+        for entry in lexicon:
+            if split_by == 'part_of_speech':
+                split_key = entry['part_of_speech'].strip()
+            elif split_by == 'initial':
+                split_key = entry['english'].strip()[0:1].lower()
+                if not split_key.isalnum():
+                    split_key = 'other'
+            else:
+                split_key = None
+
+            if split_key not in writers:
+                if split_key is None:
+                    ofp = open(output_file, "w", newline='', encoding="utf-8-sig")
+                else:
+                    ofp = open(get_split_file(output_file,split_key), "w", newline='', encoding="utf-8-sig")
+                lexcsvwriter = csv.writer(ofp, dialect='excel')
+                lexcsvwriter.writerow(titles)
+                writers[split_key] = {'file':ofp, 'writer':lexcsvwriter, 'rows':[]}
+
+            writer = writers[split_key]
+            writer['rows'].append([entry[column] for column in columns])
+            if len(writer['rows']) >= WRITE_BATCH_SIZE:
+                writer['writer'].writerows(writer['rows'])
+                writer['rows'] = []
+
+        for split_key in writers:
+            writers[split_key]['writer'].writerows(writers[split_key]['rows'])
+    finally:
+        for split_key in writers:
+            writers[split_key]['file'].close()
+
+#end def write_lexicon_csv
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+# Copyright (C) 2024 Ronald B. Oakes
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of  MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is used to convert a Conlang JSON object into an indexed SQLite
+# database.  The lexicon, affix map, sound map, and declension features are
+# stored in normalized tables so that the query functions in conlang_lib can
+# look words up without reading the JSON file.
+#
+import sys
+import os
+import json
+import sqlite3
+from argparse import ArgumentParser
+from conlang_lib import decline_word, derive_words, dedup_lexicon, open_conlang_file
+from declension_cache import add_cache_arguments, get_declension_cache
+
+# Rows are inserted this many at a time.
+INSERT_BATCH_SIZE = 10000
+
+LEXICON_DATABASE_SCHEMA = '''
+CREATE TABLE language (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE sound_map (
+    position INTEGER PRIMARY KEY,
+    phoneme TEXT,
+    romanization TEXT,
+    spelling_regex TEXT,
+    pronunciation_regex TEXT
+);
+CREATE TABLE affix_map (
+    part_of_speech TEXT,
+    layer INTEGER,
+    affix_type TEXT,
+    position INTEGER,
+    declension TEXT,
+    rules TEXT
+);
+CREATE TABLE lexicon (
+    id INTEGER PRIMARY KEY,
+    phonetic TEXT,
+    spelled TEXT,
+    english TEXT,
+    part_of_speech TEXT,
+    derived_word INTEGER,
+    declined_word INTEGER,
+    metadata TEXT
+);
+CREATE TABLE features (
+    id INTEGER PRIMARY KEY,
+    feature TEXT UNIQUE
+);
+CREATE TABLE lexicon_features (
+    entry_id INTEGER,
+    feature_id INTEGER,
+    position INTEGER
+);
+'''
+
+# The indexes are built after the data is loaded, which is much faster than
+# maintaining them during the inserts.
+LEXICON_DATABASE_INDEXES = '''
+CREATE INDEX lexicon_english ON lexicon (english COLLATE NOCASE);
+CREATE INDEX lexicon_spelled ON lexicon (spelled);
+CREATE INDEX lexicon_phonetic ON lexicon (phonetic);
+CREATE INDEX lexicon_part_of_speech ON lexicon (part_of_speech);
+CREATE INDEX lexicon_features_feature ON lexicon_features (feature_id, entry_id);
+CREATE INDEX lexicon_features_entry ON lexicon_features (entry_id);
+CREATE INDEX affix_map_part_of_speech ON affix_map (part_of_speech, layer, position);
+'''
+
+def main(argv):
+    # Define and parse the command line arguments
+    cli = ArgumentParser(description="Build an SQLite database of the lexicon")
+    cli.add_argument("-i","--input", type=str, metavar="FILE_PATH", required=True, dest="input",
+        help="Conlang JSON file to be converted into an SQLite database")
+    cli.add_argument("-o","--output", type=str, metavar="FILE_PATH", required=True, dest="output",
+        help="SQLite database file where the conlang information will be placed")
+    add_cache_arguments(cli)
+    arguments = cli.parse_args(argv)
+
+    # Read the JSON language data
+    with open_conlang_file(arguments.input) as ifp:
+        language_structure = json.load(ifp)
+
+    lexicon = language_structure["lexicon"]
+
+    # Derive words if needed.
+    if not language_structure.get("derived",False):
+        add_lexicon = derive_words(language_structure['derived_word_list'],
+                                   language_structure['derivational_affix_map'],
+                                   lexicon,
+                                   language_structure['affix_map'],
+                                   language_structure['sound_map_list'],
+                                   False)
+        for lex_entry in dedup_lexicon(add_lexicon):
+            lexicon.append(lex_entry.as_map())
+        language_structure['derived'] = True
+
+    # Decline words if needed.
+    if not language_structure.get("declined",False):
+        cache = get_declension_cache(arguments)
+        add_lexicon = []
+        for word in lexicon:
+            add_lexicon += decline_word(word,language_structure['affix_map'],language_structure['sound_map_list'],cache=cache)
+        for lex_entry in dedup_lexicon(add_lexicon):
+            lexicon.append(lex_entry.as_map())
+        language_structure['declined'] = True
+        if cache is not None:
+            cache.close()
+
+    write_lexicon_database(language_structure,lexicon,arguments.output)
+
+#end def main
+
+# Write the language structure and an iterable of lexicon entry maps into a new
+# SQLite database file.
+def write_lexicon_database(language_structure,lexicon,database_file):
+    if os.path.exists(database_file):
+        os.remove(database_file)
+
+    connection = sqlite3.connect(database_file)
+    # The database is being built from scratch, so there is nothing to protect
+    # with a journal if the build fails part way through.
+    connection.execute('PRAGMA journal_mode = OFF')
+    connection.execute('PRAGMA synchronous = OFF')
+    connection.executescript(LEXICON_DATABASE_SCHEMA)
+
+    with connection:
+        language_rows = []
+        for key in language_structure:
+            if key not in ['lexicon','sound_map_list','affix_map']:
+                language_rows.append((key,json.dumps(language_structure[key],ensure_ascii=False)))
+        connection.executemany('INSERT INTO language (key, value) VALUES (?, ?)',language_rows)
+
+        sound_map_rows = []
+        for position, sound_map in enumerate(language_structure.get('sound_map_list',[])):
+            sound_map_rows.append((position,sound_map.get('phoneme'),sound_map.get('romanization'),
+                                   sound_map.get('spelling_regex'),sound_map.get('pronunciation_regex')))
+        connection.executemany('INSERT INTO sound_map VALUES (?, ?, ?, ?, ?)',sound_map_rows)
+
+        affix_rows = []
+        for part_of_speech in language_structure.get('affix_map',{}):
+            for layer, affix_layer in enumerate(language_structure['affix_map'][part_of_speech]):
+                affix = list(affix_layer.keys())[0]
+                for position, entry in enumerate(affix_layer[affix]):
+                    declension = list(entry.keys())[0]
+                    affix_rows.append((part_of_speech,layer,affix,position,declension,json.dumps(entry[declension],ensure_ascii=False)))
+        connection.executemany('INSERT INTO affix_map VALUES (?, ?, ?, ?, ?, ?)',affix_rows)
+
+    feature_ids = {}
+    entry_id = 0
+    lexicon_rows = []
+    feature_rows = []
+    for entry in lexicon:
+        entry_id += 1
+        lexicon_rows.append((entry_id,entry['phonetic'],entry['spelled'],entry['english'],entry['part_of_speech'],
+                             int(bool(entry.get('derived_word',False))),int(bool(entry.get('declined_word',False))),
+                             json.dumps(entry.get('metadata',{}),ensure_ascii=False)))
+        for position, declension in enumerate(entry['declensions']):
+            if declension not in feature_ids:
+                feature_ids[declension] = len(feature_ids) + 1
+            feature_rows.append((entry_id,feature_ids[declension],position))
+        if len(lexicon_rows) >= INSERT_BATCH_SIZE:
+            write_lexicon_rows(connection,lexicon_rows,feature_rows)
+            lexicon_rows = []
+            feature_rows = []
+    write_lexicon_rows(connection,lexicon_rows,feature_rows)
+
+    with connection:
+        connection.executemany('INSERT INTO features (id, feature) VALUES (?, ?)',
+                               [(feature_ids[feature],feature) for feature in feature_ids])
+        connection.executescript(LEXICON_DATABASE_INDEXES)
+    connection.execute('ANALYZE')
+    connection.close()
+
+#end def write_lexicon_database
+
+# Insert one batch of lexicon entries and their declension features in a single
+# transaction.
+def write_lexicon_rows(connection,lexicon_rows,feature_rows):
+    with connection:
+        connection.executemany('INSERT INTO lexicon VALUES (?, ?, ?, ?, ?, ?, ?, ?)',lexicon_rows)
+        connection.executemany('INSERT INTO lexicon_features VALUES (?, ?, ?)',feature_rows)
+
+#end def write_lexicon_rows
+
+if __name__ == "__main__":
+   main(sys.argv[1:])